@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2023, Univention GmbH
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+from ansible_collections.univention.ucs_modules.plugins.plugin_utils.batch import BatchActionModule
+
+APP_ITEM_OPTIONS = ('name', 'app', 'state', 'stall', 'version', 'config')
+
+
+class ActionModule(BatchActionModule):
+    '''Runs univention_app for all items of 'batch' or of a coalesced loop at once
+
+    The items are passed on as 'apps', the other options are taken from the
+    task or, for a coalesced loop, from the items.
+    '''
+
+    _item_options = APP_ITEM_OPTIONS
+
+    def _batch_module_args(self, module_args, batch):
+        module_args = dict(module_args)
+        defaults = dict((option, module_args.pop(option)) for option in APP_ITEM_OPTIONS if option in module_args)
+        apps = []
+        for item in batch:
+            app = dict(defaults)
+            for option, value in item.items():
+                if option in APP_ITEM_OPTIONS:
+                    app[option] = value
+                else:
+                    module_args.setdefault(option, value)
+            if 'app' in app:
+                app['name'] = app.pop('app')
+            apps.append(app)
+        return dict(module_args, apps=apps)
+
+    def _split_results(self, module_result, batch):
+        results = dict((result['name'], result) for result in module_result.get('apps', []))
+        # items without a result of their own, e.g. after an early exit on a non-UCS system, get the whole result
+        return [results.get(item.get('name', item.get('app')), dict(module_result)) for item in batch]
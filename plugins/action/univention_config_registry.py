@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2023, Univention GmbH
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+from ansible_collections.univention.ucs_modules.plugins.plugin_utils.batch import BatchActionModule
+
+UCR_ITEM_OPTIONS = ('keys', 'name', 'key', 'kvlist', 'state', 'layer', 'force')
+
+
+class ActionModule(BatchActionModule):
+    '''Runs univention_config_registry for all items of 'batch' or of a coalesced loop at once'''
+
+    _item_options = UCR_ITEM_OPTIONS
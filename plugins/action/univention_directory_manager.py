@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2023, Univention GmbH
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+from ansible_collections.univention.ucs_modules.plugins.plugin_utils.batch import BatchActionModule
+
+UDM_ITEM_OPTIONS = ('module', 'position', 'set_properties', 'unset_properties', 'dn', 'filter', 'state', 'options',
+                    'policies', 'superordinate', 'recursive', 'remove_workers')
+
+
+class ActionModule(BatchActionModule):
+    '''Runs univention_directory_manager for all items of 'batch' or of a coalesced loop at once'''
+
+    _item_options = UDM_ITEM_OPTIONS
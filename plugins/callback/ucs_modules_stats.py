@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2023, Univention GmbH
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import json
+import os
+import time
+
+from ansible.module_utils.common.text.converters import to_text
+from ansible.plugins.callback import CallbackBase
+
+DOCUMENTATION = r'''
+---
+name: ucs_modules_stats
+type: aggregate
+short_description: Aggregate the timing and change metrics of the UCS modules
+description:
+    - Collects the run time and the metrics returned by the modules of this
+      collection, i.e. 'delta', the changed UCR keys, the commited templates
+      and handler runs, the changed UDM objects, the App operations and the
+      phases of 'profile'.
+    - Aggregates them per module, per task and per host and task. At the end
+      of every play a summary table is displayed, at the end of the playbook
+      all plays are written to a JSON report.
+    - Tasks of other modules are ignored.
+requirements:
+    - enable in configuration, e.g. 'callbacks_enabled = univention.ucs_modules.ucs_modules_stats'
+options:
+    output_file:
+        description: The JSON report is written to this file. No report is written if empty.
+        type: path
+        default: ucs_modules_stats.json
+        env:
+            - name: UCS_MODULES_STATS_FILE
+        ini:
+            - section: callback_ucs_modules_stats
+              key: output_file
+    top:
+        description: The number of the slowest host and task combinations shown in the summary.
+        type: int
+        default: 20
+        env:
+            - name: UCS_MODULES_STATS_TOP
+        ini:
+            - section: callback_ucs_modules_stats
+              key: top
+'''
+
+MODULES = ('univention_config_registry', 'univention_directory_manager', 'univention_app', 'univention_app_info')
+# the counters of every row, in the order of the table columns
+COUNTERS = ('calls', 'changed', 'failed', 'seconds', 'delta', 'keys', 'objects', 'commits', 'handlers',
+            'app_operations')
+COLUMNS = ('calls', 'changed', 'failed', 'seconds', 'delta', 'keys', 'objects', 'commits', 'handlers', 'app ops')
+
+
+def parse_delta(delta):
+    '''Return the seconds of a timedelta printed with str(), e.g. "0:01:02.500000"'''
+    if not delta:
+        return 0.0
+    try:
+        days = 0
+        if ' day' in delta:
+            days, delta = delta.split(' day', 1)
+            days, delta = int(days), delta.split(', ', 1)[1]
+        hours, minutes, seconds = delta.split(':')
+        return days * 86400 + int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    except (AttributeError, IndexError, ValueError):
+        return 0.0
+
+
+def result_metrics(result):
+    '''Return the counters and profile phases of a single module result'''
+    meta = result.get('meta') if isinstance(result.get('meta'), dict) else {}
+    metrics = dict(
+        changed=int(bool(result.get('changed'))),
+        failed=int(bool(result.get('failed'))),
+        delta=parse_delta(result.get('delta')),
+        keys=len(meta.get('changed_keys') or []),
+        objects=len(meta.get('changed_objects') or []),
+        commits=len(meta.get('commited_templates') or []),
+        handlers=len(result.get('handler_timings') or []),
+        app_operations=len(result.get('operations') or []),
+    )
+    for app in result.get('apps') or []:
+        metrics['app_operations'] += len(app.get('operations') or [])
+        for timing in app.get('phase_timings') or []:
+            metrics['delta'] += parse_delta(timing.get('delta'))
+    for timing in result.get('phase_timings') or []:
+        metrics['delta'] += parse_delta(timing.get('delta'))
+    profile = result.get('profile') if isinstance(result.get('profile'), dict) else {}
+    return metrics, dict(profile.get('phases') or {})
+
+
+class Aggregate(object):
+    '''The counters and profile phases of a group of module results'''
+
+    def __init__(self):
+        self.counters = dict((name, 0) for name in COUNTERS)
+        self.phases = {}
+
+    def add(self, seconds, metrics, phases):
+        self.counters['calls'] += 1
+        self.counters['seconds'] += seconds
+        for name, value in metrics.items():
+            self.counters[name] += value
+        for name, value in phases.items():
+            self.phases[name] = self.phases.get(name, 0.0) + value
+
+    def report(self):
+        report = dict((name, round(value, 6)) for name, value in self.counters.items())
+        report['phases'] = dict((name, round(value, 6)) for name, value in sorted(self.phases.items()))
+        return report
+
+
+class CallbackModule(CallbackBase):
+
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = 'aggregate'
+    CALLBACK_NAME = 'univention.ucs_modules.ucs_modules_stats'
+    CALLBACK_NEEDS_ENABLED = True
+
+    def __init__(self, *args, **kwargs):
+        super(CallbackModule, self).__init__(*args, **kwargs)
+        self.plays = []
+        self.play = None
+        self.started = {}
+
+    def _start_play(self, name):
+        self._end_play()
+        self.play = dict(name=name, modules={}, tasks={}, host_tasks={})
+
+    def _end_play(self):
+        if self.play and self.play['modules']:
+            self._display_play(self.play)
+            self.plays.append(self.play)
+        self.play = None
+
+    def v2_playbook_on_play_start(self, play):
+        self._start_play(to_text(play.get_name()))
+
+    def v2_runner_on_start(self, host, task):
+        self.started[(host.get_name(), task._uuid)] = time.time()
+
+    def _record(self, result):
+        module = to_text(result._task.action).split('.')[-1]
+        if module not in MODULES:
+            return
+        if result._task.loop is not None and 'results' in result._result \
+                and not result._result.get('_ansible_item_result'):
+            # the summary of a loop, its items were recorded one by one
+            return
+        host = result._host.get_name()
+        task = to_text(result._task.get_name())
+        now = time.time()
+        seconds = now - self.started.get((host, result._task._uuid), now)
+        self.started[(host, result._task._uuid)] = now
+        if self.play is None:
+            self._start_play('')
+
+        metrics, phases = result_metrics(result._result)
+        for key, groups in (((module,), 'modules'), ((module, task), 'tasks'), ((module, host, task), 'host_tasks')):
+            self.play[groups].setdefault(key, Aggregate()).add(seconds, metrics, phases)
+
+    def v2_runner_on_ok(self, result):
+        self._record(result)
+
+    def v2_runner_on_failed(self, result, ignore_errors=False):
+        self._record(result)
+
+    def v2_runner_item_on_ok(self, result):
+        self._record(result)
+
+    def v2_runner_item_on_failed(self, result):
+        self._record(result)
+
+    def _table(self, title, header, groups, limit=None):
+        rows = sorted(groups.items(), key=lambda item: item[1].counters['seconds'], reverse=True)[:limit]
+        lines = [header + list(COLUMNS)]
+        for key, aggregate in rows:
+            counters = aggregate.counters
+            lines.append(list(key) + [
+                '{0:.2f}'.format(counters[name]) if name in ('seconds', 'delta') else str(counters[name])
+                for name in COUNTERS])
+        widths = [max(len(line[column]) for line in lines) for column in range(len(lines[0]))]
+        self._display.display(title)
+        for line in lines:
+            self._display.display('  '.join(
+                cell.ljust(width) if column < len(header) else cell.rjust(width)
+                for column, (cell, width) in enumerate(zip(line, widths))))
+
+    def _display_play(self, play):
+        self._display.banner('UCS MODULES STATS {0}'.format(play['name']).rstrip())
+        self._table('By module:', ['module'], play['modules'])
+        self._table('\nBy task:', ['module', 'task'], play['tasks'])
+        self._table('\nSlowest hosts and tasks:', ['module', 'host', 'task'], play['host_tasks'],
+                    self.get_option('top'))
+
+    def v2_playbook_on_stats(self, stats):
+        self._end_play()
+        output_file = self.get_option('output_file')
+        if not output_file:
+            return
+        report = [dict(
+            play=play['name'],
+            modules=[dict(module=key[0], **aggregate.report()) for key, aggregate in play['modules'].items()],
+            tasks=[dict(module=key[0], task=key[1], **aggregate.report()) for key, aggregate in play['tasks'].items()],
+            hosts=[dict(module=key[0], host=key[1], task=key[2], **aggregate.report())
+                   for key, aggregate in play['host_tasks'].items()],
+        ) for play in self.plays]
+        try:
+            with open(os.path.expanduser(output_file), 'w') as report_file:
+                json.dump(dict(plays=report), report_file, indent=2, sort_keys=True)
+        except (IOError, OSError) as e:
+            self._display.warning('Writing the UCS modules stats to {0} failed: {1}'.format(output_file, e))
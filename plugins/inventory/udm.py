@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2023, Univention GmbH
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+from ansible.errors import AnsibleParserError
+from ansible.inventory.group import to_safe_group_name
+from ansible.module_utils.common.text.converters import to_native
+from ansible.plugins.inventory import BaseInventoryPlugin, Cacheable, Constructable
+from ansible_collections.univention.ucs_modules.plugins.plugin_utils.ucs_api import UCSAPIError, UDMRestClient
+
+DOCUMENTATION = r'''
+---
+name: udm
+short_description: Inventory of the computer objects of a Univention Corporate Server domain
+description:
+    - Reads all computer objects through the UDM REST API of a UCS server with
+      a single paged search of 'computers/computer'.
+    - Every computer becomes a host named by its fully qualified domain name
+      and is added to a group for its role, for its organizational unit and
+      for each of its UDM groups.
+    - The properties given with 'properties' are exposed as host variables
+      with the prefix 'ucs_'.
+    - Uses a YAML configuration file that ends with 'udm.yml' or 'udm.yaml'.
+extends_documentation_fragment:
+    - constructed
+    - inventory_cache
+options:
+    plugin:
+        description: The name of this plugin, it should always be set to 'univention.ucs_modules.udm'.
+        required: true
+        choices: ['univention.ucs_modules.udm']
+    url:
+        description: The base URL of the UDM REST API.
+        type: str
+        required: true
+        env:
+            - name: UDM_REST_URL
+    username:
+        description: The user authenticating to the UDM REST API.
+        type: str
+        required: true
+        env:
+            - name: UDM_REST_USERNAME
+    password:
+        description: The password of 'username'.
+        type: str
+        required: true
+        env:
+            - name: UDM_REST_PASSWORD
+    validate_certs:
+        description: Whether the certificate of the server is verified.
+        type: bool
+        default: true
+    timeout:
+        description: The timeout of every request in seconds.
+        type: int
+        default: 30
+    page_size:
+        description: The number of objects requested per page.
+        type: int
+        default: 500
+    object_types:
+        description: The computer types added to the inventory.
+        type: list
+        elements: str
+        default:
+            - computers/domaincontroller_master
+            - computers/domaincontroller_backup
+            - computers/domaincontroller_slave
+            - computers/memberserver
+            - computers/windows
+    properties:
+        description: The UDM properties exposed as host variables, prefixed with 'ucs_'.
+        type: list
+        elements: str
+        default: [ip, mac, description, operatingSystem, operatingSystemVersion, service]
+    groups_by:
+        description:
+            - The groups every host is added to. 'role' adds a group named like
+              the computer type, e.g. 'memberserver', 'ou' a group 'ou_<name>'
+              for the nearest organizational unit and 'group' a group
+              'group_<name>' for every UDM group of the computer.
+        type: list
+        elements: str
+        choices: [role, ou, group]
+        default: [role, ou, group]
+'''
+
+EXAMPLES = r'''
+# udm.yml
+plugin: univention.ucs_modules.udm
+url: https://primary.example.org/univention/udm/
+username: Administrator
+password: secret
+cache: true
+cache_plugin: ansible.builtin.jsonfile
+cache_connection: /tmp/udm-inventory
+cache_timeout: 3600
+compose:
+    ansible_host: ucs_ip[0]
+'''
+
+# properties always needed to name and group the hosts
+BASE_PROPERTIES = ('name', 'domain', 'groups')
+
+
+class InventoryModule(BaseInventoryPlugin, Constructable, Cacheable):
+
+    NAME = 'univention.ucs_modules.udm'
+
+    def verify_file(self, path):
+        return super(InventoryModule, self).verify_file(path) and path.endswith(('udm.yml', 'udm.yaml'))
+
+    def _search_computers(self):
+        '''Return all computer objects, following the pages of a single search'''
+        client = UDMRestClient(
+            self.get_option('url'), self.get_option('username'), self.get_option('password'),
+            validate_certs=self.get_option('validate_certs'), timeout=self.get_option('timeout'))
+        properties = list(BASE_PROPERTIES) + [
+            prop for prop in self.get_option('properties') if prop not in BASE_PROPERTIES]
+        try:
+            return [
+                dict(dn=obj['dn'], object_type=obj.get('objectType'), position=obj.get('position'),
+                     properties=obj.get('properties', {}))
+                for obj in client.search('computers/computer', properties=properties,
+                                         page_size=self.get_option('page_size'))]
+        except UCSAPIError as e:
+            raise AnsibleParserError('Searching the computers failed: {0}'.format(to_native(e)))
+
+    @staticmethod
+    def _nearest_ou(dn):
+        for rdn in dn.split(',')[1:]:
+            attribute, _, value = rdn.partition('=')
+            if attribute.strip().lower() == 'ou':
+                return value
+        return None
+
+    @staticmethod
+    def _rdn_value(dn):
+        return dn.split(',', 1)[0].partition('=')[2]
+
+    def _populate(self, computers):
+        object_types = self.get_option('object_types')
+        groups_by = self.get_option('groups_by')
+        strict = self.get_option('strict')
+        for computer in computers:
+            if computer['object_type'] not in object_types:
+                continue
+            properties = computer['properties']
+            if not properties.get('name'):
+                continue
+            hostname = properties['name']
+            if properties.get('domain'):
+                hostname = '{0}.{1}'.format(hostname, properties['domain'])
+            self.inventory.add_host(hostname)
+
+            groups = []
+            if 'role' in groups_by:
+                groups.append(computer['object_type'].split('/', 1)[-1])
+            ou = self._nearest_ou(computer['dn'])
+            if 'ou' in groups_by and ou:
+                groups.append('ou_{0}'.format(ou))
+            if 'group' in groups_by:
+                groups.extend('group_{0}'.format(self._rdn_value(group)) for group in properties.get('groups') or [])
+            for group in groups:
+                group = self.inventory.add_group(to_safe_group_name(group, force=True, silent=True))
+                self.inventory.add_child(group, hostname)
+
+            hostvars = dict(ucs_dn=computer['dn'], ucs_role=computer['object_type'], ucs_ou=ou)
+            for prop in self.get_option('properties'):
+                hostvars['ucs_{0}'.format(prop)] = properties.get(prop)
+            for name, value in hostvars.items():
+                self.inventory.set_variable(hostname, name, value)
+
+            self._set_composite_vars(self.get_option('compose'), hostvars, hostname, strict=strict)
+            self._add_host_to_composed_groups(self.get_option('groups'), hostvars, hostname, strict=strict)
+            self._add_host_to_keyed_groups(self.get_option('keyed_groups'), hostvars, hostname, strict=strict)
+
+    def parse(self, inventory, loader, path, cache=True):
+        super(InventoryModule, self).parse(inventory, loader, path, cache)
+        self._read_config_data(path)
+
+        cache_key = self.get_cache_key(path)
+        user_cache_setting = self.get_option('cache')
+        attempt_to_read_cache = user_cache_setting and cache
+        cache_needs_update = user_cache_setting and not cache
+
+        computers = None
+        if attempt_to_read_cache:
+            try:
+                computers = self._cache[cache_key]
+            except KeyError:
+                cache_needs_update = True
+        if computers is None:
+            computers = self._search_computers()
+        if cache_needs_update:
+            self._cache[cache_key] = computers
+
+        self._populate(computers)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2023, Univention GmbH
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+from ansible.errors import AnsibleLookupError
+from ansible.module_utils.common.text.converters import to_native
+from ansible.plugins.lookup import LookupBase
+from ansible_collections.univention.ucs_modules.plugins.plugin_utils.play_cache import PlayCache
+from ansible_collections.univention.ucs_modules.plugins.plugin_utils.ucs_api import UCSAPIError, UMCClient, get_client
+
+DOCUMENTATION = r'''
+---
+name: ucr
+short_description: Read Univention Config Registry variables of a UCS host
+description:
+    - Returns the values of the given UCR variables of a UCS host, read on the
+      controller through the Univention Management Console.
+    - All variables not read before are fetched with a single 'ucr/get'
+      command. The values are memoized per host for the rest of the run, so
+      further lookups of the same variables cost no request.
+    - The session of the Univention Management Console is kept for the rest
+      of the run as well, only the first lookup per host and user logs in.
+    - Variables that are not set are returned as 'default'.
+options:
+    _terms:
+        description: The names of the UCR variables.
+        required: true
+    url:
+        description: The base URL of the Univention Management Console of the host.
+        type: str
+        required: true
+        env:
+            - name: UMC_URL
+        vars:
+            - name: ucs_umc_url
+    username:
+        description: The user authenticating to the Univention Management Console.
+        type: str
+        required: true
+        env:
+            - name: UMC_USERNAME
+        vars:
+            - name: ucs_umc_username
+    password:
+        description: The password of 'username'.
+        type: str
+        required: true
+        env:
+            - name: UMC_PASSWORD
+        vars:
+            - name: ucs_umc_password
+    validate_certs:
+        description: Whether the certificate of the server is verified.
+        type: bool
+        default: true
+    timeout:
+        description: The timeout of every request in seconds.
+        type: int
+        default: 30
+    default:
+        description: The value returned for variables that are not set.
+        type: raw
+        default: null
+'''
+
+EXAMPLES = r'''
+- name: Show the LDAP base and domain name of the primary
+  ansible.builtin.debug:
+    msg: "{{ lookup('univention.ucs_modules.ucr', 'ldap/base', 'domainname',
+                    url='https://primary.example.org/univention/', username='Administrator',
+                    password=admin_password) }}"
+
+- name: Template a file with values of the host the task runs for
+  ansible.builtin.template:
+    src: "ldap.conf.j2"
+    dest: "/etc/myapp/ldap.conf"
+  vars:
+    ucs_umc_url: "https://{{ inventory_hostname }}/univention/"
+    ucs_umc_username: "Administrator"
+    ucs_umc_password: "{{ admin_password }}"
+    ldap_base: "{{ lookup('univention.ucs_modules.ucr', 'ldap/base') }}"
+'''
+
+RETURN = r'''
+_raw:
+    description: The values of the variables, in the order of the terms.
+    type: list
+'''
+
+
+class LookupModule(LookupBase):
+
+    def run(self, terms, variables=None, **kwargs):
+        self.set_options(var_options=variables, direct=kwargs)
+        url = self.get_option('url')
+        username = self.get_option('username')
+        cache = PlayCache('ucr', url, username)
+
+        missing = cache.missing(terms)
+        if missing:
+            client = get_client(UMCClient, url, username, self.get_option('password'),
+                                validate_certs=self.get_option('validate_certs'), timeout=self.get_option('timeout'))
+            # the session is shared with the workers of later tasks, so that they do not log in again
+            session = PlayCache('umc-session', url, username)
+            if not client.session_id and not session.missing(['session']):
+                client.resume(session['session'])
+            try:
+                result = client.command('ucr/get', missing) or []
+            except UCSAPIError as e:
+                raise AnsibleLookupError('Reading UCR variables from {0} failed: {1}'.format(url, to_native(e)))
+            if session.missing(['session']) or session['session']['value'] != client.session_id:
+                session.update(dict(session=client.export_session()))
+            values = dict((name, None) for name in missing)
+            values.update((entry['key'], entry.get('value')) for entry in result if isinstance(entry, dict))
+            cache.update(values)
+
+        default = self.get_option('default')
+        return [default if cache[name] is None else cache[name] for name in terms]
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2023, Univention GmbH
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+from ansible.errors import AnsibleLookupError
+from ansible.module_utils.common.text.converters import to_native
+from ansible.plugins.lookup import LookupBase
+from ansible_collections.univention.ucs_modules.plugins.plugin_utils.play_cache import PlayCache
+from ansible_collections.univention.ucs_modules.plugins.plugin_utils.ucs_api import (
+    UCSAPIError, UDMRestClient, escape_filter_value, get_client)
+
+DOCUMENTATION = r'''
+---
+name: udm
+short_description: Read UDM objects through the UDM REST API
+description:
+    - Returns the properties of the UDM objects named by the terms, e.g. the
+      user names of 'users/user' objects.
+    - All objects not read before are fetched with a single search whose
+      filter matches every term. The objects are memoized for the rest of the
+      run, so further lookups of the same objects cost no request.
+    - The connection is reused by all lookups of the worker process.
+    - Objects that do not exist are returned as 'None'.
+options:
+    _terms:
+        description: The names of the objects, the value of the first component of their DN.
+        required: true
+    module:
+        description: The UDM module of the objects, e.g. 'users/user' or 'groups/group'.
+        type: str
+        required: true
+    key:
+        description:
+            - The LDAP attribute naming the objects, i.e. the attribute of the
+              first component of their DN.
+            - Defaults to 'uid' for 'users/user' and to 'cn' for all other modules.
+        type: str
+    properties:
+        description:
+            - The properties returned for every object, all properties if not given.
+            - With a single property, its value is returned instead of a dict.
+        type: list
+        elements: str
+    url:
+        description: The base URL of the UDM REST API.
+        type: str
+        required: true
+        env:
+            - name: UDM_REST_URL
+        vars:
+            - name: ucs_udm_rest_url
+    username:
+        description: The user authenticating to the UDM REST API.
+        type: str
+        required: true
+        env:
+            - name: UDM_REST_USERNAME
+        vars:
+            - name: ucs_udm_rest_username
+    password:
+        description: The password of 'username'.
+        type: str
+        required: true
+        env:
+            - name: UDM_REST_PASSWORD
+        vars:
+            - name: ucs_udm_rest_password
+    validate_certs:
+        description: Whether the certificate of the server is verified.
+        type: bool
+        default: true
+    timeout:
+        description: The timeout of every request in seconds.
+        type: int
+        default: 30
+'''
+
+EXAMPLES = r'''
+- name: Show the mail addresses of two users
+  ansible.builtin.debug:
+    msg: "{{ lookup('univention.ucs_modules.udm', 'alice', 'bob', module='users/user',
+                    properties=['mailPrimaryAddress'], url='https://primary.example.org/univention/udm/',
+                    username='Administrator', password=admin_password) }}"
+
+- name: Loop over the members of a group
+  ansible.builtin.debug:
+    var: item
+  loop: "{{ lookup('univention.ucs_modules.udm', 'Domain Admins', module='groups/group',
+                   properties=['users']) }}"
+'''
+
+RETURN = r'''
+_raw:
+    description:
+        - For every term, a dict with the 'dn' and the properties of the object,
+          or the value of the property if a single one was requested.
+    type: list
+'''
+
+DEFAULT_KEYS = {'users/user': 'uid'}
+
+
+class LookupModule(LookupBase):
+
+    def run(self, terms, variables=None, **kwargs):
+        self.set_options(var_options=variables, direct=kwargs)
+        url = self.get_option('url')
+        module = self.get_option('module')
+        key = self.get_option('key') or DEFAULT_KEYS.get(module, 'cn')
+        properties = self.get_option('properties') or []
+        cache = PlayCache('udm', url, self.get_option('username'), module, key, sorted(properties))
+
+        missing = cache.missing(terms)
+        if missing:
+            client = get_client(UDMRestClient, url, self.get_option('username'), self.get_option('password'),
+                                validate_certs=self.get_option('validate_certs'), timeout=self.get_option('timeout'))
+            ldap_filter = '(|{0})'.format(''.join(
+                '({0}={1})'.format(key, escape_filter_value(term)) for term in missing))
+            objects = dict((term.lower(), None) for term in missing)
+            try:
+                for obj in client.search(module, filter=ldap_filter, properties=properties):
+                    attribute, _, value = obj['dn'].split(',', 1)[0].partition('=')
+                    if attribute.lower() == key.lower() and value.lower() in objects:
+                        objects[value.lower()] = dict(obj.get('properties', {}), dn=obj['dn'])
+            except UCSAPIError as e:
+                raise AnsibleLookupError('Searching {0} failed: {1}'.format(module, to_native(e)))
+            cache.update(dict((term, objects[term.lower()]) for term in missing))
+
+        results = []
+        for term in terms:
+            obj = cache[term]
+            if obj is not None and len(properties) == 1:
+                obj = obj.get(properties[0])
+            results.append(obj)
+        return results
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2023, Univention GmbH
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import json
+import re
+
+from ansible.module_utils.common.text.converters import to_native
+from ansible_collections.univention.ucs_modules.plugins.module_utils.lazy_import import LazyModule, module_available
+from ansible_collections.univention.ucs_modules.plugins.module_utils.profile import timer
+
+# the appcenter is imported on first use, a failing import is handled
+# like any other error of the appcenter by falling back to univention-app
+HAS_APPCENTER = module_available('univention.appcenter')
+_app_cache = LazyModule('univention.appcenter.app_cache')
+_actions = LazyModule('univention.appcenter.actions')
+_ucr = LazyModule('univention.appcenter.ucr')
+
+_APPS = None
+
+APP_VERSION_RE = re.compile(r'\b(\d+\.\d+(?:\.\d+)*(?:-\d+)?(?:-\D+\d+)?(?:\s*v\d+)?)\b')
+
+DOCKER_STATES = dict(
+    running='started',
+    restarting='started',
+    created='stopped',
+    exited='stopped',
+    paused='stopped',
+    dead='stopped',
+)
+
+
+def get_apps():
+    '''Return the appcenter cache, it is only created once per module run'''
+    global _APPS
+    if _APPS is None:
+        with timer.phase('connect'):
+            _APPS = _app_cache.Apps()
+    return _APPS
+
+
+def clear_apps_cache():
+    '''Read the appcenter cache again, e.g. after the app lists were updated'''
+    apps = get_apps()
+    if hasattr(apps, 'clear_cache'):
+        apps.clear_cache()
+
+
+def read_installed_apps():
+    '''Return a dict of installed app ids with version, upgrade candidate,
+    stall state and docker flag, read in-process from the appcenter cache'''
+    apps = get_apps()
+    installed_apps = {}
+    for app in apps.get_all_locally_installed_apps():
+        candidate = apps.find_candidate(app)
+        installed_apps[app.id] = dict(
+            version=app.version,
+            upgradable=candidate.version if candidate else None,
+            stalled=_ucr.ucr_get(app.ucr_status_key) == 'stalled',
+            docker=bool(getattr(app, 'docker', False)),
+        )
+    return installed_apps
+
+
+def read_installed_apps_cli(module):
+    '''Return the lists of installed apps as "id=version" and of upgradable
+    app ids from univention-app info'''
+    rc, out, err = module.run_command(['univention-app', 'info', '--as-json'])
+    if rc != 0:
+        module.fail_json(msg='univention-app info failed: {}'.format(err))
+    try:
+        app_infos = json.loads(out)
+    except ValueError as e:
+        module.fail_json(msg='unable to parse json: {}'.format(e))
+    return app_infos.get('installed') or [], app_infos.get('upgradable') or []
+
+
+def read_app_versions_cli(module, app_id):
+    '''Return the available versions of an app from univention-app list, sorted ascending'''
+    rc, out, err = module.run_command(['univention-app', 'list', app_id])
+    if rc != 0:
+        module.fail_json(msg='univention-app list {} failed: {}'.format(app_id, err))
+    versions = APP_VERSION_RE.findall(out)
+    versions.sort(key=lambda version: [int(part) for part in re.split(r'\D+', version) if part])
+    return versions
+
+
+def is_app_stalled(app_id):
+    '''Return whether the app is stalled, None if unknown'''
+    if not HAS_APPCENTER:
+        return None
+    try:
+        return _ucr.ucr_get(get_apps().find(app_id).ucr_status_key) == 'stalled'
+    except Exception:
+        return None
+
+
+def parse_app_configuration(output):
+    '''Return the configuration printed by univention-app configure --list as dict'''
+    configuration = {}
+    for line in output.split('\n'):
+        key_value_pair = line.split(": ", 1)
+        if len(key_value_pair) == 2:
+            key, value = key_value_pair
+            configuration[key] = value.split(' ')[0].strip("'")
+    return configuration
+
+
+def read_app_configuration(module, app_id):
+    '''Return the current configuration of an app as dict, read in-process
+    and with univention-app configure --list if that fails'''
+    if HAS_APPCENTER:
+        try:
+            configuration = {}
+            for variable in _actions.get_action('configure')().list_config(get_apps().find(app_id)):
+                value = variable.get('value')
+                configuration[variable['id']] = '' if value is None else to_native(value)
+            return configuration
+        except Exception as e:
+            module.warn('Reading the configuration of {} failed, using univention-app instead: {}'.format(
+                app_id, e))
+    return parse_app_configuration(module.run_command(['univention-app', 'configure', app_id, '--list'])[1])
+
+
+def read_app_status_cli(module, app_id):
+    '''Return 'started', 'stopped' or 'unknown' from univention-app status'''
+    app_status = module.run_command(['univention-app', 'status', app_id])[1]
+    if 'Active: active' in app_status:
+        return 'started'
+    elif 'Active: inactive' in app_status:
+        return 'stopped'
+    return 'unknown'
+
+
+def _get_app_containers(app_ids):
+    '''Return the container id of every Docker app, None for package apps
+    and apps unknown to the appcenter'''
+    containers = {}
+    apps = get_apps()
+    for app_id in app_ids:
+        app = apps.find(app_id)
+        if app is not None and getattr(app, 'docker', False):
+            containers[app_id] = _ucr.ucr_get(app.ucr_container_key) or ''
+        else:
+            containers[app_id] = None
+    return containers
+
+
+def _probe_containers(module, containers):
+    '''Return the state of the given containers with one docker inspect call'''
+    docker = module.get_bin_path('docker')
+    if not containers or not docker:
+        return {}
+    # docker inspect fails if a single container is missing, but still reports all others
+    out = module.run_command([docker, 'inspect', '--format', '{{.Id}} {{.State.Status}}'] + containers)[1]
+    states = {}
+    for line in out.splitlines():
+        container_id, _, state = line.partition(' ')
+        for container in containers:
+            if container_id.startswith(container):
+                states[container] = state
+    return states
+
+
+def probe_app_status(module, app_ids):
+    '''Determine the running status of Docker apps without univention-app.
+
+    Docker apps are looked up by the id of their container, all of them with a
+    single docker inspect call. Package apps do not name the services they
+    start in their metadata, their status stays 'unknown' so that the caller
+    falls back to univention-app status for them.
+
+    :returns: dict of app ids with a dict of `status` ('started', 'stopped' or
+        'unknown'), the `backend` queried ('docker' or None) and the raw `state`
+    '''
+    results = dict((app_id, dict(status='unknown', backend=None, state=None)) for app_id in app_ids)
+    if not HAS_APPCENTER or not app_ids:
+        return results
+
+    containers = _get_app_containers(app_ids)
+    container_states = _probe_containers(module, [container for container in containers.values() if container])
+
+    for app_id in app_ids:
+        if containers[app_id] is not None:
+            state = container_states.get(containers[app_id])
+            results[app_id] = dict(status=DOCKER_STATES.get(state, 'unknown'), backend='docker', state=state)
+    return results
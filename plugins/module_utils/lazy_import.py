@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2023, Univention GmbH
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import importlib
+
+from ansible_collections.univention.ucs_modules.plugins.module_utils.profile import timer
+
+try:
+    from importlib.util import find_spec
+except ImportError:
+    # Python 2
+    from pkgutil import find_loader as find_spec
+
+
+def module_available(name):
+    '''Return whether the module can be imported without importing it,
+    only its parent packages are imported'''
+    try:
+        return find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+class LazyModule(object):
+    '''A module that is only imported on the first access to one of its
+    attributes, the import is accounted to the 'import' phase'''
+
+    def __init__(self, name):
+        self.__name = name
+        self.__module = None
+
+    def __getattr__(self, attribute):
+        if self.__module is None:
+            with timer.phase('import'):
+                self.__module = importlib.import_module(self.__name)
+        return getattr(self.__module, attribute)
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2023, Univention GmbH
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import time
+from contextlib import contextmanager
+
+# The phases every module reports, others may be added by the modules
+PHASES = ('import', 'connect', 'discover', 'diff', 'write', 'handlers')
+
+
+class PhaseTimer(object):
+    '''Accumulates the wall-clock time spent in the phases of a module run'''
+
+    def __init__(self):
+        self.started = time.time()
+        self.seconds = {}
+        self.calls = {}
+
+    @contextmanager
+    def phase(self, name):
+        '''Account the time spent in the with-block to the phase'''
+        startd = time.time()
+        try:
+            yield
+        finally:
+            self.add(name, time.time() - startd)
+
+    def add(self, name, seconds):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def report(self):
+        '''Return the profile section of the result: the total time and the time
+        and number of calls of every phase, all in seconds'''
+        names = [name for name in PHASES if name in self.seconds]
+        names += sorted(name for name in self.seconds if name not in PHASES)
+        return dict(
+            total=round(time.time() - self.started, 6),
+            phases=dict((name, round(self.seconds[name], 6)) for name in names),
+            calls=dict((name, self.calls[name]) for name in names),
+        )
+
+
+# one timer per module run, as every module runs in a process of its own
+timer = PhaseTimer()
+
+
+def add_profile(module, result):
+    '''Add the profile section to the result if the module was called with profile=true'''
+    if module.params.get('profile'):
+        result['profile'] = timer.report()
+    return result
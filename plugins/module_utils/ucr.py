@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2023, Univention GmbH
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import errno
+import fcntl
+import os
+import time
+
+from ansible_collections.univention.ucs_modules.plugins.module_utils.lazy_import import LazyModule, module_available
+from ansible_collections.univention.ucs_modules.plugins.module_utils.profile import timer
+
+HAS_UCR = module_available('univention.config_registry')
+# the handlers import the template code of UCR, only needed to commit files
+_backend = LazyModule('univention.config_registry.backend')
+_config_registry = LazyModule('univention.config_registry')
+
+# serializes the writes of concurrent module runs, univention-config-registry
+# holds a lock of its own while writing, so it must not be taken here
+LOCK_FILE = '/var/lock/ansible-univention-config-registry.lock'
+
+_REGISTRY = None
+_HANDLERS = None
+
+
+class RegistryLockTimeout(Exception):
+    pass
+
+
+def get_registry():
+    '''Return the loaded registry, it is only read once per module run
+    until invalidate_registry() is called'''
+    global _REGISTRY
+    if _REGISTRY is None:
+        with timer.phase('connect'):
+            _REGISTRY = _backend.ConfigRegistry()
+            _REGISTRY.load()
+    return _REGISTRY
+
+
+def invalidate_registry():
+    '''Read the registry again on the next get_registry(), e.g. after ucr wrote to it'''
+    global _REGISTRY
+    _REGISTRY = None
+
+
+def get_handlers():
+    '''Return the loaded handlers of all UCR templates, they are only read once per module run'''
+    global _HANDLERS
+    if _HANDLERS is None:
+        with timer.phase('connect'):
+            _HANDLERS = _config_registry.configHandlers()
+            _HANDLERS.load()
+    return _HANDLERS
+
+
+class RegistryLock(object):
+    '''The exclusive lock of the module runs writing to the registry'''
+
+    def __init__(self, path=None):
+        self.path = path or LOCK_FILE
+        self.fd = None
+        self.acquired = None
+
+    def acquire(self, timeout):
+        '''Wait up to timeout seconds for the lock, return the seconds waited
+
+        :raises RegistryLockTimeout: if the lock is not free in time
+        '''
+        startd = time.time()
+        self.fd = os.open(self.path, os.O_WRONLY | os.O_CREAT, 0o600)
+        while True:
+            try:
+                fcntl.flock(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except (IOError, OSError) as e:
+                if e.errno not in (errno.EAGAIN, errno.EACCES):
+                    self.release()
+                    raise
+            if time.time() - startd >= timeout:
+                self.release()
+                raise RegistryLockTimeout('{0} was not released within {1} seconds'.format(self.path, timeout))
+            time.sleep(0.05)
+        self.acquired = time.time()
+        waited = self.acquired - startd
+        timer.add('lock', waited)
+        return waited
+
+    def release(self):
+        '''Release the lock, return the seconds it was held'''
+        held = time.time() - self.acquired if self.acquired is not None else 0.0
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        self.acquired = None
+        return held
@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2023, Univention GmbH
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import json
+import os
+import re
+import tempfile
+import threading
+import traceback
+
+from ansible_collections.univention.ucs_modules.plugins.module_utils.lazy_import import LazyModule
+from ansible_collections.univention.ucs_modules.plugins.module_utils.profile import timer
+
+# univention.udm loads all UDM handlers, it is only imported when a connection is needed
+_udm = LazyModule('univention.udm')
+udm_exceptions = LazyModule('univention.udm.exceptions')
+udm_syntax = LazyModule('univention.admin.syntax')
+udm_uexceptions = LazyModule('univention.admin.uexceptions')
+ldap_controls = LazyModule('ldap.controls')
+
+# the property metadata of the UDM modules, valid as long as UDM is not
+# updated, which changes the file list of its package
+PROPERTIES_CACHE_FILE = '/var/cache/univention-ansible/udm_properties.json'
+UDM_PACKAGE_LIST = '/var/lib/dpkg/info/univention-directory-manager-tools.list'
+
+# the entries read per page when searching a subtree, and removed per task of a worker
+PAGE_SIZE = 1000
+REMOVE_CHUNK_SIZE = 50
+
+_CONNECTIONS = {}
+_MODULES = {}
+_PROPERTIES = None
+_WORKER = threading.local()
+
+
+def import_udm():
+    '''Import univention.udm, return the traceback if that fails, otherwise None'''
+    try:
+        _udm.UDM
+    except ImportError:
+        return traceback.format_exc()
+    return None
+
+
+def get_connection(api_version):
+    '''Return the UDM connection as machine account with the given API version,
+    it is only opened once per module run'''
+    if api_version not in _CONNECTIONS:
+        with timer.phase('connect'):
+            _CONNECTIONS[api_version] = _udm.UDM.admin().version(api_version)
+    return _CONNECTIONS[api_version]
+
+
+def get_module(api_version, name):
+    '''Return the handle of a UDM module, every module is only loaded once per module run'''
+    if (api_version, name) not in _MODULES:
+        connection = get_connection(api_version)
+        with timer.phase('connect'):
+            _MODULES[(api_version, name)] = connection.get(name)
+    return _MODULES[(api_version, name)]
+
+
+def get_udm_version():
+    '''Return a fingerprint of the installed UDM version, None if unknown'''
+    try:
+        stat = os.stat(UDM_PACKAGE_LIST)
+    except OSError:
+        return None
+    return '{0}:{1}'.format(stat.st_mtime, stat.st_size)
+
+
+def describe_properties(udm_module):
+    '''Return the metadata of the properties of a UDM module read from its
+    handler, None if the handler is not available'''
+    descriptions = getattr(getattr(udm_module, '_orig_udm_module', None), 'property_descriptions', None)
+    if descriptions is None:
+        return None
+    properties = {}
+    for name, description in descriptions.items():
+        syntax = getattr(description, 'syntax', None)
+        properties[name] = dict(
+            multivalue=bool(getattr(description, 'multivalue', False)),
+            # instances may be configured differently from their class, they are left to UDM
+            syntax=syntax.__name__ if isinstance(syntax, type) else None,
+            # complex syntaxes take a list of values for a single value
+            complex=bool(getattr(syntax, 'subsyntaxes', None)),
+        )
+    return properties
+
+
+def _load_properties_cache(version):
+    try:
+        with open(PROPERTIES_CACHE_FILE) as cache_file:
+            cache = json.load(cache_file)
+        if cache.get('version') == version:
+            return cache['modules']
+    except (IOError, OSError, ValueError, KeyError, AttributeError):
+        pass
+    return {}
+
+
+def _save_properties_cache(version, modules):
+    '''Store the metadata on the host, errors are ignored as it is only a cache'''
+    try:
+        if not os.path.isdir(os.path.dirname(PROPERTIES_CACHE_FILE)):
+            os.makedirs(os.path.dirname(PROPERTIES_CACHE_FILE))
+        temp_file = tempfile.NamedTemporaryFile(delete=False, mode='w', dir=os.path.dirname(PROPERTIES_CACHE_FILE))
+        json.dump(dict(version=version, modules=modules), temp_file)
+        temp_file.close()
+        os.rename(temp_file.name, PROPERTIES_CACHE_FILE)
+    except (IOError, OSError):
+        pass
+
+
+def get_properties(api_version, name, refresh=False, save=True):
+    '''Return the property metadata of a UDM module by property name
+
+    The metadata is cached on the host until UDM is updated, without save,
+    e.g. in check mode, the cache file is only read. With refresh the handler
+    is asked again, e.g. after an unknown property was found, as extended
+    attributes add properties without an update. None if the module does not
+    provide the metadata.
+    '''
+    global _PROPERTIES
+    version = get_udm_version()
+    if _PROPERTIES is None:
+        _PROPERTIES = _load_properties_cache(version) if version else {}
+    key = '{0}:{1}'.format(api_version, name)
+    if refresh or key not in _PROPERTIES:
+        properties = describe_properties(get_module(api_version, name))
+        if properties is None:
+            return None
+        _PROPERTIES[key] = properties
+        if version and save:
+            _save_properties_cache(version, _PROPERTIES)
+    return _PROPERTIES[key]
+
+
+def check_value(metadata, value):
+    '''Return why the value does not match the syntax of the property, None if it does
+    or cannot be checked here'''
+    if value is None or not metadata['syntax']:
+        return None
+    try:
+        syntax = getattr(udm_syntax, metadata['syntax'], None)
+        value_error = udm_uexceptions.valueError
+    except ImportError:
+        return None
+    if syntax is None or not hasattr(syntax, 'parse'):
+        return None
+    try:
+        syntax.parse(value)
+    except value_error as e:
+        return str(e) or 'not a valid {0}'.format(metadata['syntax'])
+    except Exception:
+        # syntaxes needing an LDAP connection or more context are left to UDM
+        return None
+    return None
+
+
+def dn_depth(dn):
+    '''Return the number of RDNs of a DN'''
+    return len(re.split(r'(?<!\\),', dn))
+
+
+def outermost_dns(dns):
+    '''Return the DNs not lying below another of the DNs, in the same order'''
+    lowered = set(dn.lower() for dn in dns)
+    outermost = []
+    for dn in dns:
+        rdns = re.split(r'(?<!\\),', dn.lower())
+        if not any(','.join(rdns[index:]) in lowered for index in range(1, len(rdns))):
+            outermost.append(dn)
+    return outermost
+
+
+def search_subtree_dns(api_version, base):
+    '''Yield the DNs of base and all entries below it, read page by page
+    without any attributes. Nothing is yielded if base does not exist'''
+    connection = get_connection(api_version).connection
+    control = ldap_controls.SimplePagedResultsControl(True, size=PAGE_SIZE, cookie='')
+    while True:
+        response = {}
+        try:
+            dns = connection.searchDn(base=base, scope='sub', serverctrls=[control], response=response)
+        except udm_uexceptions.noObject:
+            # removed in the meantime, e.g. together with the subtree of another object
+            return
+        for dn in dns:
+            yield dn
+        cookies = [ctrl.cookie for ctrl in response.get('ctrls') or []
+                   if ctrl.controlType == ldap_controls.SimplePagedResultsControl.controlType]
+        if not cookies or not cookies[0]:
+            return
+        control.cookie = cookies[0]
+
+
+def remove_dn(connection, dn):
+    '''Remove a single entry with UDM, entries of no UDM module directly from LDAP.
+    Entries already removed, e.g. together with another object, are skipped'''
+    try:
+        obj = connection.obj_by_dn(dn)
+    except udm_exceptions.NoObject:
+        return
+    except udm_exceptions.UnknownModuleType:
+        obj = None
+    if obj is None:
+        connection.connection.delete(dn)
+    else:
+        obj.delete()
+
+
+def _remove_chunk(connection, dns):
+    '''Remove the entries one after another, stop at the first failure.
+    Return the removed DNs and the DN and error of the failure or None'''
+    removed = []
+    for dn in dns:
+        try:
+            remove_dn(connection, dn)
+        except Exception as e:
+            return removed, (dn, str(e) or type(e).__name__)
+        removed.append(dn)
+    return removed, None
+
+
+def _remove_chunk_in_worker(args):
+    api_version, dns = args
+    # python-ldap serializes the operations of a connection, so every worker opens its own
+    if getattr(_WORKER, 'connection', None) is None:
+        _WORKER.connection = _udm.UDM.admin().version(api_version)
+    return _remove_chunk(_WORKER.connection, dns)
+
+
+def remove_subtree(api_version, dns, workers=1):
+    '''Remove the entries of a subtree leaves-first
+
+    The entries of the same depth do not depend on each other and are removed
+    in chunks by up to workers threads, a depth is only started once the
+    deeper ones are gone. Every thread opens its own UDM connection, so more
+    than one worker relies on univention.admin and python-ldap being safe to
+    use from several threads with separate connections.
+
+    :returns: the removed DNs, the remaining DNs leaves-first and the list of
+        DN and error of the failures
+    '''
+    remaining = sorted(dns, key=dn_depth, reverse=True)
+    removed = []
+    errors = []
+    pool = None
+    if workers > 1:
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(workers)
+    try:
+        while remaining and not errors:
+            depth = dn_depth(remaining[0])
+            level = [dn for dn in remaining if dn_depth(dn) == depth]
+            chunks = [level[start:start + REMOVE_CHUNK_SIZE] for start in range(0, len(level), REMOVE_CHUNK_SIZE)]
+            if pool is None:
+                connection = get_connection(api_version)
+                results = (_remove_chunk(connection, chunk) for chunk in chunks)
+            else:
+                results = pool.imap_unordered(_remove_chunk_in_worker, [(api_version, chunk) for chunk in chunks])
+            for chunk_removed, error in results:
+                removed += chunk_removed
+                if error:
+                    errors.append(error)
+                if errors and pool is None:
+                    break
+            done = set(removed)
+            remaining = [dn for dn in remaining if dn not in done]
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return removed, remaining, errors
@@ -12,9 +12,18 @@
 import re
 import os
 import json
+import shlex
+import hashlib
+import datetime
 import tempfile
+import subprocess
+import threading
+import time
 from ansible.module_utils.basic import AnsibleModule
-from distutils.version import LooseVersion
+from ansible_collections.univention.ucs_modules.plugins.module_utils.appcenter import (
+    HAS_APPCENTER, clear_apps_cache, get_apps, is_app_stalled, probe_app_status, read_app_configuration,
+    read_app_status_cli, read_installed_apps, read_installed_apps_cli)
+from ansible_collections.univention.ucs_modules.plugins.module_utils.profile import add_profile, timer
 
 DOCUMENTATION = '''
 ---
@@ -25,14 +34,48 @@ extends_documentation_fragment: ''
 description:
   - Allows ansible to control installation, removal, update and configuration of ucs-apps
 notes:
-  - none
+  - The running status of docker apps is read from their container, for all
+    apps given with apps at once. The status of package apps and of docker apps
+    without a container is read with univention-app status.
+  - The state of the apps is read in-process through the Python API of
+    univention.appcenter. If it is not available, the univention-app command
+    line interface is used instead.
+  - The available versions of all apps are kept in a catalog in
+    /var/cache/univention-ansible/app_catalog.json, which is rebuilt whenever
+    the appcenter cache changed.
 requirements: [ ]
 author: Stefan Ahrens, Melf Clausen
 options:
   name:
     description:
-    - 'The name of the app'
-    required: true
+    - 'The name of the app / either this or apps is required'
+    required: false
+  apps:
+    description:
+    - 'A list of apps to manage in one run, each with the keys name, state, version, config and stall
+       which behave like the options of the same name. The app lists are updated and the state of the
+       apps is read only once. Apps are processed in the order of their dependencies: required apps
+       are installed first and removed last'
+    required: false
+  batch:
+    description:
+    - 'Like apps, handled by the action plugin on the controller which passes the items on as apps.
+       The result of every item is returned in the same order in results'
+    required: false
+  profile:
+    description:
+    - 'Return the time spent reading the appcenter, planning and running the changes in profile'
+    required: false
+    type: bool
+    default: false
+  coalesce_loop:
+    description:
+    - 'Handled by the action plugin on the controller. If the task has a loop, all items are sent to
+       the host as a single batch with the first item, and the result of every item is handed out
+       from it. Only the loop variable is available in the module arguments'
+    required: false
+    type: bool
+    default: false
   state:
     description:
     - 'The desired state of the app / present, absent, started, stopped'
@@ -60,6 +103,19 @@ options:
     - 'Updates the list of apps and their versions - Only runs when app is installed or updated'
     required: false
     default: True
+  update_cache_valid_time:
+    description:
+    - 'Skip updating the app lists if the local appcenter cache is younger than this number of seconds,
+       like the option of the same name of the apt module. The age is determined by the modification
+       time of the files in the appcenter cache'
+    required: false
+    type: int
+  log_file:
+    description:
+    - 'Path of a log file on the host. The output of app installations and upgrades is appended to it
+       line by line while they run, each line with a timestamp and the phase of the operation'
+    required: false
+    type: path
 
 '''
 
@@ -109,6 +165,47 @@ EXAMPLES = '''
     auth_username: Administrator
     auth_password: univention
     stall: "stalled"
+
+- name: install ox-connector without downloading the app lists more than once a day
+  univention_app:
+    name: ox-connector
+    state: present
+    update_cache_valid_time: 86400
+    auth_username: Administrator
+    auth_password: secret
+
+- name: Install ox-connector and follow the progress with tail -f on the host
+  univention_app:
+    name: ox-connector
+    state: present
+    log_file: /var/log/univention/ansible-appcenter.log
+    auth_username: Administrator
+    auth_password: secret
+
+- name: install several apps in one run, one app per loop item
+  univention_app:
+    name: "{{ item }}"
+    state: present
+    auth_username: Administrator
+    auth_password: secret
+    coalesce_loop: true
+  loop:
+    - ox-connector
+    - self-service
+
+- name: manage several apps in one run
+  univention_app:
+    apps:
+      - name: ox-connector
+        version: latest
+        config:
+          EXAMPLE_PARAMETER: 'ExampleValue'
+      - name: self-service
+        state: started
+      - name: owncloud
+        state: absent
+    auth_username: Administrator
+    auth_password: secret
 '''
 
 RETURN = '''
@@ -122,93 +219,404 @@ changed:
     returned: success
     type: bool
     sample: True
+app_lists_updated:
+    description: whether univention-app update was run to refresh the app lists
+    returned: success
+    type: bool
+    sample: False
+upgrade_steps:
+    description: the versions an app was upgraded through with the time each upgrade took
+    returned: success, when the app was upgraded
+    type: list
+    sample: [{"version": "2.1.1", "delta": "0:01:12.529401"}, {"version": "2.1.3", "delta": "0:00:48.164016"}]
+prefetch:
+    description: the docker images pulled in parallel before the first upgrade, with return code and duration
+    returned: success, when a docker app was upgraded
+    type: list
+    sample: [{"image": "docker.software-univention.de/ox-connector:2.1.3", "rc": 0, "delta": "0:00:31.035261"}]
+phase_timings:
+    description:
+      - the phases of every install and upgrade with the time each took. The phase is detected from
+        the output of univention-app, output before the first known phase is counted as prepare
+    returned: success, when an app was installed or upgraded
+    type: list
+    sample:
+      - {"action": "install", "version": "2.1.3", "phase": "download", "delta": "0:00:04.112358"}
+      - {"action": "install", "version": "2.1.3", "phase": "pull", "delta": "0:02:31.035261"}
+      - {"action": "install", "version": "2.1.3", "phase": "join", "delta": "0:00:42.529401"}
+profile:
+    description:
+      - the total run time and the seconds and number of calls of the phases import, connect,
+        discover, diff and write
+    returned: success, with profile
+    type: dict
+    sample: {"total": 3.2, "phases": {"connect": 0.4, "discover": 0.7, "diff": 0.1, "write": 1.9},
+             "calls": {"connect": 1, "discover": 1, "diff": 1, "write": 1}}
+results:
+    description: the result of every item of batch, in the same order
+    returned: success, with batch
+    type: list
+operations:
+    description:
+      - the actions of the plan which were run. Start and stop are skipped if the app already reached
+        the state through its install, upgrade or configuration, configure if an upgrade already set
+        the configuration
+    returned: success
+    type: list
+    sample: ["install"]
+plan:
+    description:
+      - the actions planned to bring the app into the target state, in the order they are run
+      - in check mode only this plan is computed, using read-only queries
+    returned: success
+    type: list
+    sample: [{"action": "upgrade", "versions": ["2.1.1", "2.1.3"]},
+             {"action": "configure", "config": {"ox_SOAP_SERVER": "Test"}}]
+apps:
+    description: the name, changed flag, message and plan for each app, in the order they were processed
+    returned: success, when apps is given
+    type: list
+    sample: [{"name": "ox-connector", "changed": false, "msg": "No changes for ox-connector"}]
 '''
 
+AVAILABLE_APPS_LIST = []
+INSTALLED_APPS_LIST = []
+UPGRADABLE_APPS_LIST = []
+APP_CATALOG = None
+# the fingerprint of the appcenter cache the catalog was read or built for,
+# None if it could not be built and must not be stored
+APP_CATALOG_STATE = None
+APP_CONFIGURATIONS = {}
+APP_STATUS = {}
+APP_LISTS_CHECKED = False
+APP_LISTS_UPDATED = False
+APPCENTER_CACHE_DIR = '/var/cache/univention-appcenter'
+APPCENTER_CACHE_STAMP = os.path.join(APPCENTER_CACHE_DIR, '.ansible-update-stamp')
+APP_CATALOG_FILE = '/var/cache/univention-ansible/app_catalog.json'
+APP_PHASES = (
+    ('pull', re.compile(r'\bpull', re.IGNORECASE)),
+    ('download', re.compile(r'download', re.IGNORECASE)),
+    ('join', re.compile(r'join.?script|\.inst\b', re.IGNORECASE)),
+    ('configure', re.compile(r'configur', re.IGNORECASE)),
+)
+
+
+# the components of distutils' LooseVersion
+LOOSE_VERSION_RE = re.compile(r'(\d+|[a-z]+|\.)')
+
 
 def check_ucs():
     ''' Check if system is actually UCS, return bool '''
-    return os.system("dpkg -s univention-appcenter") == 0
+    return HAS_APPCENTER or os.path.exists('/var/lib/dpkg/info/univention-appcenter.list')
 
 
 def ansible_exec(action, appname=None, keyfile=None, username=None,
-                 desired_update=None, configuration=None):
+                 desired_update=None, configuration=None, phase_timings=None):
     ''' runs ansible's run_command(), choose from actions install, remove, upgrade '''
     univention_app_cmd = {
         'list': "univention-app list --ids-only",
         'update_app_lists': "univention-app update",
         'list-app': "univention-app list {}".format(appname),
-        'info': "univention-app info --as-json",
         'install': ("univention-app {} --noninteractive --username {} --pwdfile {} {}='{}' {}"
                     .format(action, username, keyfile, appname, desired_update, configuration)),
         'remove': ("univention-app {} --noninteractive --username {} --pwdfile {} {}"
                    .format(action, username, keyfile, appname)),
         'upgrade': ("univention-app {} --noninteractive --username {} --pwdfile {} {}='{}'"
                     .format(action, username, keyfile, appname, desired_update)),
-        'status': ("univention-app {} {}"
-                   .format(action, appname)),
         'start': ("univention-app start {}"
                   .format(appname)),
         'stop': ("univention-app stop {}"
                  .format(appname)),
-        'get_configuration': "univention-app configure {} --list".format(appname),
         'configure': "univention-app {} {} {}".format(action, appname, configuration),
         'stall': "univention-app {} {}".format(action, appname),
         'undo_stall': "univention-app stall {} --undo".format(appname),
     }
+    if phase_timings is not None:
+        return run_app_command(univention_app_cmd[action], action, appname, desired_update, phase_timings)
     return module.run_command(univention_app_cmd[action])
 
 
-def get_apps_status():
-    ''' Get the status of available, installed and upgradable apps and return lists'''
-    def get_app_list():
-        ''' exec to get list of all available apps on this system '''
-        return ansible_exec(action='list')[1]
-
-    def get_app_info():
-        ''' exec to get lists of installed and upgradable apps on this system '''
-        app_info = ansible_exec(action='info')
+def detect_app_phase(_line, _phase):
+    ''' return the phase of an app operation a line of univention-app output belongs to '''
+    for phase, pattern in APP_PHASES:
+        if pattern.search(_line):
+            return phase
+    return _phase
+
+
+def run_app_command(_cmd, _action, _appname, _version, _phase_timings):
+    ''' run a long univention-app operation with its output streamed, append every line
+        to log_file if given and add the time spent in each phase to _phase_timings.
+        Returns a tuple of exit-code, stdout and stderr like run_command() '''
+    log_file = module.params.get('log_file')
+    log = open(log_file, 'a') if log_file else None
+    timings = []
+    out = []
+    phase = 'prepare'
+    env = dict(os.environ, PYTHONUNBUFFERED='1')
+    try:
+        with tempfile.TemporaryFile() as err_file:
+            startd = datetime.datetime.now()
+            timings.append((phase, startd))
+            if log:
+                log.write('{} {} {} [{}] starting {}={}\n'.format(startd, _appname, _action, phase, _appname, _version))
+                log.flush()
+            process = subprocess.Popen(shlex.split(_cmd), stdout=subprocess.PIPE, stderr=err_file, env=env,
+                                       universal_newlines=True)
+            for line in iter(process.stdout.readline, ''):
+                now = datetime.datetime.now()
+                out.append(line)
+                new_phase = detect_app_phase(line, phase)
+                if new_phase != phase:
+                    phase = new_phase
+                    timings.append((phase, now))
+                if log:
+                    log.write('{} {} {} [{}] {}\n'.format(now, _appname, _action, phase, line.rstrip('\r\n')))
+                    log.flush()
+            process.stdout.close()
+            rc = process.wait()
+            endd = datetime.datetime.now()
+            err_file.seek(0)
+            err = err_file.read().decode('utf-8', 'replace')
+            if log:
+                for line in err.splitlines():
+                    log.write('{} {} {} [{}] {}\n'.format(endd, _appname, _action, phase, line))
+                log.write('{} {} {} [{}] finished with exit code {}\n'.format(endd, _appname, _action, phase, rc))
+    finally:
+        if log:
+            log.close()
+
+    ends = [timing[1] for timing in timings[1:]] + [endd]
+    _phase_timings.extend(
+        dict(action=_action, version=_version, phase=phase, delta=str(end - start))
+        for (phase, start), end in zip(timings, ends)
+    )
+    return rc, ''.join(out), err
+
+
+def get_app_catalog_state():
+    ''' return a fingerprint of the appcenter cache, which changes with every
+        update of the app lists '''
+    state = hashlib.sha1()
+    paths = [APPCENTER_CACHE_STAMP]
+    for root, dirs, files in os.walk(APPCENTER_CACHE_DIR):
+        # files can be replaced in place without changing the mtime of their directory
+        dirs.sort()
+        paths.append(root)
+        paths.extend(os.path.join(root, name) for name in sorted(files))
+    for path in paths:
         try:
-            app_infos = json.loads(app_info[1])
+            state.update('{}:{}\n'.format(path, os.stat(path).st_mtime).encode('utf-8'))
+        except OSError:
+            continue
+    return state.hexdigest()
+
+
+def build_app_catalog():
+    ''' read every available version of every app in-process from the appcenter
+        cache, return a dict of app ids and lists of versions sorted ascending '''
+    catalog = {}
+    for app in get_apps().get_every_single_app():
+        catalog.setdefault(app.id, []).append(dict(
+            version=app.version,
+            ucs_version=getattr(app, 'ucs_version', None),
+            component_id=getattr(app, 'component_id', None),
+            required_app_version_upgrade=getattr(app, 'required_app_version_upgrade', None),
+            docker_image=getattr(app, 'docker_image', None) if getattr(app, 'docker', False) else None,
+        ))
+    for versions in catalog.values():
+        versions.sort(key=lambda entry: version_sort_key(entry['version']))
+    return catalog
+
+
+def save_app_catalog(_state):
+    ''' store the catalog on the host, errors are ignored as it is only a cache '''
+    try:
+        if not os.path.isdir(os.path.dirname(APP_CATALOG_FILE)):
+            os.makedirs(os.path.dirname(APP_CATALOG_FILE))
+        fileTemp = tempfile.NamedTemporaryFile(
+            delete=False, mode='w', dir=os.path.dirname(APP_CATALOG_FILE))
+        json.dump(dict(state=_state, apps=APP_CATALOG), fileTemp)
+        fileTemp.close()
+        os.rename(fileTemp.name, APP_CATALOG_FILE)
+    except (IOError, OSError):
+        pass
+
+
+def get_app_catalog():
+    ''' return the catalog of available app versions. It is cached on the host and
+        only rebuilt after the appcenter cache changed '''
+    global APP_CATALOG
+    global APP_CATALOG_STATE
+    if APP_CATALOG is not None:
+        return APP_CATALOG
+    state = get_app_catalog_state()
+    try:
+        with open(APP_CATALOG_FILE) as catalog_file:
+            cached_catalog = json.load(catalog_file)
+        if cached_catalog.get('state') == state:
+            APP_CATALOG = cached_catalog['apps']
+            APP_CATALOG_STATE = state
+            return APP_CATALOG
+    except (IOError, OSError, ValueError, KeyError):
+        pass
+    APP_CATALOG = {}
+    APP_CATALOG_STATE = None
+    if HAS_APPCENTER:
+        try:
+            APP_CATALOG = build_app_catalog()
         except Exception as e:
-            module.fail_json(msg="unable to parse json: {}".format(e))
-        return app_infos['installed'], app_infos['upgradable']
+            module.warn("Reading the appcenter cache failed, using univention-app instead: {}".format(e))
+        else:
+            # only a built catalog is stored, an empty one would hide the apps until the cache changes
+            APP_CATALOG_STATE = state
+            save_app_catalog(state)
+    return APP_CATALOG
+
+
+def invalidate_app_catalog():
+    ''' forget the catalog after the app lists were updated '''
+    global APP_CATALOG
+    global APP_CATALOG_STATE
+    APP_CATALOG = None
+    APP_CATALOG_STATE = None
+    if HAS_APPCENTER:
+        clear_apps_cache()
+
+
+def get_apps_snapshot():
+    ''' Read installed and upgradable apps in-process from the appcenter cache,
+        return a tuple of lists '''
+    installed_apps = read_installed_apps()
+    return (['{}={}'.format(app_id, app_info['version']) for app_id, app_info in installed_apps.items()],
+            [app_id for app_id, app_info in installed_apps.items() if app_info['upgradable']])
+
 
+def get_apps_status():
+    ''' Get the status of available, installed and upgradable apps and return lists.
+        Uses a single in-process snapshot and falls back to univention-app '''
     global AVAILABLE_APPS_LIST
     global INSTALLED_APPS_LIST
     global UPGRADABLE_APPS_LIST
-    AVAILABLE_APPS_LIST = get_app_list()
-    INSTALLED_APPS_LIST, UPGRADABLE_APPS_LIST = get_app_info()
+    catalog = get_app_catalog()
+    if HAS_APPCENTER and catalog:
+        try:
+            INSTALLED_APPS_LIST, UPGRADABLE_APPS_LIST = get_apps_snapshot()
+            AVAILABLE_APPS_LIST = list(catalog)
+            return
+        except Exception as e:
+            module.warn("Reading the appcenter cache failed, using univention-app instead: {}".format(e))
+    AVAILABLE_APPS_LIST = ansible_exec(action='list')[1].split()
+    INSTALLED_APPS_LIST, UPGRADABLE_APPS_LIST = read_installed_apps_cli(module)
 
 
-def get_app_info():
-    ''' exec to get lists of installed and upgradable apps on this system '''
-    app_info = ansible_exec(action='info')
-    try:
-        app_infos = json.loads(app_info[1])
-    except Exception as e:
-        module.fail_json(msg="unable to parse json: {}".format(e))
-    return app_infos['installed'], app_infos['upgradable']
+def record_installed_app(_appname, _version):
+    ''' Track an install or upgrade in the lists of installed and upgradable apps instead of
+        re-reading them, univention-app fails if it did not reach the version asked for '''
+    INSTALLED_APPS_LIST[:] = [
+        app_info for app_info in INSTALLED_APPS_LIST if app_info.split('=')[0] != _appname]
+    INSTALLED_APPS_LIST.append('{}={}'.format(_appname, _version))
+    versions = get_app_catalog_entries(_appname)
+    if _appname in UPGRADABLE_APPS_LIST and versions and versions[-1]['version'] == _version:
+        UPGRADABLE_APPS_LIST.remove(_appname)
+    APP_CONFIGURATIONS.pop(_appname, None)
 
 
 # checks what version of app is currently installed
 def check_app_version(_appname):
     app_version = None
-    installed_apps_version, _ = get_app_info()
-    for app_info in installed_apps_version:
-        if _appname in app_info:
+    for app_info in INSTALLED_APPS_LIST:
+        if app_info.split('=')[0] == _appname:
             app_version = app_info.split('=')[-1]
             break
     return app_version
 
 
-def get_and_sort_versions(_appname):
-    get_versions = ansible_exec(action='list-app', appname=_appname)[1]
-    available_app_versions = re.findall(
-        r'\b(\d+\.\d+(?:\.\d+)*(?:-\d+)?(?:-\D+\d+)?(?:\s*v\d+)?)\b', get_versions)
+def version_sort_key(_version):
+    return [int(part) for part in re.split(r'\D+', _version) if part]
+
 
-    available_app_versions.sort(
-        key=lambda s: list(map(int, re.split(r'\D+', s))))
-    return available_app_versions
+def loose_version_key(_version):
+    ''' compare versions like distutils' LooseVersion, which takes longer to import than the whole module '''
+    return [int(part) if part.isdigit() else part
+            for part in LOOSE_VERSION_RE.split(str(_version)) if part and part != '.']
+
+
+def get_app_catalog_entries(_appname):
+    ''' return the catalog entries of all versions of an app, sorted ascending.
+        Apps missing in the catalog are looked up with univention-app once '''
+    catalog = get_app_catalog()
+    if _appname not in catalog:
+        get_versions = ansible_exec(action='list-app', appname=_appname)[1]
+        available_app_versions = re.findall(
+            r'\b(\d+\.\d+(?:\.\d+)*(?:-\d+)?(?:-\D+\d+)?(?:\s*v\d+)?)\b', get_versions)
+        available_app_versions.sort(key=version_sort_key)
+        catalog[_appname] = [dict(version=version) for version in available_app_versions]
+        # a catalog that could not be built only holds the apps looked up here
+        if APP_CATALOG_STATE is not None:
+            save_app_catalog(APP_CATALOG_STATE)
+    return catalog[_appname]
+
+
+def get_and_sort_versions(_appname):
+    return [entry['version'] for entry in get_app_catalog_entries(_appname)]
+
+
+def plan_upgrade_path(_appname, _current_version, _target_version):
+    ''' return the shortest list of versions to upgrade through from the current to
+        the target version. Every step goes to the highest version which may be
+        upgraded to from the previous one according to required_app_version_upgrade.
+        Without upgrade constraints in the catalog every version is installed '''
+    entries = get_app_catalog_entries(_appname)
+    available_app_versions = [entry['version'] for entry in entries]
+    candidates = entries[available_app_versions.index(
+        _current_version)+1:available_app_versions.index(_target_version)+1]
+    if any('required_app_version_upgrade' not in entry for entry in candidates):
+        return [entry['version'] for entry in candidates]
+
+    versions_to_update = []
+    version = _current_version
+    while candidates:
+        allowed = [
+            index for index, entry in enumerate(candidates)
+            if not entry['required_app_version_upgrade']
+            or version_sort_key(entry['required_app_version_upgrade']) <= version_sort_key(version)
+        ]
+        index = allowed[-1] if allowed else 0
+        version = candidates[index]['version']
+        versions_to_update.append(version)
+        candidates = candidates[index + 1:]
+    return versions_to_update
+
+
+def prefetch_app_images(_appname, _versions):
+    ''' pull the docker images of all given versions of an app in parallel,
+        return a list of dicts with image, rc and delta '''
+    entries = dict((entry['version'], entry) for entry in get_app_catalog_entries(_appname))
+    images = []
+    for version in _versions:
+        image = entries.get(version, {}).get('docker_image')
+        if image and image not in images:
+            images.append(image)
+    docker = module.get_bin_path('docker')
+    if not images or not docker:
+        return []
+
+    prefetched = []
+
+    def pull(_image):
+        startd = datetime.datetime.now()
+        rc = module.run_command([docker, 'pull', _image])[0]
+        prefetched.append(dict(image=_image, rc=rc, delta=str(datetime.datetime.now() - startd)))
+        if rc != 0:
+            module.warn("Pulling {} failed, the upgrade will try again".format(_image))
+
+    threads = [threading.Thread(target=pull, args=(image,)) for image in images]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return prefetched
 
 
 def check_target_app_version(_appname, _version):
@@ -225,26 +633,18 @@ def check_target_app_version(_appname, _version):
     return _version
 
 
-# check if app status is started or stopped
-def check_app_status(_appname):
-    app_status = ansible_exec(action='status', appname=_appname)[1]
-    if 'Active: active' in app_status:
-        return 'started'
-    elif 'Active: inactive' in app_status:
-        return 'stopped'
-    else:
-        return 'unknown'
+def probe_apps_status(_appnames):
+    ''' query the running status of several docker apps at once from their containers '''
+    APP_STATUS.update(probe_app_status(module, list(_appnames)))
 
 
-def parse_current_configuration(_config):
-    config_lines = _config.split('\n')
-    config_dict = {}
-    for line in config_lines:
-        key_value_pair = line.split(": ", 1)
-        if len(key_value_pair) == 2:
-            key, value = key_value_pair
-            config_dict[key] = value.split(' ')[0].strip("'")
-    return config_dict
+# check if app status is started or stopped
+def check_app_status(_appname):
+    if _appname not in APP_STATUS:
+        probe_apps_status([_appname])
+    if APP_STATUS[_appname]['status'] != 'unknown':
+        return APP_STATUS[_appname]['status']
+    return read_app_status_cli(module, _appname)
 
 
 def format_new_conf(_configuration):
@@ -286,6 +686,35 @@ def update_app_lists():
     return ansible_exec(action='update_app_lists')
 
 
+def check_app_lists_cache_valid(_valid_time):
+    ''' check if any file of the appcenter cache was modified within the last
+        _valid_time seconds, return bool '''
+    threshold = time.time() - _valid_time
+    try:
+        if os.stat(APPCENTER_CACHE_STAMP).st_mtime >= threshold:
+            return True
+    except OSError:
+        pass
+    for root, dirs, files in os.walk(APPCENTER_CACHE_DIR):
+        for name in files:
+            try:
+                if os.stat(os.path.join(root, name)).st_mtime >= threshold:
+                    return True
+            except OSError:
+                continue
+    return False
+
+
+def touch_app_lists_cache_stamp():
+    ''' mark the appcenter cache as updated, univention-app update leaves
+        the files untouched if nothing changed on the server '''
+    try:
+        with open(APPCENTER_CACHE_STAMP, 'a'):
+            os.utime(APPCENTER_CACHE_STAMP, None)
+    except (IOError, OSError):
+        pass
+
+
 def start_app(_appname):
     ansible_exec(action='start', appname=_appname)
 
@@ -294,11 +723,12 @@ def stop_app(_appname):
     ansible_exec(action='stop', appname=_appname)
 
 
-def install_app(_appname, _authfile, _desired_version, _auth_username, _configuration):
+def install_app(_appname, _authfile, _desired_version, _auth_username, _configuration, _phase_timings):
     ''' installs an app with given name and path to auth-file, uses ansible_exec()
         and returns tuple of exit-code and stdout '''
     return ansible_exec(action='install', appname=_appname, keyfile=_authfile, username=_auth_username,
-                        desired_update=_desired_version, configuration=format_new_conf(_configuration))
+                        desired_update=_desired_version, configuration=format_new_conf(_configuration),
+                        phase_timings=_phase_timings)
 
 
 def remove_app(_appname, _authfile, _auth_username):
@@ -307,11 +737,12 @@ def remove_app(_appname, _authfile, _auth_username):
     return ansible_exec(action='remove', appname=_appname, keyfile=_authfile, username=_auth_username)
 
 
-def upgrade_app(_appname, _authfile, _desired_version, _auth_username):
+def upgrade_app(_appname, _authfile, _desired_version, _auth_username, _phase_timings):
     ''' upgrades an app with given name and path to auth-file, uses ansible_exec()
         and returns tuple of exit-code and stdout'''
     return ansible_exec(action='upgrade', appname=_appname, keyfile=_authfile,
-                        username=_auth_username, desired_update=_desired_version)
+                        username=_auth_username, desired_update=_desired_version,
+                        phase_timings=_phase_timings)
 
 
 def stall_app(_appname, _authfile):
@@ -327,12 +758,11 @@ def undo_stall_app(_appname, _authfile):
 
 
 def get_app_configuration(_appname):
-    ''' get current app configuration, uses ansible_exec()
+    ''' get current app configuration, in-process or with ansible_exec()
         and return a dictionary with configuration parameters. '''
-    config_output = ansible_exec(
-        action='get_configuration', appname=_appname)[1]
-    current_app_configuration = parse_current_configuration(config_output)
-    return current_app_configuration
+    if _appname not in APP_CONFIGURATIONS:
+        APP_CONFIGURATIONS[_appname] = read_app_configuration(module, _appname)
+    return dict(APP_CONFIGURATIONS[_appname])
 
 
 def check_config_and_return_differences(_current_config, _app_target_config):
@@ -361,17 +791,303 @@ def configure_app(_appname, _configuration):
     return ansible_exec(action='configure', appname=_appname, configuration=format_new_conf(_configuration))
 
 
+def update_lists():
+    ''' update the app lists once per module run if update_app_lists is set '''
+    global APP_LISTS_CHECKED
+    global APP_LISTS_UPDATED
+    if not module.params.get('update_app_lists') or APP_LISTS_CHECKED:
+        return
+    APP_LISTS_CHECKED = True
+    valid_time = module.params.get('update_cache_valid_time')
+    if valid_time and check_app_lists_cache_valid(valid_time):
+        return
+    _update_lists = update_app_lists()
+    if _update_lists[0] != 0:
+        return module.fail_json(
+                msg='''
+                An Error occured running univention-app update.
+                To disable updating app lists set "update_app_lists" to False
+                '''
+                )
+    touch_app_lists_cache_stamp()
+    invalidate_app_catalog()
+    APP_LISTS_UPDATED = True
+
+
+def get_app_dependencies(_appname):
+    ''' return the ids of the apps the given app requires on this host '''
+    if HAS_APPCENTER:
+        try:
+            app = get_apps().find(_appname)
+            return [required.split('=')[0] for required in (getattr(app, 'required_apps', None) or [])]
+        except Exception:
+            pass
+    return []
+
+
+def order_apps(_apps):
+    ''' order the app entries so that required apps are installed before
+        and removed after the apps depending on them '''
+    apps_by_name = dict((app['name'], app) for app in _apps)
+    ordered = []
+    visited = set()
+
+    def visit(_appname):
+        if _appname in visited:
+            return
+        visited.add(_appname)
+        for required in get_app_dependencies(_appname):
+            if required in apps_by_name:
+                visit(required)
+        ordered.append(apps_by_name[_appname])
+
+    for app in _apps:
+        visit(app['name'])
+    removals = [app for app in reversed(ordered) if app['state'] == 'absent']
+    return removals + [app for app in ordered if app['state'] != 'absent']
+
+
+def check_app_stalled(_appname):
+    ''' check if a given app is stalled, return bool or None if unknown '''
+    return is_app_stalled(_appname)
+
+
+def plan_app(app_name, app_status_target, app_version, app_target_config, app_stall_target):
+    ''' compute the actions bringing a single app into the target state using read-only
+        queries only, return a list of dicts with the action and its parameters '''
+    app_present = check_app_present(app_name)
+    app_absent = check_app_absent(app_name)
+
+    # some basic logic-checks
+    if not app_absent and not app_present:  # this means the app does not exist
+        module.fail_json(msg=("app {} does not exist. Please choose from following options:\n{}"
+                              .format(app_name, str(AVAILABLE_APPS_LIST))))
+    if app_absent and app_present:  # schroedinger's app-status
+        module.fail_json(
+            msg="an error occured while getting the status of {}".format(app_name))
+
+    if app_status_target == 'absent':
+        return [dict(action='remove')] if app_present else []
+
+    plan = []
+    app_target_version = check_target_app_version(app_name, app_version)
+    if not app_present:
+        config = {}
+        if app_target_config:
+            default_config = get_app_configuration(app_name)
+            try:
+                config = check_config_and_return_differences(
+                    default_config, app_target_config)
+            except ValueError as e:
+                module.fail_json(
+                    module_changed=True, msg="The parameter '{}' does not exist on app {}".format(e, app_name))
+        plan.append(dict(action='install', version=app_target_version, config=config))
+    else:
+        current_version = check_app_version(app_name)  # check App version
+        if loose_version_key(app_target_version) < loose_version_key(current_version):
+            module.fail_json(
+                msg="""The current version of {} is higher than the desired version.
+                  The version currently installed is: {}""".format(app_name, current_version))
+        if loose_version_key(app_target_version) > loose_version_key(current_version):
+            # plan the fewest upgrades between current and target
+            plan.append(dict(action='upgrade', versions=plan_upgrade_path(
+                app_name, current_version, app_target_version)))
+        if app_target_config:
+            current_config = get_app_configuration(app_name)
+            # check if keys exist and params changed
+            try:
+                new_params = check_config_and_return_differences(
+                    current_config, app_target_config)
+            except ValueError as e:
+                module.fail_json(
+                    module_changed=True, msg="The parameter '{}' does not exist on app {}".format(e, app_name))
+            if len(new_params) > 0:
+                plan.append(dict(action='configure', config=new_params))
+
+    if app_status_target in ['started', 'stopped']:
+        app_status = check_app_status(app_name) if app_present else 'unknown'
+        if app_status_target == 'started' and app_status != 'started':
+            plan.append(dict(action='start'))
+        elif app_status_target == 'stopped' and app_status != 'stopped':
+            plan.append(dict(action='stop'))
+
+    if app_present and app_stall_target:
+        app_stalled = check_app_stalled(app_name)
+        if app_stall_target == 'stalled' and app_stalled is not True:
+            plan.append(dict(action='stall'))
+        elif app_stall_target == 'unstalled' and app_stalled is not False:
+            plan.append(dict(action='undo_stall'))
+    return plan
+
+
+def apply_app_plan(app_name, plan, app_status_target, app_target_config, auth_username, auth_password):
+    ''' run the actions computed by plan_app(), return a dict with name, changed and msg '''
+    app_result = dict(name=app_name, changed=len(plan) > 0, msg='', plan=plan, operations=[])
+    if not plan:
+        return dict(app_result, msg="No changes for {}".format(app_name))
+    if module.check_mode:
+        return dict(app_result, msg="{} would be changed by: {}".format(
+            app_name, ', '.join(step['action'] for step in plan)))
+    APP_STATUS.pop(app_name, None)
+
+    # User info if config settings are changed
+    new_config_msg = None
+    # the version or state changed, so queries made for planning are outdated
+    app_changed = False
+    auth_file = generate_tmp_auth_file(auth_password)
+    try:
+        for step in plan:
+            if step['action'] in ['start', 'stop'] and app_changed \
+                    and check_app_status(app_name) == app_status_target:
+                # the app was already started or stopped by its install, upgrade or configuration
+                continue
+            if step['action'] == 'configure' and app_changed:
+                # an upgrade may have changed the configuration
+                try:
+                    step = dict(step, config=check_config_and_return_differences(
+                        get_app_configuration(app_name), app_target_config))
+                except ValueError as e:
+                    module.fail_json(
+                        module_changed=True,
+                        msg="The parameter '{}' does not exist on app {}".format(e, app_name))
+                if len(step['config']) == 0:
+                    continue
+            app_result['operations'].append(step['action'])
+
+            if step['action'] == 'remove':
+                _remove_app = remove_app(app_name, auth_file, auth_username)
+                if _remove_app[0] == 0:
+                    INSTALLED_APPS_LIST[:] = [
+                        app_info for app_info in INSTALLED_APPS_LIST if app_info.split('=')[0] != app_name]
+                    return dict(app_result, msg="App {} was successfully deinstalled.".format(app_name))
+                else:
+                    module.fail_json(
+                        msg="an error occured while uninstalling {}".format(app_name))
+
+            elif step['action'] == 'install':
+                update_lists()
+                app_result.setdefault('phase_timings', [])
+                _install_app = install_app(
+                    app_name, auth_file, step['version'], auth_username, step['config'],
+                    app_result['phase_timings'])
+                if _install_app[0] == 0:
+                    app_changed = True
+                    record_installed_app(app_name, step['version'])
+                    if len(step['config']) > 0:
+                        new_config_msg = '. The following configuration options were changed: {}'.format(
+                            step['config'])
+                else:
+                    module.fail_json(
+                        msg="an error occured while installing {}".format(step['version']),
+                        phase_timings=app_result['phase_timings'])
+
+            elif step['action'] == 'upgrade':
+                update_lists()
+                app_result['prefetch'] = prefetch_app_images(app_name, step['versions'])
+                app_result['upgrade_steps'] = []
+                app_result.setdefault('phase_timings', [])
+                for version in step['versions']:
+                    # Update App & check if Update successfull
+                    startd = datetime.datetime.now()
+                    _upgrade_app = upgrade_app(
+                        app_name, auth_file, version, auth_username, app_result['phase_timings'])
+                    app_result['upgrade_steps'].append(dict(
+                        version=version, delta=str(datetime.datetime.now() - startd)))
+                    if _upgrade_app[0] != 0:
+                        module.fail_json(
+                            msg="an error occured while upgrading {}".format(app_name),
+                            upgrade_steps=app_result['upgrade_steps'],
+                            phase_timings=app_result['phase_timings'])
+                app_changed = True
+                record_installed_app(app_name, step['versions'][-1])
+
+            elif step['action'] == 'configure':
+                _configure_app = configure_app(app_name, step['config'])
+                if not _configure_app[0] == 0:
+                    module.fail_json(msg="An error occured while configuring {} with configuration:{}".format(
+                        app_name, step['config']))
+                APP_CONFIGURATIONS.pop(app_name, None)
+                app_changed = True
+                new_config_msg = '. The following configuration options were changed: {}'.format(
+                    step['config'])
+
+            elif step['action'] == 'start':
+                start_app(app_name)
+                APP_STATUS.pop(app_name, None)
+
+            elif step['action'] == 'stop':
+                stop_app(app_name)
+                APP_STATUS.pop(app_name, None)
+
+            elif step['action'] == 'stall':
+                _stall_app = stall_app(app_name, auth_file)
+                if _stall_app[0] != 0:
+                    module.fail_json(
+                        msg="an error occurred while stalling {}".format(app_name))
+
+            elif step['action'] == 'undo_stall':
+                _undo_stall_app = undo_stall_app(app_name, auth_file)
+                if _undo_stall_app[0] != 0:
+                    module.fail_json(
+                        msg="an error occurred while undoing the stall {}".format(app_name))
+    finally:
+        os.remove(auth_file)
+
+    return dict(app_result, msg="{} is {} in version {} {}".format(
+        app_name, app_status_target, check_app_version(app_name), new_config_msg))
+
+
+def manage_app(app_name, app_status_target, app_version, app_target_config, app_stall_target,
+               auth_username, auth_password):
+    ''' bring a single app into the target state, return a dict with name, changed, msg and plan '''
+    with timer.phase('diff'):
+        plan = plan_app(app_name, app_status_target, app_version, app_target_config, app_stall_target)
+    with timer.phase('write'):
+        return apply_app_plan(app_name, plan, app_status_target, app_target_config, auth_username, auth_password)
+
+
 def main():
     ''' main() is an entry-point for ansible which checks app-status and installs,
-        upgrades, or removes the app based on ansible state and name-parameters '''
+        upgrades, or removes the apps based on ansible state and name-parameters '''
     global module  # declare ansible-module and parameters globally
     module = AnsibleModule(
         argument_spec=dict(
             name=dict(
                 type='str',
-                required=True,
+                required=False,
                 aliases=['app']
             ),
+            apps=dict(
+                type='list',
+                elements='dict',
+                required=False,
+                options=dict(
+                    name=dict(
+                        type='str',
+                        required=True,
+                        aliases=['app']
+                    ),
+                    state=dict(
+                        type='str',
+                        default='present',
+                        choices=['present', 'absent', 'started', 'stopped']
+                    ),
+                    stall=dict(
+                        type='str',
+                        required=False,
+                        choices=["stalled", "unstalled"]
+                    ),
+                    version=dict(
+                        type='str',
+                        required=False,
+                        default='current'
+                    ),
+                    config=dict(
+                        type='dict',
+                        required=False
+                    ),
+                )
+            ),
             state=dict(
                 type='str',
                 default='present',
@@ -404,11 +1120,24 @@ def main():
                 type='bool',
                 default=True,
                 required=False
+            ),
+            update_cache_valid_time=dict(
+                type='int',
+                required=False
+            ),
+            log_file=dict(
+                type='path',
+                required=False
+            ),
+            profile=dict(
+                type='bool',
+                default=False,
+                required=False
             )
         ),
-        # mutually_exclusive=[[]],
-        # required_one_of=[[]],
-        supports_check_mode=False,  # this has to be changed. Use -dry-run were necessary
+        mutually_exclusive=[['name', 'apps']],
+        required_one_of=[['name', 'apps']],
+        supports_check_mode=True,
     )
 
     # This module should only run on UCS-systems
@@ -418,174 +1147,33 @@ def main():
             msg='Non-UCS-system detected. Nothing to do here.'
         )
 
-    # update app lists
-    def update_lists():
-        if module.params.get('update_app_lists'):
-            _update_lists = update_app_lists()
-            if _update_lists[0] != 0:
-                return module.fail_json(
-                        msg='''
-                        An Error occured running univention-app update.
-                        To disable updating app lists set "update_app_lists" to False
-                        '''
-                        )
     # gather infos and vars
-    get_apps_status()
-    app_status_target = module.params.get('state')  # desired state of the app
-    app_name = module.params.get('name')  # name of the app
+    with timer.phase('discover'):
+        get_apps_status()
+        if module.params.get('apps'):
+            probe_apps_status([app['name'] for app in module.params.get('apps')
+                               if app['state'] in ['started', 'stopped'] and check_app_present(app['name'])])
     auth_password = module.params.get(
         'auth_password')  # password for domain-admin
     auth_username = module.params.get(
         'auth_username')
-    app_present = check_app_present(app_name)
-    app_absent = check_app_absent(app_name)
-    app_stall_target = module.params.get('stall')
-    app_target_version = check_target_app_version(
-        app_name, module.params.get('version'))
-    app_status = check_app_status(app_name)
-    app_target_config = module.params.get('config')
-    module_changed = False
-    config_changed = False
-    # User info if config settings are changed
-    new_config_msg = None
 
-    # some basic logic-checks
-    if not app_absent and not app_present:  # this means the app does not exist
-        module.fail_json(msg=("app {} does not exist. Please choose from following options:\n{}"
-                              .format(app_name, str(AVAILABLE_APPS_LIST))))
-    if app_absent and app_present:  # schroedinger's app-status
-        module.fail_json(
-            msg="an error occured while getting the status of {}".format(app_name))
-
-    if app_status_target != 'absent' and not app_present:
-        auth_file = generate_tmp_auth_file(auth_password)
-        update_lists()
-        config = {}
-        if app_target_config:
-            default_config = get_app_configuration(app_name)
-            try:
-                config = check_config_and_return_differences(
-                    default_config, app_target_config)
-            except ValueError as e:
-                module.fail_json(
-                    module_changed=True, msg="The parameter '{}' does not exist on app {}".format(e, app_name))
-
-        try:
-            _install_app = install_app(
-                app_name, auth_file, app_target_version, auth_username, config)
-            if _install_app[0] == 0:
-                module_changed = True
-                if len(config) > 0:
-                    new_config_msg = '. The following configuration options were changed: {}'.format(
-                        config)
-                    config_changed = True
-            else:
-                module.fail_json(
-                    msg="an error occured while installing {}".format(app_target_version))
-        finally:
-            os.remove(auth_file)
-
-    elif app_status_target == 'absent' and app_present:
-        auth_file = generate_tmp_auth_file(auth_password)
-        try:
-            _remove_app = remove_app(app_name, auth_file, auth_username)
-            if _remove_app[0] == 0:
-                module.exit_json(
-                    changed=True, msg="App {} was successfully deinstalled.".format(app_name))
-            else:
-                module.fail_json(
-                    msg="an error occured while uninstalling {}".format(app_name))
-        finally:
-            os.remove(auth_file)
-
-    elif app_status_target == 'absent' and app_absent:
-        module.exit_json(
-            changed=False, msg="App {} not installed. No change.".format(app_name))
-    app_version = check_app_version(app_name)  # check App version
-    if app_status_target != 'absent' and LooseVersion(app_target_version) > LooseVersion(app_version):
-        auth_file = generate_tmp_auth_file(auth_password)
-        update_lists()
-        try:
-            available_app_versions = get_and_sort_versions(app_name)
-            # check how many versions between current and target
-            versions_to_update = available_app_versions[available_app_versions.index(
-                app_version)+1:available_app_versions.index(app_target_version)+1]
-            for version in versions_to_update:
-                # Update App & check if Update successfull
-                _upgrade_app = upgrade_app(
-                    app_name, auth_file, version, auth_username)
-                if _upgrade_app[0] == 0:
-                    continue
-                else:
-                    module.fail_json(
-                        msg="an error occured while upgrading {}".format(app_name))
-            module_changed = True
-        finally:
-            os.remove(auth_file)
-
-    if app_status_target != 'absent' and not config_changed and app_target_config:
-        current_config = get_app_configuration(app_name)
-        # check if keys exist and params changed
-        try:
-            new_params = check_config_and_return_differences(
-                current_config, app_target_config)
-        except ValueError as e:
-            module.fail_json(
-                module_changed=True, msg="The parameter '{}' does not exist on app {}".format(e, app_name))
-        if len(new_params) > 0:
-            _configure_app = configure_app(app_name, new_params)
-            if not _configure_app[0] == 0:
-                module.fail_json(msg="An error occured while configuring {} with configuration:{}".format(
-                    app_name, new_params))
-            else:
-                module_changed = True
-                new_config_msg = '. The following configuration options were changed: {}'.format(
-                    new_params)
-
-    elif app_status_target != 'absent' and LooseVersion(app_target_version) < LooseVersion(app_version):
-        module.fail_json(
-            msg="""The current version of {} is higher than the desired version.
-              The version currently installed is: {}""".format(app_name, app_version))
-
-    if app_status_target in ['started', 'stopped']:
-        if app_status_target == 'started' and app_status != 'started':
-            start_app(app_name)
-            module_changed = True
-        elif app_status_target == 'stopped' and app_status != 'stopped':
-            stop_app(app_name)
-            module_changed = True
-
-    if app_present and app_stall_target == 'stalled':
-        # stall_app(app_name)
-        auth_file = generate_tmp_auth_file(auth_password)
-        try:
-            _stall_app = stall_app(app_name, auth_file)
-            if _stall_app[0] == 0:
-                module_changed = True
-            else:
-                module.fail_json(
-                    msg="an error occurred while stalling {}".format(app_name))
-        finally:
-            os.remove(auth_file)
-    elif app_present and app_stall_target == 'unstalled':
-        # undo_stall_app(app_name)
-        auth_file = generate_tmp_auth_file(auth_password)
-        try:
-            _undo_stall_app = undo_stall_app(app_name, auth_file)
-            if _undo_stall_app[0] == 0:
-                module_changed = True
-            else:
-                module.fail_json(
-                    msg="an error occurred while undoing the stall {}".format(app_name))
-        finally:
-            os.remove(auth_file)
-
-    if module_changed:
-        module.exit_json(changed=module_changed, msg="{} is {} in version {} {}".format(
-            app_name, app_status_target, check_app_version(app_name), new_config_msg))
-    else:
-        module.exit_json(changed=module_changed, msg="No changes for {}".format(
-            app_name))
+    if module.params.get('apps') is None:
+        app_result = manage_app(
+            module.params.get('name'), module.params.get('state'), module.params.get('version'),
+            module.params.get('config'), module.params.get('stall'), auth_username, auth_password)
+        return module.exit_json(**add_profile(module, dict(app_result, app_lists_updated=APP_LISTS_UPDATED)))
+
+    results = []
+    for app in order_apps(module.params.get('apps')):
+        results.append(manage_app(
+            app['name'], app['state'], app['version'], app['config'], app['stall'],
+            auth_username, auth_password))
+    module.exit_json(**add_profile(module, dict(
+        changed=any(result['changed'] for result in results),
+        msg=' '.join(result['msg'] for result in results),
+        app_lists_updated=APP_LISTS_UPDATED,
+        apps=results)))
 
 
 if __name__ == '__main__':
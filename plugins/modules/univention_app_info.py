@@ -0,0 +1,188 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2023, Univention GmbH
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+import os
+from ansible.module_utils.basic import AnsibleModule
+from ansible_collections.univention.ucs_modules.plugins.module_utils.appcenter import (
+    HAS_APPCENTER, probe_app_status, read_app_configuration, read_app_status_cli, read_app_versions_cli,
+    read_installed_apps, read_installed_apps_cli)
+from ansible_collections.univention.ucs_modules.plugins.module_utils.profile import add_profile, timer
+
+DOCUMENTATION = '''
+---
+module: univention_app_info
+version_added: "2.1.0"
+short_description: "Gathers information about the apps installed on Univention Corporate Server"
+extends_documentation_fragment: ''
+description:
+  - Returns the version, the upgrade candidate, the running status, the stall state and optionally
+    the configuration of every installed app in one call.
+  - The information is returned as ansible fact 'univention_apps', so it can be kept in the fact cache.
+notes:
+  - The state of the apps is read in-process through the Python API of
+    univention.appcenter. If it is not available, the univention-app command
+    line interface is used instead, which needs one more call per upgradable
+    app to find the version of its upgrade candidate.
+  - The running status of docker apps is read from their container, all of
+    them with a single call. The status of package apps and of docker apps
+    without a container is read with univention-app status.
+  - Supports check mode.
+requirements: [ ]
+author: Univention GmbH
+options:
+  apps:
+    description:
+    - 'Only return information about these apps. Defaults to all installed apps'
+    required: false
+    type: list
+  status:
+    description:
+    - 'Whether the running status of the apps is returned'
+    required: false
+    type: bool
+    default: True
+  configuration:
+    description:
+    - 'Whether the current configuration of the apps is returned'
+    required: false
+    type: bool
+    default: False
+  profile:
+    description:
+    - 'Return the time spent reading the apps, their status and their configuration in profile'
+    required: false
+    type: bool
+    default: False
+'''
+
+EXAMPLES = '''
+- name: gather information about all installed apps
+  univention_app_info:
+
+- name: gather the configuration of ox-connector
+  univention_app_info:
+    apps:
+      - ox-connector
+    configuration: true
+
+- name: restart ox-connector if it is not running
+  univention_app:
+    name: ox-connector
+    state: started
+    auth_username: Administrator
+    auth_password: secret
+  when: ansible_facts['univention_apps']['ox-connector']['status'] != 'started'
+'''
+
+RETURN = '''
+ansible_facts:
+    description: facts about the installed apps
+    returned: always
+    type: complex
+    contains:
+        univention_apps:
+            description: a dict of the installed apps with their id as key
+            returned: always
+            type: dict
+            sample:
+                ox-connector:
+                    version: "2.1.3"
+                    upgradable: "2.2.0"
+                    status: "started"
+                    service:
+                        backend: "docker"
+                        state: "running"
+                    stalled: false
+                    docker: true
+profile:
+    description: the total run time and the seconds and number of calls of the phases import, connect,
+      discover, status and configuration
+    returned: with profile
+    type: dict
+msg:
+    description: a return message
+    returned: always
+    type: str
+    sample: Found 3 installed apps.
+'''
+
+
+def _get_installed_apps_cli(module, apps):
+    ''' Return a dict of installed app ids with version from univention-app info.
+        univention-app info only lists the ids of the upgradable apps, the version
+        of their upgrade candidate is looked up with univention-app list '''
+    installed, upgradable = read_installed_apps_cli(module)
+    installed_apps = {}
+    for app_info in installed:
+        app_id, _, version = app_info.partition('=')
+        if apps and app_id not in apps:
+            continue
+        candidate = None
+        if app_id in upgradable:
+            versions = read_app_versions_cli(module, app_id)
+            candidate = versions[-1] if versions else None
+        installed_apps[app_id] = dict(
+            version=version,
+            upgradable=candidate,
+            stalled=None,
+            docker=None,
+        )
+    return installed_apps
+
+
+def run_module():
+    module = AnsibleModule(
+        argument_spec=dict(
+            apps=dict(type='list', required=False),
+            status=dict(type='bool', default=True),
+            configuration=dict(type='bool', default=False),
+            profile=dict(type='bool', default=False),
+        ),
+        supports_check_mode=True,
+    )
+
+    if not HAS_APPCENTER and not os.path.exists('/var/lib/dpkg/info/univention-appcenter.list'):
+        module.exit_json(changed=False, ansible_facts=dict(univention_apps={}),
+                         msg='Non-UCS-system detected. Nothing to do here.')
+
+    installed_apps = None
+    with timer.phase('discover'):
+        if HAS_APPCENTER:
+            try:
+                installed_apps = read_installed_apps()
+            except Exception as e:
+                module.warn('Reading the appcenter cache failed, using univention-app instead: {}'.format(e))
+        if installed_apps is None:
+            installed_apps = _get_installed_apps_cli(module, module.params['apps'])
+
+    if module.params['apps']:
+        installed_apps = dict(
+            (app_id, info) for app_id, info in installed_apps.items() if app_id in module.params['apps'])
+
+    if module.params['status']:
+        with timer.phase('status'):
+            app_status = probe_app_status(module, list(installed_apps))
+            for app_id, info in installed_apps.items():
+                info['status'] = app_status[app_id]['status']
+                info['service'] = dict(backend=app_status[app_id]['backend'], state=app_status[app_id]['state'])
+                if info['status'] == 'unknown':
+                    info['status'] = read_app_status_cli(module, app_id)
+
+    if module.params['configuration']:
+        with timer.phase('configuration'):
+            for app_id, info in installed_apps.items():
+                info['configuration'] = read_app_configuration(module, app_id)
+
+    module.exit_json(**add_profile(module, dict(
+        changed=False,
+        ansible_facts=dict(univention_apps=installed_apps),
+        msg='Found {} installed apps.'.format(len(installed_apps)),
+    )))
+
+
+if __name__ == '__main__':
+    run_module()
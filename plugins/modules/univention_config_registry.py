@@ -1,7 +1,18 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
+import bisect
 import datetime
+import fnmatch
+import json
+import os
+import re
+import subprocess
+import tempfile
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.common.arg_spec import ArgumentSpecValidator
+from ansible_collections.univention.ucs_modules.plugins.module_utils.profile import add_profile, timer
+from ansible_collections.univention.ucs_modules.plugins.module_utils.ucr import (
+    HAS_UCR, RegistryLock, RegistryLockTimeout, get_handlers, get_registry, invalidate_registry)
 
 ANSIBLE_METADATA = {
     'metadata_version': '1.1',
@@ -18,12 +29,21 @@ short_description: Accessing the Univention Config Registry
 description:
     - "You can set and unset keys in the Univention Config Registry."
 
+notes:
+    - Concurrent runs of this module changing keys on the same host are not
+      parallelized. The lock of the module is held for the whole
+      univention-config-registry call, which writes the keys and runs their
+      handlers, so the writes and handlers of concurrent runs are fully
+      serialized. The lock only prevents lost updates, a run started in
+      parallel waits for the handlers of the others, see 'lock_wait' and
+      'lock_held'.
+
 options:
     keys:
         description:
             - A dict of keys to set or unset. In case of unsetting, the values
               are ignored.
-            - Either this, 'kvlist' or 'commit' must be given.
+            - Either this, 'kvlist', 'key_patterns', 'src' or 'commit' must be given.
         type: str
         required: false
     kvlist:
@@ -32,8 +52,55 @@ options:
               a dict via 'keys'. Each of the dicts passed via 'kvlist' must
               contain the keys 'key' and 'value'. This allows the use of Jinja
               in the UCR keys to set/unset.
-            - Either this, 'keys' or 'commit' must be given.
+            - Either this, 'keys', 'key_patterns', 'src' or 'commit' must be given.
+        required: false
+    key_patterns:
+        description:
+            - A list of patterns selecting existing keys in the registry layer
+              given with 'layer'.
+            - With 'state=absent' all matching keys are unset, with
+              'state=present' all matching keys are set to 'value_template'.
+            - All matches are applied together with 'keys' and 'kvlist' in a
+              single write, so the handlers only run once.
+            - Either this, 'keys', 'kvlist', 'src' or 'commit' must be given.
+        type: list
+        required: false
+    pattern_type:
+        description:
+            - How the entries of 'key_patterns' are interpreted. 'glob' uses
+              shell-style wildcards, 'regex' uses regular expressions that are
+              matched against the beginning of the key.
+        type: str
+        choices: [ glob, regex ]
+        default: glob
+    value_template:
+        description:
+            - The value for all keys matched by 'key_patterns' with
+              'state=present'. The placeholders '{key}' and '{value}' are
+              replaced with the name and the current value of each key.
+        type: str
         required: false
+    src:
+        description:
+            - Path to a file on the managed host containing the keys to set or
+              unset. The file is read on the host, so large key sets do not
+              have to be transferred with the module arguments.
+            - Keys given with 'keys' or 'kvlist' take precedence over the keys
+              from the file.
+            - Either this, 'keys', 'kvlist', 'key_patterns' or 'commit' must be given.
+        type: path
+        required: false
+    src_format:
+        description:
+            - The format of the file given with 'src'. 'json' and 'yaml' files
+              must contain a single mapping, 'lines' files contain one
+              'key=value' pair per line. Empty lines and lines starting with
+              '#' are ignored.
+            - With 'auto' the format is chosen by the file extension, files
+              without '.json', '.yml' or '.yaml' extension are read as 'lines'.
+        type: str
+        choices: [ auto, json, yaml, lines ]
+        default: auto
     state:
         description:
             - Either 'present' for setting the key/value pairs given with
@@ -48,14 +115,82 @@ options:
             - When the force option is used in setting a local variable, settings
               adopted from the directory service and variables from the schedule level
               are overruled and the given value for the local system fixed instead.
+            - Same as 'layer=forced'.
         type: bool
         default: false
         required: false
+    layer:
+        description:
+            - The registry layer keys are set in or unset from, like the
+              `--ldap-policy`, `--force` and `--schedule` options of `ucr set`.
+            - Keys are compared against the value in this layer instead of the
+              merged registry view. Keys that are already defined in a layer
+              with higher priority (forced, then schedule, then ldap, then
+              normal) are not set, as the new value would not take effect.
+              They are reported in 'meta['shadowed_keys']'.
+            - Defaults to 'forced' with 'force=true' and to 'normal' otherwise.
+        type: str
+        choices: [ normal, ldap, forced, schedule ]
+        required: false
     commit:
         description:
             - A list of destination filenames as strings to be commited.
-            - Either this, 'keys' or 'kvlist' must be given.
+            - Either this, 'keys', 'kvlist', 'key_patterns' or 'src' must be given.
+        type: list
+        required: false
+    batch:
+        description:
+            - A list of items, each a dict with 'keys' or 'kvlist' and
+              optionally 'state', 'layer' and 'force'. Options missing in an
+              item are taken from the task.
+            - Consecutive items with the same state and layer are written by a
+              single ucr call, so the handlers of their keys only run once.
+              The result of every item is returned in 'results'.
+            - The action plugin of this module can also collect the items of a
+              'loop' into a batch, see 'coalesce_loop'.
         type: list
+        elements: dict
+        required: false
+    profile:
+        description:
+            - Return the time spent loading the registry, reading the keys,
+              comparing, writing and running the handlers in 'profile'.
+        type: bool
+        default: false
+        required: false
+    coalesce_loop:
+        description:
+            - Handled by the action plugin on the controller. If the task has a
+              'loop', all items are sent to the host as a single 'batch' with
+              the first item, and the result of every item is handed out from
+              it. Only the loop variable is available in the module arguments.
+        type: bool
+        default: false
+        required: false
+    commit_workers:
+        description:
+            - The maximum number of processes regenerating the files given
+              with 'commit' in parallel.
+            - Only files whose handler has no pre- or post-install module and
+              shares no destination file with another handler are generated
+              in parallel, all other files are commited one after another
+              afterwards.
+        type: int
+        default: 1
+        required: false
+    lock_timeout:
+        description:
+            - The seconds to wait for other runs of this module writing to the
+              registry. Keys are compared with the registry before and once
+              more after the lock is taken, only keys still differing are
+              written.
+            - Runs setting or unsetting different keys of the same host can
+              therefore be started in parallel, e.g. with the free strategy or
+              'async', without losing keys. They are not faster than running
+              them one after another, the lock is held while
+              univention-config-registry writes the keys and runs the handlers.
+        type: int
+        default: 300
         required: false
 
 author:
@@ -88,6 +223,13 @@ EXAMPLES = '''
     state: present
     force: true
 
+# Set a value in the LDAP policy layer
+- name: Set proxy like a UCR policy would
+  univention_config_registry:
+    keys:
+      proxy/http: http://myproxy.mydomain:3128
+    layer: ldap
+
 # Clear proxy configuration
 - name: Do not use a proxy
   univention_config_registry:
@@ -96,12 +238,63 @@ EXAMPLES = '''
       proxy/https:
     state: absent
 
+# Remove all DNS forwarders
+- name: Clear DNS forwarders
+  univention_config_registry:
+    key_patterns:
+      - dns/forwarder*
+    state: absent
+
+# Rewrite all matching keys at once
+- name: Mark static hosts entries in 192.168.0.0/16 as disabled
+  univention_config_registry:
+    key_patterns:
+      - '^hosts/static/192\\.168\\.'
+    pattern_type: regex
+    value_template: "{value}.disabled"
+
+# Import a baseline shipped to the host
+- name: Apply UCR baseline
+  univention_config_registry:
+    src: /etc/baseline/ucr.conf
+
 # Commit templates
 - name: Commit resolv.conf and aliases
     univention_config_registry:
     commit:
       - /etc/resolv.conf
       - /etc/aliases
+
+# Commit templates in parallel
+- name: Regenerate apache configuration
+  univention_config_registry:
+    commit:
+      - /etc/apache2/sites-available/default-ssl.conf
+      - /etc/apache2/sites-available/univention.conf
+      - /etc/apache2/ports.conf
+    commit_workers: 4
+
+# Set and unset several keys with one write each
+- name: Configure mail relay
+  univention_config_registry:
+    batch:
+      - keys:
+          mail/relayhost: "relay.example.com"
+          mail/relayauth: "yes"
+      - keys:
+          mail/smtpport: "587"
+      - keys:
+          mail/postfix/softbounce: ""
+        state: absent
+
+# Send all items of a loop to the host at once
+- name: Set the quota of every share
+  univention_config_registry:
+    kvlist:
+      - key: "quota/{{ item.name }}"
+        value: "{{ item.size }}"
+    coalesce_loop: true
+  loop: "{{ shares }}"
 '''
 
 RETURN = '''
@@ -111,17 +304,61 @@ meta['changed_keys']:
 meta['commited_templates']:
     description: A list of all templates that were changed
     type: array
+meta['matched_keys']:
+    description: A list of all key names that were matched by 'key_patterns'
+    type: array
+meta['shadowed_keys']:
+    description:
+        - A dict of the keys which were not set because a layer with higher
+          priority defines them, mapped to the name of that layer.
+    type: dict
+meta['handlers']:
+    description:
+        - The files to regenerate and the modules and scripts to run for the
+          changed keys or commited templates, as dict with the lists 'files',
+          'modules' and 'scripts'.
+        - Only returned in check mode.
+    type: dict
+lock_wait:
+    description:
+        - The seconds waited for other runs of this module writing to the
+          registry.
+        - Only returned when keys were changed.
+    type: float
+lock_held:
+    description:
+        - The seconds the lock was held, including the handlers run by
+          univention-config-registry. Other runs writing to the registry wait
+          this long.
+        - Only returned when keys were changed.
+    type: float
+handler_timings:
+    description:
+        - A list with one entry per handler that was run, containing the
+          'handler' type (File, Multifile, Module or Script), its 'target'
+          and the wall-clock 'delta' it took.
+        - Only returned when keys were changed or templates commited.
+    type: array
+profile:
+    description:
+        - The 'total' run time and the seconds and number of 'calls' of the
+          'phases' import, connect, discover, diff, write and handlers.
+        - Only returned with 'profile=true'.
+    type: dict
+results:
+    description:
+        - The result of every item of 'batch', in the same order, with
+          'changed', 'meta['changed_keys']', 'meta['shadowed_keys']' and
+          'message'.
+        - Only returned with 'batch'.
+    type: array
 message:
     description: A human-readable information about which keys where changed
 '''
 
-try:
-    from univention.config_registry.backend import ConfigRegistry
-    from univention.config_registry import configHandlers
-
-    have_config_registry = True
-except ImportError:
-    have_config_registry = False
+LAYER_NAMES = dict(normal='NORMAL', ldap='LDAP', schedule='SCHEDULE', forced='FORCED')
+LAYER_OPTIONS = dict(normal=[], ldap=['--ldap-policy'], schedule=['--schedule'], forced=['--force'])
+LAYER_PRIORITIES = ('forced', 'schedule', 'ldap', 'normal')
 
 
 def _commit_files(files, result, module):
@@ -133,6 +370,8 @@ def _commit_files(files, result, module):
     if module.check_mode:
         if len(files) > 0:
             result['message'] = "These files will be commited: {}".format(" ".join(files))
+            ucr_handlers = get_handlers()
+            result['meta']['handlers'] = _describe_handlers(_file_handlers(ucr_handlers, files))
         return
 
     if not result['changed']:
@@ -140,16 +379,35 @@ def _commit_files(files, result, module):
 
     startd = datetime.datetime.now()
 
-    ucr = ConfigRegistry()
-    ucr.load()
-
-    ucr_handlers = configHandlers()
-    ucr_handlers.load()
+    ucr = get_registry()
+    ucr_handlers = get_handlers()
     ucr_handlers.update()
 
-    ucr_handlers.commit(ucr, files)
+    parallel, serial = _group_independent_files(ucr_handlers, files)
+    if module.params['commit_workers'] < 2 or len(parallel) < 2:
+        parallel, serial = [], [files]
+
+    global _COMMIT_CONTEXT
+    _COMMIT_CONTEXT = (ucr, ucr_handlers)
+
+    result['handler_timings'] = []
+    handlers_startd = datetime.datetime.now()
+    if parallel:
+        import multiprocessing
+        pool = multiprocessing.Pool(min(module.params['commit_workers'], len(parallel)))
+        try:
+            for timings in pool.map(_commit_group, parallel):
+                result['handler_timings'] += timings
+        except Exception as e:
+            module.fail_json(msg='Commiting the templates failed: {0}'.format(e), **result)
+        finally:
+            pool.close()
+            pool.join()
+    for group in serial:
+        result['handler_timings'] += _commit_group(group)
 
     endd = datetime.datetime.now()
+    timer.add('handlers', (endd - handlers_startd).total_seconds())
     result['start'] = str(startd)
     result['end'] = str(endd)
     result['delta'] = str(endd - startd)
@@ -162,23 +420,284 @@ def _commit_files(files, result, module):
     #     module.fail_json(msg='non-zero return code', **result)
 
 
-def _set_keys(keys, result, module):
-    ucr = ConfigRegistry()
-    ucr.load()
+def _read_src(path, src_format):
+    '''Yield the key/value pairs from a file on the managed host
+
+    The keys and values of 'lines' files are stripped of surrounding
+    whitespace. The values of JSON and YAML files are converted to strings,
+    except for booleans and None.
+    '''
+    if src_format == 'auto':
+        extension = os.path.splitext(path)[1].lower()
+        src_format = {'.json': 'json', '.yml': 'yaml', '.yaml': 'yaml'}.get(extension, 'lines')
+
+    with open(path) as src:
+        if src_format == 'lines':
+            for number, line in enumerate(src, 1):
+                line = line.rstrip('\r\n')
+                if not line.strip() or line.lstrip().startswith('#'):
+                    continue
+                key, sep, value = line.partition('=')
+                if not sep or not key.strip():
+                    raise ValueError('line {0} is not a key=value pair'.format(number))
+                yield key.strip(), value.strip()
+            return
+
+        if src_format == 'json':
+            data = json.load(src)
+        else:
+            import yaml
+            try:
+                data = yaml.safe_load(src)
+            except yaml.YAMLError as e:
+                raise ValueError(str(e))
+
+    if not isinstance(data, dict):
+        raise ValueError('the file does not contain a mapping')
+    for key, value in data.items():
+        # UCR values are strings, only booleans are kept to be compared with is_true and is_false
+        if isinstance(value, (dict, list)):
+            raise ValueError('the value of "{0}" is not a scalar'.format(key))
+        if value is not None and not isinstance(value, bool):
+            value = str(value)
+        yield str(key), value
+
+
+def _literal_prefix(pattern, regex):
+    '''Return the literal part a glob or regex pattern starts with'''
+    if regex:
+        if '|' in pattern:
+            return ''
+        pattern = pattern[1:] if pattern.startswith('^') else pattern
+        metachars = '.^$*+?{}[]\\|()'
+        quantifiers = '*?{'
+    else:
+        metachars = '*?['
+        quantifiers = ''
+    for index, char in enumerate(pattern):
+        if char in quantifiers:
+            return pattern[:max(index - 1, 0)]
+        if char in metachars:
+            return pattern[:index]
+    return pattern
+
+
+def _layer_registry(ucr, layer):
+    '''Return the registry of a single layer of a loaded ConfigRegistry'''
+    return ucr._registry[getattr(type(ucr), LAYER_NAMES[layer])]
+
+
+def _shadowing_layer(ucr, key, layer):
+    '''Return the name of the layer with higher priority defining the key'''
+    for name in LAYER_PRIORITIES:
+        if name == layer:
+            return None
+        if key in _layer_registry(ucr, name):
+            return name
+
+
+def _match_key_patterns(patterns, regex, layer):
+    '''Return all keys of the layer matching one of the patterns
+
+    The sorted key list serves as prefix index: every pattern only looks at
+    the keys starting with its literal prefix.
+    '''
+    registry = _layer_registry(get_registry(), layer)
+
+    index = sorted(registry.keys())
+    matched = []
+    for pattern in patterns:
+        prefix = _literal_prefix(pattern, regex)
+        match = re.compile(pattern if regex else fnmatch.translate(pattern)).match
+        position = bisect.bisect_left(index, prefix)
+        while position < len(index) and index[position].startswith(prefix):
+            key = index[position]
+            if key not in matched and match(key):
+                matched.append(key)
+            position += 1
+    return matched, registry
+
+
+_COMMIT_CONTEXT = None
+
+
+def _commit_group(files):
+    '''Commit the files one after another and return the time each one took
+
+    Runs in the worker processes of the pool as well, the registry and the
+    handlers are inherited from the parent through _COMMIT_CONTEXT.
+    '''
+    ucr, ucr_handlers = _COMMIT_CONTEXT
+    timings = []
+    for fname in files:
+        startd = datetime.datetime.now()
+        ucr_handlers.commit(ucr, [fname])
+        timings.append(dict(handler='File', target=fname, delta=str(datetime.datetime.now() - startd)))
+    return timings
+
+
+def _group_independent_files(ucr_handlers, files):
+    '''Split the files into groups which can be generated in parallel
+
+    Files of the same handler, e.g. a multifile, form one group. Files whose
+    handler runs pre- or post-install modules, or which are unknown to the
+    handlers, are returned as a single serial group in the requested order.
+    '''
+    groups = {}
+    serial = []
+    for fname in files:
+        handlers = _file_handlers(ucr_handlers, [fname])
+        if len(handlers) != 1:
+            serial.append(fname)
+            continue
+        handler = handlers.pop()
+        if getattr(handler, 'preinst', None) or getattr(handler, 'postinst', None):
+            serial.append(fname)
+            continue
+        groups.setdefault(handler.to_file, []).append(fname)
+    return list(groups.values()), [serial] if serial else []
+
+
+def _variable_handlers(ucr_handlers, variables):
+    '''Return the handlers registered for changes of the given variables'''
+    pending = set()
+    for pattern, handlers in getattr(ucr_handlers, '_handlers', {}).items():
+        match = re.compile(pattern).match
+        if any(match(variable) for variable in variables):
+            pending |= set(handlers)
+    return pending
+
+
+def _file_handlers(ucr_handlers, files):
+    '''Return the handlers generating the given destination files'''
+    handlers = set()
+    for fname in files:
+        fname = os.path.expanduser(fname)
+        for registry in ('_files', '_multifiles'):
+            handler = getattr(ucr_handlers, registry, {}).get(fname)
+            if handler is not None:
+                handlers.add(handler)
+    return handlers
+
+
+def _describe_handlers(handlers):
+    '''Return the files, modules and scripts touched by the given handlers'''
+    preview = dict(files=set(), modules=set(), scripts=set())
+    for handler in handlers:
+        if getattr(handler, 'to_file', None):
+            preview['files'].add(handler.to_file)
+        if getattr(handler, 'script', None):
+            preview['scripts'].add(handler.script)
+        for attr in ('module', 'preinst', 'postinst'):
+            if getattr(handler, attr, None):
+                preview['modules'].add(getattr(handler, attr))
+    return dict((kind, sorted(names)) for kind, names in preview.items())
+
+
+def _preview_keys(keys, result):
+    ucr_handlers = get_handlers()
+    result['meta']['handlers'] = _describe_handlers(_variable_handlers(ucr_handlers, keys))
+
+
+HANDLER_LINE = re.compile(r'^(File|Multifile|Module|Script): (.+)$')
+
+
+def _run_ucr(args, result):
+    '''Run ucr and time its handlers by their progress messages
+
+    Every handler prints a line like "File: /etc/hosts" when it starts, so
+    the time until the next handler line or the end of the process is the
+    wall-clock time spent in that handler. The time before the first handler
+    is accounted as write phase.
+    '''
+    timings = []
+    out = []
+    env = dict(os.environ, PYTHONUNBUFFERED='1')
+    startd = datetime.datetime.now()
+    with tempfile.TemporaryFile() as err_file:
+        process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=err_file, env=env,
+                                   universal_newlines=True)
+        for line in iter(process.stdout.readline, ''):
+            now = datetime.datetime.now()
+            out.append(line)
+            match = HANDLER_LINE.match(line.rstrip('\r\n'))
+            if match:
+                timings.append((match.group(1), match.group(2), now))
+        process.stdout.close()
+        rc = process.wait()
+        endd = datetime.datetime.now()
+        err_file.seek(0)
+        err = err_file.read().decode('utf-8', 'replace')
+
+    invalidate_registry()
+    handlers_startd = timings[0][2] if timings else endd
+    timer.add('write', (handlers_startd - startd).total_seconds())
+    timer.add('handlers', (endd - handlers_startd).total_seconds())
+
+    ends = [timing[2] for timing in timings[1:]] + [endd]
+    result['handler_timings'] = [
+        dict(handler=handler, target=target, delta=str(end - start))
+        for (handler, target, start), end in zip(timings, ends)
+    ]
+    return rc, ''.join(out), err
+
+
+def _lock_registry(module, result):
+    '''Take the lock of the writing module runs and read the registry again,
+    other runs may have written to it since it was loaded'''
+    lock = RegistryLock()
+    try:
+        waited = lock.acquire(module.params['lock_timeout'])
+    except (IOError, OSError, RegistryLockTimeout) as e:
+        module.fail_json(msg='Locking the registry failed: {0}'.format(e), **result)
+    result['lock_wait'] = round(result.get('lock_wait', 0.0) + waited, 6)
+    invalidate_registry()
+    return lock
+
+
+def _unlock_registry(lock, result):
+    '''Release the lock, the seconds it was held include the handlers run by ucr'''
+    result['lock_held'] = round(result.get('lock_held', 0.0) + lock.release(), 6)
+
+
+def _diff_keys(keys, layer):
+    '''Return the keys whose value differs from the layer, without those
+    shadowed by a layer with higher priority, and the shadowed keys mapped to
+    the name of that layer'''
+    ucr = get_registry()
+    registry = _layer_registry(ucr, layer)
 
     def needs_change(key):
-        if key not in ucr:
+        if key not in registry:
             return True
         if isinstance(keys[key], bool):
-            if keys[key] and not ucr.is_true(key):
+            if keys[key] and not ucr.is_true(value=registry[key]):
                 return True
-            elif not keys[key] and not ucr.is_false(key):
+            elif not keys[key] and not ucr.is_false(value=registry[key]):
                 return True
-        elif ucr[key] != keys[key]:
+        elif registry[key] != keys[key]:
             return True
         return False
 
-    to_set = list(filter(needs_change, keys))
+    to_set = []
+    shadowed_keys = {}
+    with timer.phase('diff'):
+        for key in filter(needs_change, keys):
+            shadowing_layer = _shadowing_layer(ucr, key, layer)
+            if shadowing_layer:
+                shadowed_keys[key] = shadowing_layer
+            else:
+                to_set.append(key)
+    return to_set, shadowed_keys
+
+
+def _set_keys(keys, result, module):
+    to_set, shadowed_keys = _diff_keys(keys, module.params['layer'])
+    result['meta']['shadowed_keys'].update(shadowed_keys)
+
+    if result['meta']['shadowed_keys']:
+        module.warn("These keys are not set because they are shadowed by a layer with higher priority: {}".format(
+            " ".join(sorted(result['meta']['shadowed_keys']))))
 
     result['changed'] = len(to_set) > 0
     if not result['changed']:
@@ -187,17 +706,31 @@ def _set_keys(keys, result, module):
     if module.check_mode:
         if len(to_set) > 0:
             result['message'] = "These keys need to be set: {}".format(" ".join(to_set))
+            result['meta']['changed_keys'] = to_set
+            _preview_keys(to_set, result)
         return
 
     if not result['changed']:
         return
 
-    args = ["/usr/sbin/univention-config-registry", "set"] + ["{0}={1}".format(key, keys[key]) for key in to_set]
-    if module.params["force"]:
-        args.insert(2, "--force")
-    startd = datetime.datetime.now()
-
-    rc, out, err = module.run_command(args)
+    lock = _lock_registry(module, result)
+    try:
+        # only the keys still differing are written, keys written by other runs in between are kept
+        to_set, shadowed_keys = _diff_keys(dict((key, keys[key]) for key in to_set), module.params['layer'])
+        result['meta']['shadowed_keys'].update(shadowed_keys)
+        if not to_set:
+            result['changed'] = False
+            result['message'] = "No keys need to be set"
+            return
+
+        args = ["/usr/sbin/univention-config-registry", "set"]
+        args += ["{0}={1}".format(key, keys[key]) for key in to_set]
+        args[2:2] = LAYER_OPTIONS[module.params['layer']]
+        startd = datetime.datetime.now()
+
+        rc, out, err = _run_ucr(args, result)
+    finally:
+        _unlock_registry(lock, result)
 
     endd = datetime.datetime.now()
     result['start'] = str(startd)
@@ -215,10 +748,10 @@ def _set_keys(keys, result, module):
 
 
 def _unset_keys(keys, result, module):
-    ucr = ConfigRegistry()
-    ucr.load()
+    registry = _layer_registry(get_registry(), module.params['layer'])
 
-    to_unset = [key for key in keys if key in ucr]
+    with timer.phase('diff'):
+        to_unset = [key for key in keys if key in registry]
     result['changed'] = len(to_unset) > 0
 
     if not result['changed']:
@@ -227,17 +760,29 @@ def _unset_keys(keys, result, module):
     if module.check_mode:
         if len(to_unset) > 0:
             result['message'] = "These keys need to be unset: {}".format(" ".join(to_unset))
+            result['meta']['changed_keys'] = to_unset
+            _preview_keys(to_unset, result)
         return
 
     if not result['changed']:
         return
 
-    args = ["/usr/sbin/univention-config-registry", "unset"] + to_unset
-    if module.params["force"]:
-        args.insert(2, "--force")
-    startd = datetime.datetime.now()
+    lock = _lock_registry(module, result)
+    try:
+        registry = _layer_registry(get_registry(), module.params['layer'])
+        to_unset = [key for key in to_unset if key in registry]
+        if not to_unset:
+            result['changed'] = False
+            result['message'] = "No keys need to be unset"
+            return
 
-    rc, out, err = module.run_command(args)
+        args = ["/usr/sbin/univention-config-registry", "unset"] + to_unset
+        args[2:2] = LAYER_OPTIONS[module.params['layer']]
+        startd = datetime.datetime.now()
+
+        rc, out, err = _run_ucr(args, result)
+    finally:
+        _unlock_registry(lock, result)
 
     endd = datetime.datetime.now()
     result['start'] = str(startd)
@@ -254,34 +799,139 @@ def _unset_keys(keys, result, module):
         module.fail_json(msg='non-zero return code', **result)
 
 
+BATCH_ITEM_OPTIONS = ('keys', 'name', 'key', 'kvlist', 'state', 'layer', 'force')
+
+
+def _validate_batch_item(index, item, result, module):
+    '''Return the options of a batch item converted to the types of the
+    argument_spec, without defaults, as the missing ones are taken from the task'''
+    unknown = sorted(set(item) - set(BATCH_ITEM_OPTIONS))
+    if unknown:
+        module.fail_json(msg='Only {0} can be given in "batch" items, not {1}.'.format(
+            ', '.join(BATCH_ITEM_OPTIONS), ', '.join(unknown)), **result)
+    item_spec = dict(
+        (name, dict((key, value) for key, value in module.argument_spec[name].items() if key != 'default'))
+        for name in ('keys', 'kvlist', 'state', 'layer', 'force'))
+    validation = ArgumentSpecValidator(item_spec).validate(item)
+    if validation.error_messages:
+        module.fail_json(msg='Invalid batch item {0}: {1}'.format(
+            index, '; '.join(validation.error_messages)), **result)
+    options = dict(
+        (name, value) for name, value in validation.validated_parameters.items()
+        if name in item_spec and value is not None)
+    for entry in options.get('kvlist') or []:
+        if not isinstance(entry, dict) or 'key' not in entry or 'value' not in entry:
+            module.fail_json(msg='Invalid batch item {0}: every "kvlist" entry needs "key" and "value"'.format(
+                index), **result)
+    if options.get('force') and options.get('layer') not in (None, 'forced'):
+        module.fail_json(msg='Invalid batch item {0}: "force" can only be combined with "layer: forced".'.format(
+            index), **result)
+    return options
+
+
+def _run_batch(batch, result, module):
+    '''Set and unset the keys of a list of items with as few writes as possible
+
+    Consecutive items with the same state and layer are merged, so their keys
+    are written by a single ucr call and every handler only runs once. The
+    result of every item is returned in the same order in 'results'.
+    '''
+    runs = []
+    for index, item in enumerate(batch):
+        item = _validate_batch_item(index, item, result, module)
+        keys = dict(item.get('keys') or {})
+        for entry in item.get('kvlist') or []:
+            keys[entry['key']] = entry['value']
+        state = item.get('state') or module.params['state']
+        layer = item.get('layer') or ('forced' if item.get('force') else module.params['layer'])
+        if runs and runs[-1]['state'] == state and runs[-1]['layer'] == layer:
+            runs[-1]['keys'].update(keys)
+            runs[-1]['items'].append(keys)
+        else:
+            runs.append(dict(state=state, layer=layer, keys=dict(keys), items=[keys]))
+
+    result['results'] = []
+    writes = 0
+    for run in runs:
+        # a failing write returns the results of the items written before it
+        run_result = dict(
+            changed=False,
+            meta=dict(changed_keys=[], commited_templates=[], matched_keys=[], shadowed_keys={}),
+            message='',
+            results=result['results'],
+        )
+        module.params['layer'] = run['layer']
+        if run['state'] == 'present':
+            _set_keys(run['keys'], run_result, module)
+        else:
+            _unset_keys(run['keys'], run_result, module)
+        writes += 1 if run_result['changed'] else 0
+        for item_keys in run['items']:
+            changed_keys = [key for key in item_keys if key in run_result['meta']['changed_keys']]
+            shadowed_keys = dict(
+                (key, layer) for key, layer in run_result['meta']['shadowed_keys'].items() if key in item_keys)
+            result['results'].append(dict(
+                changed=len(changed_keys) > 0,
+                meta=dict(changed_keys=changed_keys, shadowed_keys=shadowed_keys),
+                message=run_result['message'] if changed_keys else 'No keys need to be changed',
+            ))
+        result['changed'] = result['changed'] or run_result['changed']
+        result['meta']['changed_keys'].extend(run_result['meta']['changed_keys'])
+        result['meta']['shadowed_keys'].update(run_result['meta']['shadowed_keys'])
+        result['meta'].setdefault('handlers', {}).update(run_result['meta'].get('handlers', {}))
+        result.setdefault('handler_timings', []).extend(run_result.get('handler_timings', []))
+        for lock_time in ('lock_wait', 'lock_held'):
+            if lock_time in run_result:
+                result[lock_time] = round(result.get(lock_time, 0.0) + run_result[lock_time], 6)
+
+    result['message'] = '{0} of {1} items {2} {3} keys in {4} writes'.format(
+        len([item for item in result['results'] if item['changed']]), len(batch),
+        'would change' if module.check_mode else 'change', len(result['meta']['changed_keys']), writes)
+
+
 def run_module():
     # define available arguments/parameters a user can pass to the module
     module_args = dict(
         keys=dict(type='dict', aliases=['name', 'key']),
         kvlist=dict(type='list'),
+        key_patterns=dict(type='list'),
+        pattern_type=dict(type='str', default='glob', choices=['glob', 'regex']),
+        value_template=dict(type='str'),
+        src=dict(type='path'),
+        src_format=dict(type='str', default='auto', choices=['auto', 'json', 'yaml', 'lines']),
         state=dict(type='str', default='present', choices=['present', 'absent']),
         commit=dict(type='list'),
         force=dict(type='bool', default=False),
+        layer=dict(type='str', choices=['normal', 'ldap', 'forced', 'schedule']),
+        commit_workers=dict(type='int', default=1),
+        lock_timeout=dict(type='int', default=300),
+        batch=dict(type='list', elements='dict'),
+        profile=dict(type='bool', default=False),
     )
 
     module = AnsibleModule(
         argument_spec=module_args,
+        mutually_exclusive=[['batch', option] for option in ('keys', 'kvlist', 'key_patterns', 'src', 'commit')],
         supports_check_mode=True
     )
 
     result = dict(
         changed=False,
-        meta=dict(changed_keys=[], commited_templates=[]),
+        meta=dict(changed_keys=[], commited_templates=[], matched_keys=[], shadowed_keys={}),
         message=''
     )
 
-    if not have_config_registry:
+    if not HAS_UCR:
         module.fail_json(msg='The Python "univention.config_registry.backend" is not available', **result)
 
     if not (('keys' in module.params and module.params['keys'])
             or ('kvlist' in module.params and module.params['kvlist'])
-            or ('commit' in module.params and module.params['commit'])):
-        module.fail_json(msg='Either "keys", "kvlist" or "commit" is required.', **result)
+            or ('key_patterns' in module.params and module.params['key_patterns'])
+            or ('src' in module.params and module.params['src'])
+            or ('commit' in module.params and module.params['commit'])
+            or ('batch' in module.params and module.params['batch'])):
+        module.fail_json(msg='Either "keys", "kvlist", "key_patterns", "src", "commit" or "batch" is required.',
+                         **result)
 
     state = module.params['state']
     keys = module.params['keys'] if 'keys' in module.params and module.params['keys'] else dict()
@@ -294,7 +944,48 @@ def run_module():
     if (state != 'present') and (state != 'absent'):
         module.fail_json(msg='The state "{0}" is invalid'.format(state), **result)
 
-    if len(keys) != 0:
+    if module.params['force'] and module.params['layer'] not in (None, 'forced'):
+        module.fail_json(msg='"force" can only be combined with "layer: forced".', **result)
+    if module.params['layer'] is None:
+        module.params['layer'] = 'forced' if module.params['force'] else 'normal'
+
+    if module.params['batch']:
+        _run_batch(module.params['batch'], result, module)
+        module.exit_json(**add_profile(module, result))
+
+    if module.params['src']:
+        try:
+            with timer.phase('discover'):
+                for key, value in _read_src(module.params['src'], module.params['src_format']):
+                    if value is None and state == 'present':
+                        raise ValueError('"{0}" has no value'.format(key))
+                    keys.setdefault(key, value)
+        except (IOError, OSError, ValueError) as e:
+            module.fail_json(msg='Unable to read "{0}": {1}'.format(module.params['src'], e), **result)
+        except ImportError:
+            module.fail_json(msg='The Python "yaml" module is required to read YAML files', **result)
+
+    key_patterns = module.params['key_patterns'] or list()
+    if key_patterns:
+        if state == 'present' and module.params['value_template'] is None:
+            module.fail_json(msg='"value_template" is required to set keys matched by "key_patterns".', **result)
+        try:
+            with timer.phase('discover'):
+                matched, registry = _match_key_patterns(
+                    key_patterns, module.params['pattern_type'] == 'regex', module.params['layer'])
+        except re.error as e:
+            module.fail_json(msg='Invalid pattern in "key_patterns": {0}'.format(e), **result)
+        result['meta']['matched_keys'] = matched
+        try:
+            for key in matched:
+                if key not in keys and state == 'present':
+                    keys[key] = module.params['value_template'].format(key=key, value=registry.get(key, ''))
+                elif key not in keys:
+                    keys[key] = None
+        except (IndexError, KeyError, ValueError) as e:
+            module.fail_json(msg='Invalid "value_template": {0}'.format(e), **result)
+
+    if len(keys) != 0 or key_patterns:
         if state == 'present':
             _set_keys(keys, result, module)
         else:
@@ -304,7 +995,7 @@ def run_module():
     else:
         module.fail_json(msg='Missing keys or files', **result)
 
-    module.exit_json(**result)
+    module.exit_json(**add_profile(module, result))
 
 
 if __name__ == '__main__':
@@ -28,8 +28,9 @@ options:
     module:
         description:
             - The udm module for which objects are to be modified
+            - Required unless every item of 'batch' gives its own module.
         type: str
-        required: True
+        required: False
     position:
         description:
             - The position in the tree
@@ -53,6 +54,30 @@ options:
         type: str
         choices: [ absent, present ]
         default: present
+    recursive:
+        description:
+            - With state absent, remove the objects together with all
+              objects below them.
+            - The subtree is read once with a paged search for the DNs only
+              and removed leaves-first, one depth after another. Objects of no
+              UDM module are removed directly from LDAP.
+            - The number of objects found and removed is returned in
+              'progress'. If a removal fails, the DNs still to be removed are
+              returned in 'remaining', running the task again continues with
+              them.
+        type: bool
+        default: False
+        required: False
+    remove_workers:
+        description:
+            - The maximum number of connections removing the objects of one
+              depth in parallel with 'recursive'.
+            - The connections are used from threads of the module process. More
+              than 1 relies on univention.admin and python-ldap being
+              thread-safe with one connection per thread.
+        type: int
+        default: 1
+        required: False
     superordinate:
         description:
             - When creating a new object, set its superordinate to this DN.
@@ -72,6 +97,49 @@ options:
             - The listed properties of the objects are to be unset.
         type: list
         required: False
+    batch:
+        description:
+            - A list of dicts with the options of this module, except 'batch'.
+              Options missing in an item are taken from the task.
+            - All items are created, modified or removed one after another
+              with a single UDM connection. The result of every item is
+              returned in the same order in 'results'.
+            - The action plugin of this module can also collect the items of a
+              'loop' into a batch, see 'coalesce_loop'.
+        type: list
+        elements: dict
+        required: False
+    validate_properties:
+        description:
+            - Check the names of the properties to set and unset, whether
+              lists are only given for multi-valued properties and the values
+              against the syntax of their property, for all items before the
+              first object is written. If one is invalid, no object is written.
+            - The property metadata of the UDM modules is cached on the host
+              until UDM is updated. Syntaxes needing more than the value, e.g.
+              an LDAP connection, are only checked by UDM when saving.
+            - The values are checked as given, before the encoders of the
+              module convert them, so values only valid after encoding, e.g.
+              dates or booleans, are rejected.
+        type: bool
+        default: False
+        required: False
+    profile:
+        description:
+            - Return the time spent connecting to UDM, searching, comparing
+              and writing the objects in 'profile'.
+        type: bool
+        default: False
+        required: False
+    coalesce_loop:
+        description:
+            - Handled by the action plugin on the controller. If the task has a
+              'loop', all items are sent to the host as a single 'batch' with
+              the first item, and the result of every item is handed out from
+              it. Only the loop variable is available in the module arguments.
+        type: bool
+        default: False
+        required: False
 
 author:
     - Lukas Zumvorde
@@ -135,6 +203,15 @@ EXAMPLES = r'''
       - property: 'password'
         value: 'mypassword'
 
+# delete an OU with everything below it
+- name: delete a test OU
+  univention_directory_manager:
+    module: 'container/ou'
+    state: 'absent'
+    dn: 'ou=TESTSCHOOL,dc=t1,dc=intranet'
+    recursive: true
+    remove_workers: 4
+
 # delete on very specific object
 - name: delete the user with position
   univention_directory_manager:
@@ -161,6 +238,36 @@ EXAMPLES = r'''
     unset_properties:
       - property: 'firstname'
         value: 'does not matter'
+
+# create several users with one UDM connection
+- name: create users
+  univention_directory_manager:
+    module: 'users/user'
+    state: 'present'
+    batch:
+      - set_properties:
+          - property: 'username'
+            value: 'testuser4'
+          - property: 'lastname'
+            value: 'testuser4'
+      - set_properties:
+          - property: 'username'
+            value: 'testuser5'
+          - property: 'lastname'
+            value: 'testuser5'
+
+# send all items of a loop to the host at once
+- name: create users from a list
+  univention_directory_manager:
+    module: 'users/user'
+    state: 'present'
+    set_properties:
+      - property: 'username'
+        value: '{{ item }}'
+      - property: 'lastname'
+        value: '{{ item }}'
+    coalesce_loop: true
+  loop: '{{ usernames }}'
 '''
 
 RETURN = r'''
@@ -172,23 +279,49 @@ meta['removed']:
     description: The removed object and his attributes.
 meta['modified']:
     description: The modified object and his changed attributes.
+profile:
+    description:
+        - The 'total' run time and the seconds and number of 'calls' of the
+          'phases' import, connect, validate, discover, diff and write.
+        - Only returned with 'profile=true'.
+progress:
+    description:
+        - The number of objects in the subtrees, 'total', and of the objects
+          removed, 'removed'.
+        - Only returned with 'recursive'.
+remaining:
+    description:
+        - The DNs still to be removed in the order they would have been
+          removed, leaves first.
+        - Only returned if a removal with 'recursive' failed.
+failures:
+    description:
+        - The 'dn' and 'error' of the removals that failed with 'recursive'.
+        - Only returned if a removal with 'recursive' failed.
+errors:
+    description:
+        - The 'module', 'property' and 'error' of every invalid property, with
+          the index of the 'item' of 'batch'.
+        - Only returned if the validation of the properties failed.
+results:
+    description:
+        - The result of every item of 'batch', in the same order, with
+          'changed', 'meta' and 'msg'.
+        - Only returned with 'batch'.
 msg:
     description: A human-readable information about which objects were changed.
 '''
 
+import copy # noqa E402
 import traceback # noqa F401
 
 from ansible.module_utils.basic import AnsibleModule  # noqa F401
+from ansible.module_utils.common.arg_spec import ArgumentSpecValidator  # noqa F401
 from ansible.module_utils.common.text.converters import to_native  # noqa F401
-
-UDM_IMP_ERR = None
-try:
-    import univention.udm
-
-    HAS_UDM = True
-except ModuleNotFoundError:
-    HAS_UDM = False
-    UDM_IMP_ERR = traceback.format_exc()
+from ansible_collections.univention.ucs_modules.plugins.module_utils.profile import add_profile, timer  # noqa F401
+from ansible_collections.univention.ucs_modules.plugins.module_utils.udm import (  # noqa F401
+    check_value, get_connection, get_module, get_properties, import_udm, outermost_dns, remove_subtree,
+    search_subtree_dns, udm_exceptions)
 
 
 class UDMAnsibleModule():
@@ -218,6 +351,52 @@ class UDMAnsibleModule():
         # Class
         self.ansible_module = module
         self.ansible_params = module.params
+        # the results of the finished items while running a batch
+        self.batch_results = None
+
+    def _reset(self):
+        self._changes = dict(
+            new={},
+            old={},
+        )
+        self.changed_objects = []
+        self.result = dict(
+            changed=False,
+            meta=dict(
+                changed_objects=self.changed_objects,
+                created={},
+                removed={},
+                modified={},
+                ),
+            msg='',
+        )
+
+    def _fail_json(self):
+        """Fail with the result of the current item and the results of the
+        items of the batch that were already run"""
+        if self.batch_results is not None:
+            self.ansible_module.fail_json(results=self.batch_results, **self.result)
+        self.ansible_module.fail_json(**self.result)
+
+    def _validate_item(self, index, item):
+        """
+        :params: index : the position of the item in batch
+        :params: item : the options of one item of batch
+        :returns: the options converted to the types of the argument_spec
+        """
+        # no defaults, the options missing in the item are taken from the task
+        item_spec = dict(
+            (name, dict((key, value) for key, value in spec.items() if key != 'default'))
+            for name, spec in self.ansible_module.argument_spec.items() if name != 'batch')
+        unknown = sorted(key for key in item if key not in item_spec)
+        if unknown:
+            self.result['msg'] = "Invalid options in batch item {}: {}".format(index, ', '.join(unknown))
+            self._fail_json()
+        validation = ArgumentSpecValidator(item_spec).validate(item)
+        if validation.error_messages:
+            self.result['msg'] = "Invalid batch item {}: {}".format(index, '; '.join(validation.error_messages))
+            self._fail_json()
+        return dict((name, validation.validated_parameters[name]) for name in item)
 
     def _try_function(self, func, *args, **kwargs):
         """Execute the given function and handle exceptions"""
@@ -226,30 +405,31 @@ class UDMAnsibleModule():
         except Exception as e:
             self.result['msg'] = to_native(e)
             self.result['exception'] = traceback.format_exc()
-            self.ansible_module.fail_json(**self.result)
+            self._fail_json()
 
     def _check_univention_import_errors(self):
-        if not HAS_UDM:
+        import_error = import_udm()
+        if import_error:
             self.result['msg'] = "The python module 'univention.udm' is not available."
-            self.result['exception'] = UDM_IMP_ERR
-            self.ansible_module.fail_json(**self.result)
+            self.result['exception'] = import_error
+            self._fail_json()
 
     def _get_udm_connection(self):
         try:
-            udm_con = univention.udm.UDM.admin().version(self.udm_api_version)
-        except univention.udm.exceptions.ConnectionError:
+            udm_con = get_connection(self.udm_api_version)
+        except udm_exceptions.ConnectionError:
             self.result['msg'] = "Does your user have access to '/etc/ldap.secret'?"
             self.result['exception'] = traceback.format_exc()
-            self.ansible_module.fail_json(**self.result)
+            self._fail_json()
         return udm_con
 
     def _get_udm_module(self, udm_con, udm_module):
         try:
-            _udm_module = udm_con.get(udm_module)
-        except univention.udm.exceptions.UnknownModuleType:
+            _udm_module = get_module(self.udm_api_version, udm_module)
+        except udm_exceptions.UnknownModuleType:
             self.result['msg'] = "UDM not up to date? Module '{}' not found.".format(udm_module)
             self.result['exception'] = traceback.format_exc()
-            self.ansible_module.fail_json(**self.result)
+            self._fail_json()
         return _udm_module
 
     def _extract_properties_from_dn(self):
@@ -266,7 +446,7 @@ class UDMAnsibleModule():
             self.ansible_params['position'] = position
         except IndexError:
             self.result['msg'] = 'Invalid parameter dn'
-            self.ansible_module.fail_json(**self.result)
+            self._fail_json()
 
     def _get_object_by_property(self):
         try:
@@ -275,9 +455,9 @@ class UDMAnsibleModule():
                     return self.udm_module.get_by_id(prop['value'])
             else:
                 return None
-        except univention.udm.exceptions.NoObject:
+        except udm_exceptions.NoObject:
             return None
-        except univention.udm.exceptions.MultipleObjects:
+        except udm_exceptions.MultipleObjects:
             return None
         except TypeError:
             return None
@@ -376,9 +556,10 @@ class UDMAnsibleModule():
                 prop_value = attr['value']
                 self._set_property(obj, prop_name, prop_value)
         if not self.ansible_module.check_mode:
-            self._try_function(
-                obj.save
-            )
+            with timer.phase('write'):
+                self._try_function(
+                    obj.save
+                )
             self.changed_objects.append(obj.dn)
             self._set_changes(obj, obj.dn, 'new')
 
@@ -398,18 +579,45 @@ class UDMAnsibleModule():
                 if prop_name == "password":
                     self._set_property(obj, "overridePWHistory", "1")
         if not self.ansible_module.check_mode:
-            self._try_function(
-                obj.save
-            )
+            with timer.phase('write'):
+                self._try_function(
+                    obj.save
+                )
             self.changed_objects.append(obj.dn)
             self._set_changes(obj, obj.dn, 'new')
 
+    def _remove_subtree(self, obj):
+        """Remove the object and all objects below it, leaves first"""
+        with timer.phase('discover'):
+            dns = list(search_subtree_dns(self.udm_api_version, obj.dn))
+        progress = self.result.setdefault('progress', dict(total=0, removed=0))
+        progress['total'] += len(dns)
+        if self.ansible_module.check_mode:
+            self.result['msg'] = "{} objects would be removed".format(progress['total'])
+            return
+        with timer.phase('write'):
+            removed, remaining, failures = remove_subtree(
+                self.udm_api_version, dns, self.ansible_params['remove_workers'])
+        progress['removed'] += len(removed)
+        self.changed_objects.extend(removed)
+        if failures:
+            self.result['changed'] = len(removed) > 0
+            self.result['remaining'] = remaining
+            self.result['failures'] = [dict(dn=dn, error=error) for dn, error in failures]
+            self.result['msg'] = "Removing {} failed: {}. {} of {} objects below {} were removed.".format(
+                failures[0][0], failures[0][1], len(removed), len(dns), obj.dn)
+            self._fail_json()
+
     def _remove_objects(self, obj):
         self._set_changes(obj, obj.dn, 'old')
+        if self.ansible_params['recursive']:
+            self._remove_subtree(obj)
+            return
         if not self.ansible_module.check_mode:
-            self._try_function(
-                obj.delete
-            )
+            with timer.phase('write'):
+                self._try_function(
+                    obj.delete
+                )
             self.changed_objects.append(obj.dn)
 
     def _detect_changes(self):
@@ -453,15 +661,119 @@ class UDMAnsibleModule():
         if not self.result['changed']:
             self.result['msg'] = "nothing changed"
 
+    def _property_errors(self, params, properties):
+        """
+        :params: params : the options of one item
+        :params: properties : the metadata of the properties of its module
+        :returns: a list of dicts with the module, property and error of every invalid property
+        """
+        errors = []
+
+        def error(prop, text):
+            errors.append(dict(module=params['module'], property=prop, error=text))
+
+        for attr in params['unset_properties'] or []:
+            if attr.get('property') not in properties:
+                error(attr.get('property'), 'unknown property')
+        for attr in params['set_properties'] or []:
+            prop_name = attr.get('property')
+            prop_value = attr.get('value')
+            if prop_name not in properties:
+                error(prop_name, 'unknown property')
+                continue
+            metadata = properties[prop_name]
+            if isinstance(prop_value, (list, tuple)) and not metadata['multivalue'] and not metadata['complex']:
+                error(prop_name, 'single-valued, but a list was given')
+                continue
+            values = prop_value if metadata['multivalue'] and isinstance(prop_value, (list, tuple)) else [prop_value]
+            for value in values:
+                value_error = check_value(metadata, value)
+                if value_error:
+                    error(prop_name, 'invalid value {!r}: {}'.format(value, value_error))
+        return errors
+
+    def _preflight(self, udm_con):
+        """Validate the properties of every item against the metadata of its
+        module, before the first object is written"""
+        if not self.ansible_params['validate_properties']:
+            return
+        errors = []
+        refreshed = set()
+        with timer.phase('validate'):
+            for index, item in enumerate(self.ansible_params['batch'] or [{}]):
+                params = dict(self.ansible_params, **item)
+                if not params['module']:
+                    continue
+                self._get_udm_module(udm_con, params['module'])
+                properties = get_properties(
+                    self.udm_api_version, params['module'], save=not self.ansible_module.check_mode)
+                if properties is None:
+                    continue
+                item_errors = self._property_errors(params, properties)
+                if params['module'] not in refreshed and any(
+                        item_error['error'] == 'unknown property' for item_error in item_errors):
+                    # the cached metadata may miss extended attributes added since
+                    refreshed.add(params['module'])
+                    properties = get_properties(
+                        self.udm_api_version, params['module'], refresh=True, save=not self.ansible_module.check_mode)
+                    item_errors = self._property_errors(params, properties)
+                if self.ansible_params['batch']:
+                    for item_error in item_errors:
+                        item_error['item'] = index
+                errors += item_errors
+        if errors:
+            self.result['msg'] = "Invalid properties, no object was written: {}".format('; '.join(
+                "{module} {property}: {error}".format(**item_error) for item_error in errors))
+            self.result['errors'] = errors
+            self._fail_json()
+
     def run(self):
         # univention module
         self._check_univention_import_errors()
+        if self.ansible_params['batch']:
+            self.ansible_params['batch'] = [
+                self._validate_item(index, item) for index, item in enumerate(self.ansible_params['batch'])]
         udm_con = self._get_udm_connection()
+        self._preflight(udm_con)
+        if self.ansible_params['batch']:
+            self._run_batch(udm_con)
+        else:
+            self._run_item(udm_con)
+        self.ansible_module.exit_json(**add_profile(self.ansible_module, self.result))
+
+    def _run_batch(self, udm_con):
+        """Run every item of batch with the same connection and module handles"""
+        params = self.ansible_params
+        results = self.batch_results = []
+        for item in params['batch']:
+            self.ansible_params = dict(copy.deepcopy(params), batch=None, **copy.deepcopy(item))
+            self._reset()
+            if not self.ansible_params['module']:
+                self.result['msg'] = "Every batch item needs a module"
+                self._fail_json()
+            self._run_item(udm_con)
+            results.append(self.result)
+        self.ansible_params = params
+        self.batch_results = None
+        self._reset()
+        for result in results:
+            self.changed_objects.extend(result['meta']['changed_objects'])
+        self.result['changed'] = any(result['changed'] for result in results)
+        self.result['results'] = results
+        self.result['msg'] = "{} of {} items changed: {}".format(
+            len([result for result in results if result['changed']]), len(results),
+            ' '.join(self.changed_objects) or 'nothing changed')
+
+    def _run_item(self, udm_con):
+        if self.ansible_params['recursive'] and self.ansible_params['state'] != 'absent':
+            self.result['msg'] = "recursive can only be used with state absent"
+            self._fail_json()
         self.udm_module = self._get_udm_module(udm_con, self.ansible_params['module'])
         self._extract_properties_from_dn()
         # get udm_objects
-        udm_objects = self._get_udm_obj_by_filter()
-        udm_objects += self._get_udm_obj_by_property()
+        with timer.phase('discover'):
+            udm_objects = self._get_udm_obj_by_filter()
+            udm_objects += self._get_udm_obj_by_property()
         # State present
         if self.ansible_params['state'] == 'present':
             for obj in udm_objects:
@@ -470,18 +782,22 @@ class UDMAnsibleModule():
                 self._create_object()
         # State absent
         elif self.ansible_params['state'] == 'absent':
+            if self.ansible_params['recursive']:
+                # the objects below another matched object are removed with its subtree
+                outermost = outermost_dns([obj.dn for obj in udm_objects])
+                udm_objects = [obj for obj in udm_objects if obj.dn in outermost]
             for obj in udm_objects:
                 self._remove_objects(obj)
         if not self.ansible_module.check_mode:
-            self._detect_changes()
-        self.ansible_module.exit_json(**self.result)
+            with timer.phase('diff'):
+                self._detect_changes()
 
 
 def run_module():
     module_args = dict(
         module=dict(
             type='str',
-            required=True
+            required=False
         ),
         position=dict(
             type='str',
@@ -522,10 +838,36 @@ def run_module():
             default=None,
             required=False
         ),
+        batch=dict(
+            type='list',
+            elements='dict',
+            required=False
+        ),
+        profile=dict(
+            type='bool',
+            default=False,
+            required=False
+        ),
+        validate_properties=dict(
+            type='bool',
+            default=False,
+            required=False
+        ),
+        recursive=dict(
+            type='bool',
+            default=False,
+            required=False
+        ),
+        remove_workers=dict(
+            type='int',
+            default=1,
+            required=False
+        ),
     )
 
     module = AnsibleModule(
         argument_spec=module_args,
+        required_one_of=[['module', 'batch']],
         supports_check_mode=True
     )
 
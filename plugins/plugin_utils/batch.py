@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2023, Univention GmbH
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+from ansible.errors import AnsibleActionFail
+from ansible.module_utils.parsing.convert_bool import boolean
+from ansible.parsing.mod_args import ModuleArgsParser
+from ansible.plugins.action import ActionBase
+from ansible.template import Templar
+
+# Results of coalesced loops still to be handed out, by host and task. All
+# items of a loop run one after another in the same worker process, so the
+# first item runs the whole batch and the following ones take their result.
+COALESCED_RESULTS = {}
+
+
+class BatchActionModule(ActionBase):
+    '''Run a module once for a list of items
+
+    The items are either given with the 'batch' option or, with
+    'coalesce_loop: true', collected from the 'loop' of the task.
+    '''
+
+    _supports_async = True
+
+    # options that can differ between the items of a coalesced loop, the
+    # other options are passed once for all items. None allows all options.
+    _item_options = None
+
+    def _batch_module_args(self, module_args, batch):
+        '''Return the arguments running the module for all items of batch'''
+        return dict(module_args, batch=batch)
+
+    def _split_results(self, module_result, batch):
+        '''Return the results of the items of batch in the same order'''
+        return module_result.get('results', [])
+
+    def _run_batch(self, module_args, batch, task_vars, wrap_async=False):
+        module_result = self._execute_module(
+            module_args=self._batch_module_args(module_args, batch), task_vars=task_vars, wrap_async=wrap_async)
+        # an async job only returns its id, async_status returns the result of the module as is
+        if not module_result.get('failed') and not wrap_async:
+            module_result['results'] = self._split_results(module_result, batch)
+        return module_result
+
+    def _loop_items(self, task_vars):
+        if self._task.loop_with:
+            raise AnsibleActionFail('coalesce_loop only supports "loop", not "with_{0}"'.format(self._task.loop_with))
+        items = Templar(loader=self._loader, variables=task_vars).template(self._task.loop)
+        if not isinstance(items, list):
+            raise AnsibleActionFail('coalesce_loop needs "loop" to be a list, got {0}'.format(type(items).__name__))
+        return items
+
+    def _check_loop_control(self):
+        '''Reject the keywords that run or template the items in a way the batch cannot follow'''
+        if self._task.until:
+            raise AnsibleActionFail('coalesce_loop cannot be combined with "until"')
+        loop_control = self._task.loop_control
+        if loop_control:
+            for option in ('index_var', 'extended', 'pause', 'break_when'):
+                if getattr(loop_control, option, None):
+                    raise AnsibleActionFail('coalesce_loop only supports "loop_var" and "label" in "loop_control", '
+                                            'not "{0}"'.format(option))
+
+    def _item_included(self, item_vars):
+        '''Return whether "when" of the task holds for an item, as Ansible skips the others'''
+        if not self._task.when:
+            return True
+        if hasattr(self._task, '_resolve_conditional'):
+            return self._task._resolve_conditional(self._task.when, item_vars)
+        return self._task.evaluate_conditional(Templar(loader=self._loader, variables=item_vars), item_vars)
+
+    def _item_args(self, raw_args, item_vars):
+        item_args = Templar(loader=self._loader, variables=item_vars).template(raw_args)
+        item_args.pop('coalesce_loop', None)
+        return item_args
+
+    def _split_item_args(self, batch):
+        '''Split the arguments of the items into the task arguments and the item options'''
+        if self._item_options is None:
+            return {}, batch
+        module_args = {}
+        items = []
+        for item_args in batch:
+            item = {}
+            for option, value in item_args.items():
+                if option in self._item_options:
+                    item[option] = value
+                elif option in module_args and module_args[option] != value:
+                    raise AnsibleActionFail('coalesce_loop needs "{0}" to be the same for all items'.format(option))
+                else:
+                    module_args[option] = value
+            items.append(item)
+        return module_args, items
+
+    def _run_coalesced(self, task_vars):
+        key = (task_vars.get('inventory_hostname'), self._task._uuid)
+        if key not in COALESCED_RESULTS:
+            if not isinstance(getattr(self._task, '_ds', None), dict):
+                raise AnsibleActionFail('coalesce_loop is not supported for this task')
+            raw_args = ModuleArgsParser(task_ds=self._task._ds, collection_list=self._task.collections).parse()[1]
+            self._check_loop_control()
+            loop_var = self._task.loop_control.loop_var if self._task.loop_control else 'item'
+            batch = []
+            for item in self._loop_items(task_vars):
+                item_vars = dict(task_vars, **{loop_var: item})
+                # the skipped items never reach the action plugin, so they must not take a result
+                if self._item_included(item_vars):
+                    batch.append(self._item_args(raw_args, item_vars))
+            if not batch:
+                return dict(changed=False)
+            module_args, batch = self._split_item_args(batch)
+            module_result = self._run_batch(module_args, batch, task_vars)
+            if module_result.get('failed'):
+                COALESCED_RESULTS[key] = [module_result] * len(batch)
+            else:
+                COALESCED_RESULTS[key] = module_result['results']
+        results = COALESCED_RESULTS[key]
+        result = results.pop(0)
+        if not results:
+            del COALESCED_RESULTS[key]
+        return result
+
+    def run(self, tmp=None, task_vars=None):
+        if task_vars is None:
+            task_vars = dict()
+        result = super(BatchActionModule, self).run(tmp, task_vars)
+        del tmp
+
+        module_args = self._task.args.copy()
+        wrap_async = self._task.async_val and not self._connection.has_native_async
+        if boolean(module_args.pop('coalesce_loop', False), strict=False) and self._task.loop is not None:
+            if self._task.async_val:
+                raise AnsibleActionFail('coalesce_loop cannot be combined with async')
+            result.update(self._run_coalesced(task_vars))
+        elif module_args.get('batch'):
+            batch = module_args.pop('batch')
+            result.update(self._run_batch(module_args, batch, task_vars, wrap_async))
+        else:
+            result.update(self._execute_module(module_args=module_args, task_vars=task_vars, wrap_async=wrap_async))
+        return result
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2023, Univention GmbH
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import hashlib
+import json
+import os
+import tempfile
+
+from ansible import constants as C
+from ansible.module_utils.common.text.converters import to_bytes
+
+# values by cache file, for the lifetime of the worker process
+_MEMORY = {}
+
+
+class PlayCache(object):
+    '''Values memoized for the rest of the ansible run
+
+    Lookups run in the worker process of their task, so the values are kept in
+    memory for the process and in a file in the local temporary directory of
+    the run, which all workers share and which is removed when the run ends.
+    '''
+
+    def __init__(self, namespace, *key):
+        digest = hashlib.sha1(to_bytes(json.dumps([namespace] + list(key)))).hexdigest()
+        self.path = os.path.join(C.DEFAULT_LOCAL_TMP, 'ucs_modules-{0}-{1}.json'.format(namespace, digest))
+        if self.path not in _MEMORY:
+            _MEMORY[self.path] = self._read()
+        self.values = _MEMORY[self.path]
+
+    def _read(self):
+        try:
+            with open(self.path) as cache_file:
+                return json.load(cache_file)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def missing(self, names):
+        return [name for name in names if name not in self.values]
+
+    def __getitem__(self, name):
+        return self.values[name]
+
+    def update(self, values):
+        '''Remember the values, merged with those other workers stored meanwhile'''
+        self.values.update(values)
+        merged = self._read()
+        merged.update(self.values)
+        try:
+            fd, path = tempfile.mkstemp(dir=os.path.dirname(self.path))
+            with os.fdopen(fd, 'w') as cache_file:
+                json.dump(merged, cache_file)
+            os.rename(path, self.path)
+        except (IOError, OSError):
+            # the file is only shared between the workers, memory still works
+            pass
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2023, Univention GmbH
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import json
+
+from ansible.module_utils.common.text.converters import to_native, to_text
+from ansible.module_utils.six.moves.http_cookiejar import Cookie, CookieJar
+from ansible.module_utils.six.moves.urllib.parse import urlencode, urljoin
+from ansible.module_utils.urls import Request
+
+
+# clients by class and connection options, for the lifetime of the worker process
+_CLIENTS = {}
+
+
+class UCSAPIError(Exception):
+
+    def __init__(self, msg, status=None):
+        super(UCSAPIError, self).__init__(msg)
+        self.status = status
+
+
+def get_client(client_class, url, username, password, validate_certs=True, timeout=30):
+    '''Return the client of the worker process for the connection, created on first use'''
+    key = (client_class.__name__, url, username, password, validate_certs, timeout)
+    if key not in _CLIENTS:
+        _CLIENTS[key] = client_class(url, username, password, validate_certs=validate_certs, timeout=timeout)
+    return _CLIENTS[key]
+
+
+def escape_filter_value(value):
+    '''Escape a value for use in an LDAP filter (RFC 4515)'''
+    value = to_text(value)
+    for char, escaped in (('\\', '\\5c'), ('*', '\\2a'), ('(', '\\28'), (')', '\\29'), ('\0', '\\00')):
+        value = value.replace(char, escaped)
+    return value
+
+
+class UDMRestClient(object):
+    '''A session with the UDM REST API
+
+    Authentication, headers and cookies are kept by a single Request object
+    and reused for every request of the session.
+    '''
+
+    def __init__(self, url, username, password, validate_certs=True, timeout=30):
+        self.url = url.rstrip('/') + '/'
+        self.request = Request(
+            url_username=username,
+            url_password=password,
+            force_basic_auth=True,
+            validate_certs=validate_certs,
+            timeout=timeout,
+            headers={'Accept': 'application/json'},
+            cookies=CookieJar(),
+        )
+
+    def get(self, url):
+        try:
+            return json.loads(to_native(self.request.get(url).read()))
+        except Exception as e:
+            raise UCSAPIError('Request to {0} failed: {1}'.format(url, to_native(e)))
+
+    def search(self, module, filter=None, properties=None, page_size=None):
+        '''Yield the objects of a search, following the pages of the result
+
+        Every object is a dict with 'dn', 'objectType', 'position' and
+        'properties'. With properties, only those properties are requested.
+        '''
+        query = []
+        if filter:
+            query.append(('filter', filter))
+        if page_size:
+            query += [('limit', page_size), ('page', 1)]
+        query += [('properties', prop) for prop in properties or []]
+        url = urljoin(self.url, module.strip('/') + '/')
+        if query:
+            url += '?' + urlencode(query)
+
+        page = 1
+        while url:
+            response = self.get(url)
+            objects = response.get('_embedded', {}).get('udm:object', [])
+            for obj in objects:
+                yield obj
+            next_links = response.get('_links', {}).get('next')
+            if next_links:
+                url = urljoin(url, next_links[0]['href'] if isinstance(next_links, list) else next_links['href'])
+            elif page_size and '_links' not in response and len(objects) >= page_size:
+                # without links, a full page means there may be more
+                page += 1
+                query[query.index(('page', page - 1))] = ('page', page)
+                url = url.split('?', 1)[0] + '?' + urlencode(query)
+            else:
+                url = None
+
+
+class UMCClient(object):
+    '''A session with the Univention Management Console
+
+    Logs in once, the session cookie is kept by the Request object and sent
+    with every command together with the XSRF protection header. The session
+    can be exported and resumed by the client of another worker process.
+    '''
+
+    def __init__(self, url, username, password, validate_certs=True, timeout=30):
+        self.url = url.rstrip('/') + '/'
+        self.username = username
+        self.password = password
+        self.cookies = CookieJar()
+        self.request = Request(
+            validate_certs=validate_certs,
+            timeout=timeout,
+            headers={'Accept': 'application/json', 'Content-Type': 'application/json'},
+            cookies=self.cookies,
+        )
+        self.session_id = None
+
+    def _post(self, path, options):
+        url = urljoin(self.url, path)
+        headers = {'X-Xsrf-Protection': self.session_id} if self.session_id else {}
+        try:
+            response = self.request.post(url, data=json.dumps(dict(options=options)), headers=headers)
+            return json.loads(to_native(response.read()))
+        except Exception as e:
+            raise UCSAPIError('Request to {0} failed: {1}'.format(url, to_native(e)), status=getattr(e, 'code', None))
+
+    def login(self):
+        self._post('auth', dict(username=self.username, password=self.password))
+        for cookie in self.cookies:
+            if cookie.name.startswith('UMCSessionId'):
+                self.session_id = cookie.value
+        if not self.session_id:
+            raise UCSAPIError('Login to {0} as {1} returned no session'.format(self.url, self.username))
+
+    def export_session(self):
+        '''Return the session cookie as a dict for resume(), None before the login'''
+        for cookie in self.cookies:
+            if cookie.name.startswith('UMCSessionId'):
+                return dict(name=cookie.name, value=cookie.value, domain=cookie.domain,
+                            domain_specified=cookie.domain_specified, path=cookie.path, secure=cookie.secure)
+        return None
+
+    def resume(self, session):
+        '''Continue a session exported by another client instead of logging in again'''
+        self.cookies.set_cookie(Cookie(
+            0, session['name'], session['value'], None, False, session['domain'], session['domain_specified'],
+            session['domain'].startswith('.'), session['path'], True, session['secure'], None, True, None, None, {}))
+        self.session_id = session['value']
+
+    def command(self, name, options):
+        '''Run a UMC command and return its result
+
+        A session that expired meanwhile is replaced by a new login once.
+        '''
+        if not self.session_id:
+            self.login()
+        try:
+            return self._post('command/{0}'.format(name), options).get('result')
+        except UCSAPIError as e:
+            if e.status != 401:
+                raise
+        self.cookies.clear()
+        self.session_id = None
+        self.login()
+        return self._post('command/{0}'.format(name), options).get('result')
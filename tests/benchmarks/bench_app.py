@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2023, Univention GmbH
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""Scenarios of univention_app.main against the univention-app stub."""
+
+import json
+import os
+
+from harness import ModuleState, Scenario, cli_calls, import_collection, run_module
+
+TARGET = 'univention_app.main'
+APPS = 20
+VERSIONS = ['1.0', '1.1', '2.0']
+
+
+def write_app_state(path):
+    '''Write the state the stub answers from: all apps but the last five are
+    installed and started, app1 can be upgraded'''
+    names = ['bench-app{0}'.format(index) for index in range(APPS)]
+    installed = dict((name, VERSIONS[-1]) for name in names[:-5])
+    installed['bench-app1'] = VERSIONS[0]
+    with open(path, 'w') as state:
+        json.dump(dict(
+            available=dict((name, VERSIONS) for name in names),
+            installed=installed,
+            config=dict((name, {'bench/setting': 'a', 'bench/other': 'b'}) for name in names),
+            status=dict((name, 'started') for name in installed),
+        ), state)
+
+
+def scenarios(options):
+    app = import_collection('plugins.modules.univention_app')
+    state = ModuleState(import_collection('plugins.module_utils.appcenter'), app)
+    bench_dir = os.environ['UCS_BENCH_DIR']
+    write_app_state(os.environ['UCS_BENCH_APPS'])
+
+    # keep the caches of the module out of /var and let it run although
+    # this is no UCS system, the stub stands in for univention-app
+    app.APPCENTER_CACHE_DIR = os.path.join(bench_dir, 'univention-appcenter')
+    app.APPCENTER_CACHE_STAMP = os.path.join(app.APPCENTER_CACHE_DIR, '.ansible-update-stamp')
+    app.APP_CATALOG_FILE = os.path.join(bench_dir, 'app_catalog.json')
+    app.check_ucs = lambda: True
+
+    def counters():
+        return dict(cli=cli_calls())
+
+    def reset(index):
+        state.restore()
+        if os.path.exists(app.APP_CATALOG_FILE):
+            os.remove(app.APP_CATALOG_FILE)
+
+    def run(**args):
+        return run_module(app.main, dict(args, auth_username='Administrator', auth_password='univention'))
+
+    def present(index):
+        run(name='bench-app0', state='present')
+
+    def started(index):
+        run(name='bench-app0', state='started')
+
+    def install(index):
+        run(name='bench-app19', state='present', config={'bench/setting': 'c'})
+
+    def upgrade(index):
+        run(name='bench-app1', state='present', version='latest', update_cache_valid_time=3600)
+
+    def configure(index):
+        run(name='bench-app2', state='present', config={'bench/setting': 'changed{0}'.format(index)})
+
+    def apps_10(index):
+        run(apps=[dict(name='bench-app{0}'.format(number), state='started') for number in range(2, 12)])
+
+    return [
+        Scenario('app-present', TARGET, present, setup=reset, counters=counters),
+        Scenario('app-started', TARGET, started, setup=reset, counters=counters),
+        Scenario('app-install', TARGET, install, setup=reset, counters=counters),
+        Scenario('app-upgrade', TARGET, upgrade, setup=reset, counters=counters),
+        Scenario('app-configure', TARGET, configure, setup=reset, counters=counters),
+        Scenario('app-apps-10-started', TARGET, apps_10, setup=reset, counters=counters),
+    ]
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2023, Univention GmbH
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""Scenarios of _set_keys, _unset_keys and _commit_files against the JSON registry."""
+
+import json
+import os
+
+from harness import ModuleState, Scenario, cli_calls, import_collection, make_module
+
+ARGUMENT_SPEC = dict(
+    layer=dict(type='str', default='normal'),
+    commit_workers=dict(type='int', default=1),
+    lock_timeout=dict(type='int', default=300),
+    profile=dict(type='bool', default=False),
+)
+
+
+def new_result():
+    return dict(
+        changed=False,
+        meta=dict(changed_keys=[], commited_templates=[], matched_keys=[], shadowed_keys={}),
+        message=''
+    )
+
+
+def scenarios(options):
+    from univention.config_registry import STATS
+    from univention.config_registry.backend import registry_file, write_registry
+
+    ucr = import_collection('plugins.modules.univention_config_registry')
+    ucr_utils = import_collection('plugins.module_utils.ucr')
+    ucr_utils.LOCK_FILE = os.path.join(os.environ['UCS_BENCH_DIR'], 'ucr.lock')
+    state = ModuleState(ucr_utils, ucr)
+    modules = {}
+    keys = ['bench/section{0}/key{1}'.format(index % 5, index) for index in range(0, options.keys, options.keys // 50)]
+    # keys of the synthetic registry with their value, none of them shadowed
+    existing = dict(('bench/section{0}/key{1}'.format(index % 50, index), 'value{0}'.format(index))
+                    for index in range(3, options.keys, options.keys // 50))
+    files = ['/etc/bench/section{0}.conf'.format(section) for section in range(10)]
+
+    def counters():
+        return dict(ucr_load=STATS['load'], commit=STATS['commit'], cli=cli_calls())
+
+    def reset(check_mode=False, **args):
+        def setup(index):
+            state.restore()
+            modules['module'] = make_module(ARGUMENT_SPEC, args, check_mode=check_mode)
+        return setup
+
+    def setup_unset(index):
+        reset()(index)
+        with open(registry_file()) as registry:
+            layers = json.load(registry)
+        layers['normal'].update(('bench/unset/key{0}'.format(key), 'x') for key in range(50))
+        write_registry(layers)
+
+    def set_changed(index):
+        ucr._set_keys(dict((key, 'changed{0}'.format(index)) for key in keys), new_result(), modules['module'])
+
+    def set_unchanged(index):
+        ucr._set_keys(existing, new_result(), modules['module'])
+
+    def unset(index):
+        ucr._unset_keys(['bench/unset/key{0}'.format(key) for key in range(50)], new_result(), modules['module'])
+
+    def commit(index):
+        ucr._commit_files(files, new_result(), modules['module'])
+
+    return [
+        Scenario('ucr-set-50', '_set_keys', set_changed, setup=reset(), counters=counters),
+        Scenario('ucr-set-50-unchanged', '_set_keys', set_unchanged, setup=reset(), counters=counters),
+        Scenario('ucr-set-50-check', '_set_keys', set_changed, setup=reset(check_mode=True), counters=counters),
+        Scenario('ucr-unset-50', '_unset_keys', unset, setup=setup_unset, counters=counters),
+        Scenario('ucr-commit-10', '_commit_files', commit, setup=reset(), counters=counters),
+        Scenario('ucr-commit-10-parallel', '_commit_files', commit, setup=reset(commit_workers=4),
+                 counters=counters),
+    ]
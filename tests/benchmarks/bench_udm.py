@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2023, Univention GmbH
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""Scenarios of UDMAnsibleModule.run against the synthetic directory."""
+
+import os
+
+from harness import ModuleExit, ModuleState, Scenario, import_collection, run_module
+
+TARGET = 'UDMAnsibleModule.run'
+
+
+def scenarios(options):
+    import univention.udm as fake_udm
+
+    udm = import_collection('plugins.modules.univention_directory_manager')
+    udm_utils = import_collection('plugins.module_utils.udm')
+    # the property metadata is cached in the bench dir, for the UDM version of a stand-in package list
+    udm_utils.PROPERTIES_CACHE_FILE = os.path.join(os.environ['UCS_BENCH_DIR'], 'udm_properties.json')
+    udm_utils.UDM_PACKAGE_LIST = os.path.join(os.environ['UCS_BENCH_DIR'], 'udm.list')
+    open(udm_utils.UDM_PACKAGE_LIST, 'w').close()
+    state = ModuleState(udm_utils, udm.UDMAnsibleModule)
+    users = options.objects
+    user_dn = 'uid=user{0},' + fake_udm.DEFAULT_POSITIONS['users/user']
+
+    def counters():
+        stats = fake_udm.STATS
+        return dict(
+            ldap=sum(stats.values()),
+            ldap_write=stats['add'] + stats['modify'] + stats['remove'],
+        )
+
+    def reset(index):
+        state.restore()
+
+    def run(args):
+        return run_module(udm.run_module, args)
+
+    def create(index):
+        run(dict(module='users/user', set_properties=[
+            dict(property='username', value='bench-new{0}'.format(index)),
+            dict(property='lastname', value='New'),
+        ]))
+
+    def modify_by_dn(index):
+        run(dict(module='users/user', dn=user_dn.format(index * 7 % users), set_properties=[
+            dict(property='lastname', value='Changed{0}'.format(index)),
+        ]))
+
+    def modify_unchanged(index):
+        run(dict(module='users/user', dn=user_dn.format(index * 7 % users), set_properties=[
+            dict(property='mailPrimaryAddress', value='user{0}@bench.test'.format(index * 7 % users)),
+        ]))
+
+    def modify_by_filter(index):
+        run(dict(module='users/user', filter='(uid=user{0})'.format(index * 11 % users), set_properties=[
+            dict(property='description', value='changed {0}'.format(index)),
+        ]))
+
+    def search_unindexed(index):
+        run(dict(module='users/user', filter='(givenName=Firstname{0})'.format(index * 13 % users),
+                 set_properties=[dict(property='description', value='scanned {0}'.format(index))]))
+
+    def batch(index):
+        run(dict(batch=[
+            dict(module='users/user', dn=user_dn.format((index * 100 + item) % users), set_properties=[
+                dict(property='description', value='batch {0}'.format(index)),
+            ]) for item in range(100)
+        ]))
+
+    def batch_invalid(index):
+        items = [
+            dict(module='users/user', dn=user_dn.format((index * 100 + item) % users), set_properties=[
+                dict(property='description', value='batch {0}'.format(index)),
+            ]) for item in range(99)
+        ]
+        items.append(dict(module='users/user', dn=user_dn.format(index), set_properties=[
+            dict(property='mailPrimaryAddress', value='invalid'),
+        ]))
+        try:
+            run(dict(batch=items, validate_properties=True))
+        except ModuleExit as e:
+            if not e.result.get('errors'):
+                raise
+        else:
+            raise RuntimeError('The invalid batch was not rejected')
+
+    def setup_remove(index):
+        state.restore()
+        # added directly, so the counters only show the LDAP operations of the removal
+        name = 'bench-remove{0}'.format(index)
+        fake_udm.DIRECTORY.put('uid={0},{1}'.format(name, fake_udm.DEFAULT_POSITIONS['users/user']), 'users/user',
+                               dict(username=name, lastname='Remove', groups=[]))
+
+    def remove(index):
+        run(dict(module='users/user', state='absent', filter='(uid=bench-remove{0})'.format(index)))
+
+    def setup_tree(index):
+        state.restore()
+        # an OU with a container of 200 users, added directly like in setup_remove
+        ou_dn = 'ou=bench-tree{0},{1}'.format(index, fake_udm.BASE)
+        fake_udm.DIRECTORY.put(ou_dn, 'container/ou', dict(name='bench-tree{0}'.format(index)))
+        fake_udm.DIRECTORY.put('cn=users,' + ou_dn, 'container/cn', dict(name='users'))
+        for item in range(200):
+            name = 'bench-tree{0}-user{1}'.format(index, item)
+            fake_udm.DIRECTORY.put('uid={0},cn=users,{1}'.format(name, ou_dn), 'users/user',
+                                   dict(username=name, lastname='Tree', groups=[]))
+
+    def remove_tree(workers):
+        def remove(index):
+            run(dict(module='container/ou', state='absent', dn='ou=bench-tree{0},{1}'.format(index, fake_udm.BASE),
+                     recursive=True, remove_workers=workers))
+        return remove
+
+    return [
+        Scenario('udm-create', TARGET, create, setup=reset, counters=counters),
+        Scenario('udm-modify-dn', TARGET, modify_by_dn, setup=reset, counters=counters),
+        Scenario('udm-modify-unchanged', TARGET, modify_unchanged, setup=reset, counters=counters),
+        Scenario('udm-modify-filter', TARGET, modify_by_filter, setup=reset, counters=counters),
+        Scenario('udm-search-unindexed', TARGET, search_unindexed, setup=reset, counters=counters),
+        Scenario('udm-batch-100', TARGET, batch, setup=reset, counters=counters),
+        Scenario('udm-batch-100-invalid', TARGET, batch_invalid, setup=reset, counters=counters),
+        Scenario('udm-remove', TARGET, remove, setup=setup_remove, counters=counters),
+        Scenario('udm-remove-tree-200', TARGET, remove_tree(1), setup=setup_tree, counters=counters),
+        Scenario('udm-remove-tree-200-parallel', TARGET, remove_tree(4), setup=setup_tree, counters=counters),
+    ]
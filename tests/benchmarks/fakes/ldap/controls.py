@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2023, Univention GmbH
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""The paged results control, its cookie is the offset of the next page."""
+
+
+class SimplePagedResultsControl(object):
+
+    controlType = '1.2.840.113556.1.4.319'
+
+    def __init__(self, criticality=True, size=10, cookie=''):
+        self.criticality = criticality
+        self.size = size
+        self.cookie = cookie
@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2023, Univention GmbH
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""In-memory stand-ins for the parts of the UCS Python API the modules use.
+
+Only meant for tests/benchmarks, they are put in front of sys.path by run.py.
+"""
@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2023, Univention GmbH
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""The description of a property of a UDM handler."""
+
+
+class property(object):
+
+    def __init__(self, syntax, multivalue=False):
+        self.syntax = syntax
+        self.multivalue = multivalue
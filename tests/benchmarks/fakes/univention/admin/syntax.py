@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2023, Univention GmbH
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""The syntaxes of the properties of the stand-in, parse() fails like in UDM."""
+
+import re
+
+from univention.admin.uexceptions import valueError
+
+
+class simple(object):
+
+    regex = None
+    error_message = 'Invalid value'
+
+    @classmethod
+    def parse(cls, text):
+        if cls.regex is not None and not re.match(cls.regex, str(text)):
+            raise valueError(cls.error_message)
+        return text
+
+
+class string(simple):
+    pass
+
+
+class userPasswd(simple):
+    pass
+
+
+class boolean(simple):
+    regex = r'^[01]?$'
+    error_message = 'Value must be 0 or 1'
+
+
+class emailAddress(simple):
+    regex = r'^[^@\s]+@[^@\s]+$'
+    error_message = 'Not a valid email address'
+
+
+class UserDN(simple):
+    regex = r'^[^=,]+=[^,]+(,[^=,]+=[^,]+)*$'
+    error_message = 'Not a valid LDAP DN'
+
+
+class GroupDN(UserDN):
+    pass
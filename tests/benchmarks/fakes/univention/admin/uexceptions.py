@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2023, Univention GmbH
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""The exceptions of univention.admin raised by the stand-in."""
+
+
+class base(Exception):
+    pass
+
+
+class valueError(base):
+    pass
+
+
+class noObject(base):
+    pass
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2023, Univention GmbH
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""The UCR template handlers, one synthetic file per section of bench/ keys.
+
+Every handler renders the keys of its section into a file below
+UCS_BENCH_DIR. Loads and commits are counted in STATS.
+"""
+
+import collections
+import os
+import re
+
+# loads of the registry and handlers, commits of single files
+STATS = collections.Counter()
+
+SECTIONS = 50
+
+
+class ConfigHandlerFile(object):
+
+    def __init__(self, section):
+        self.section = section
+        self.to_file = '/etc/bench/section{0}.conf'.format(section)
+        self.variables = ['bench/section{0}/.*'.format(section)]
+        self.preinst = None
+        self.postinst = None
+
+    def __call__(self, args):
+        ucr, changed = args
+        STATS['commit'] += 1
+        prefix = 'bench/section{0}/'.format(self.section)
+        path = os.path.join(os.environ['UCS_BENCH_DIR'], self.to_file.lstrip('/'))
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as rendered:
+            for key in sorted(ucr.keys()):
+                if key.startswith(prefix):
+                    rendered.write('{0}={1}\n'.format(key, ucr.get(key)))
+
+
+class configHandlers(object):
+
+    def __init__(self):
+        self._handlers = {}
+        self._files = {}
+        self._multifiles = {}
+        self._subfiles = {}
+
+    def load(self):
+        STATS['handlers_load'] += 1
+        for section in range(SECTIONS):
+            handler = ConfigHandlerFile(section)
+            self._files[handler.to_file] = handler
+            for pattern in handler.variables:
+                self._handlers.setdefault(pattern, set()).add(handler)
+
+    def update(self):
+        STATS['handlers_update'] += 1
+
+    def commit(self, ucr, filelist=()):
+        for fname in filelist:
+            handler = self._files.get(fname)
+            if handler is not None:
+                handler((ucr, {}))
+
+    def __call__(self, variables, arg):
+        for pattern, handlers in self._handlers.items():
+            if any(re.match(pattern, variable) for variable in variables):
+                for handler in handlers:
+                    handler(arg)
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2023, Univention GmbH
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""A ConfigRegistry reading its layers from the JSON file in UCS_BENCH_UCR.
+
+The file is shared with bin/univention-config-registry, so the values the
+stub CLI writes are seen by the next load().
+"""
+
+import json
+import os
+
+from univention.config_registry import STATS
+
+LAYERS = ('normal', 'ldap', 'schedule', 'forced')
+
+
+def registry_file():
+    return os.environ['UCS_BENCH_UCR']
+
+
+def write_registry(layers, path=None):
+    path = path or registry_file()
+    with open(path + '.tmp', 'w') as registry:
+        json.dump(dict((name, layers.get(name, {})) for name in LAYERS), registry)
+    os.rename(path + '.tmp', path)
+
+
+def populate(keys=5000, path=None):
+    '''Write a registry with the given number of keys to the normal layer,
+    a few of them shadowed by the ldap and forced layer'''
+    normal = {}
+    for index in range(keys):
+        normal['bench/section{0}/key{1}'.format(index % 50, index)] = 'value{0}'.format(index)
+    ldap = dict(('bench/section1/key{0}'.format(index), 'ldap') for index in range(1, keys, 500))
+    forced = dict(('bench/section2/key{0}'.format(index), 'forced') for index in range(2, keys, 1000))
+    write_registry(dict(normal=normal, ldap=ldap, forced=forced), path)
+
+
+class ConfigRegistry(object):
+
+    NORMAL, LDAP, SCHEDULE, FORCED, CUSTOM = range(5)
+    PRIORITIES = (FORCED, SCHEDULE, LDAP, NORMAL)
+
+    def __init__(self, filename=None, write_registry=NORMAL):
+        self._registry = dict((layer, {}) for layer in self.PRIORITIES)
+
+    def load(self):
+        STATS['load'] += 1
+        with open(registry_file()) as registry:
+            layers = json.load(registry)
+        for layer, name in zip((self.NORMAL, self.LDAP, self.SCHEDULE, self.FORCED), LAYERS):
+            self._registry[layer] = layers.get(name, {})
+
+    def get(self, key, default=None):
+        for layer in self.PRIORITIES:
+            if key in self._registry[layer]:
+                return self._registry[layer][key]
+        return default
+
+    def __getitem__(self, key):
+        return self.get(key)
+
+    def __contains__(self, key):
+        return any(key in self._registry[layer] for layer in self.PRIORITIES)
+
+    def keys(self):
+        keys = set()
+        for layer in self.PRIORITIES:
+            keys.update(self._registry[layer])
+        return keys
+
+    def is_true(self, key=None, default=False, value=None):
+        value = self.get(key) if value is None else value
+        if value is None:
+            return default
+        return value.lower() in ('yes', 'true', '1', 'enable', 'enabled', 'on')
+
+    def is_false(self, key=None, default=False, value=None):
+        value = self.get(key) if value is None else value
+        if value is None:
+            return default
+        return value.lower() in ('no', 'false', '0', 'disable', 'disabled', 'off')
@@ -0,0 +1,373 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2023, Univention GmbH
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""A synthetic directory behind the univention.udm API.
+
+Objects live in a dict by DN. Searches are served from an index of the
+equality filters the modules use and fall back to scanning every object of
+the module, like an LDAP server without a matching index. Every LDAP
+operation is counted in STATS.
+"""
+
+import collections
+import copy
+import fnmatch
+import re
+import threading
+
+from ldap.controls import SimplePagedResultsControl
+from univention.admin import syntax, uexceptions
+from univention.admin.property import property as udm_property
+from univention.udm import exceptions
+
+BASE = 'dc=bench,dc=test'
+
+# LDAP operations by type: search, get, add, modify, remove
+STATS = collections.Counter()
+
+# the properties of every module with their LDAP attribute, the first is the
+# identifying property naming the objects
+MODULES = collections.OrderedDict([
+    ('users/user', collections.OrderedDict([
+        ('username', 'uid'), ('lastname', 'sn'), ('firstname', 'givenName'), ('password', 'userPassword'),
+        ('mailPrimaryAddress', 'mailPrimaryAddress'), ('description', 'description'), ('groups', 'memberOf'),
+        ('overridePWHistory', 'overridePWHistory'),
+    ])),
+    ('groups/group', collections.OrderedDict([
+        ('name', 'cn'), ('description', 'description'), ('users', 'uniqueMember'),
+    ])),
+    ('container/ou', collections.OrderedDict([
+        ('name', 'ou'), ('description', 'description'),
+    ])),
+    ('container/cn', collections.OrderedDict([
+        ('name', 'cn'), ('description', 'description'),
+    ])),
+])
+# the syntax of the properties differing from string, and the multi-valued ones
+SYNTAXES = {
+    'password': syntax.userPasswd, 'mailPrimaryAddress': syntax.emailAddress, 'groups': syntax.GroupDN,
+    'overridePWHistory': syntax.boolean, 'users': syntax.UserDN,
+}
+MULTIVALUE = ('groups', 'users')
+DEFAULT_POSITIONS = {
+    'users/user': 'cn=users,' + BASE,
+    'groups/group': 'cn=groups,' + BASE,
+    'container/ou': BASE,
+    'container/cn': BASE,
+}
+INDEXED = ('uid', 'cn', 'ou', 'mailPrimaryAddress')
+
+
+class Directory(object):
+    '''All objects by DN and the equality index of the INDEXED attributes'''
+
+    def __init__(self):
+        self.objects = collections.OrderedDict()
+        self.index = collections.defaultdict(lambda: collections.defaultdict(set))
+        # held by the removals, which may run in several threads
+        self.lock = threading.RLock()
+
+    def _index_keys(self, module, props):
+        for prop, attribute in MODULES[module].items():
+            if attribute in INDEXED:
+                values = props.get(prop)
+                for value in values if isinstance(values, list) else [values]:
+                    if value is not None:
+                        yield attribute, str(value).lower()
+
+    def put(self, dn, module, props):
+        self.drop(dn)
+        self.objects[dn] = (module, props)
+        for attribute, value in self._index_keys(module, props):
+            self.index[attribute][value].add(dn)
+
+    def drop(self, dn):
+        if dn in self.objects:
+            module, props = self.objects.pop(dn)
+            for attribute, value in self._index_keys(module, props):
+                self.index[attribute][value].discard(dn)
+
+
+DIRECTORY = Directory()
+
+
+def populate(users=10000, groups=None):
+    '''Fill the directory with synthetic users and groups, every tenth user is
+    member of one of the groups'''
+    DIRECTORY.__init__()
+    groups = max(users // 100, 1) if groups is None else groups
+    for index in range(groups):
+        name = 'group{0}'.format(index)
+        DIRECTORY.put('cn={0},{1}'.format(name, DEFAULT_POSITIONS['groups/group']), 'groups/group', dict(
+            name=name, description='synthetic group {0}'.format(index), users=[]))
+    for index in range(users):
+        name = 'user{0}'.format(index)
+        dn = 'uid={0},{1}'.format(name, DEFAULT_POSITIONS['users/user'])
+        props = dict(
+            username=name, lastname='Lastname{0}'.format(index), firstname='Firstname{0}'.format(index),
+            password='{crypt}x', mailPrimaryAddress='{0}@bench.test'.format(name),
+            description='synthetic user {0}'.format(index), groups=[], overridePWHistory=None)
+        if groups and index % 10 == 0:
+            group_dn = 'cn=group{0},{1}'.format(index // 10 % groups, DEFAULT_POSITIONS['groups/group'])
+            props['groups'].append(group_dn)
+            DIRECTORY.objects[group_dn][1]['users'].append(dn)
+        DIRECTORY.put(dn, 'users/user', props)
+
+
+def _unescape(value):
+    return re.sub(r'\\([0-9a-fA-F]{2})', lambda match: chr(int(match.group(1), 16)), value)
+
+
+def parse_filter(text):
+    '''Return a matcher for an LDAP filter with &, |, ! and (wildcard) equality'''
+    position = [0]
+
+    def parse():
+        if text[position[0]] != '(':
+            raise ValueError('Invalid filter: {0}'.format(text))
+        position[0] += 1
+        operator = text[position[0]]
+        if operator in '&|!':
+            position[0] += 1
+            children = []
+            while text[position[0]] == '(':
+                children.append(parse())
+            position[0] += 1
+            if operator == '&':
+                return ('and', children)
+            if operator == '|':
+                return ('or', children)
+            return ('not', children[0])
+        end = text.index(')', position[0])
+        attribute, _, value = text[position[0]:end].partition('=')
+        position[0] = end + 1
+        return ('eq', attribute, _unescape(value).lower())
+
+    text = text.strip()
+    if not text.startswith('('):
+        text = '({0})'.format(text)
+    return parse()
+
+
+def _matches(node, module, props):
+    if node[0] == 'and':
+        return all(_matches(child, module, props) for child in node[1])
+    if node[0] == 'or':
+        return any(_matches(child, module, props) for child in node[1])
+    if node[0] == 'not':
+        return not _matches(node[1], module, props)
+    attribute, value = node[1], node[2]
+    if attribute.lower() == 'objectclass':
+        return True
+    attributes = dict((attr.lower(), prop) for prop, attr in MODULES[module].items())
+    values = props.get(attributes.get(attribute.lower(), attribute))
+    values = values if isinstance(values, list) else [values]
+    return any(candidate is not None and fnmatch.fnmatchcase(str(candidate).lower(), value)
+               for candidate in values)
+
+
+def _candidates(node):
+    '''Return the DNs an indexed equality filter may match, None if it needs a scan'''
+    if node[0] == 'eq' and node[1] in INDEXED and '*' not in node[2]:
+        return set(DIRECTORY.index[node[1]].get(node[2], ()))
+    if node[0] == 'or':
+        candidates = set()
+        for child in node[1]:
+            child_candidates = _candidates(child)
+            if child_candidates is None:
+                return None
+            candidates |= child_candidates
+        return candidates
+    if node[0] == 'and':
+        for child in node[1]:
+            child_candidates = _candidates(child)
+            if child_candidates is not None:
+                return child_candidates
+    return None
+
+
+class Props(object):
+    '''The properties of an object, setting unknown ones fails like in UDM'''
+
+    _encoders = {}
+
+    def __init__(self, module, values):
+        object.__setattr__(self, '_module', module)
+        for prop in MODULES[module]:
+            object.__setattr__(self, prop, copy.deepcopy(values.get(prop)))
+
+    def __setattr__(self, key, value):
+        if key not in MODULES[self._module]:
+            raise exceptions.UnknownProperty('Unknown property {0!r} of module {1}'.format(key, self._module))
+        object.__setattr__(self, key, value)
+
+    def _values(self):
+        return dict((prop, copy.deepcopy(getattr(self, prop))) for prop in MODULES[self._module])
+
+
+class UdmObject(object):
+
+    def __init__(self, udm_module, dn=None, props=None, superordinate=None):
+        self._udm_module = udm_module
+        self.dn = dn
+        self.position = dn.split(',', 1)[1] if dn else DEFAULT_POSITIONS[udm_module.name]
+        self.props = Props(udm_module.name, props or {})
+        self.options = ['default']
+        self.policies = []
+        self.superordinate = superordinate
+
+    def save(self):
+        values = self.props._values()
+        identifier = values.get(self._udm_module.meta.identifying_property)
+        if not identifier:
+            raise exceptions.CreateError('The property {0} is required'.format(
+                self._udm_module.meta.identifying_property))
+        naming_attribute = MODULES[self._udm_module.name][self._udm_module.meta.identifying_property]
+        dn = '{0}={1},{2}'.format(naming_attribute, identifier, self.position)
+        if self.dn is None:
+            if dn in DIRECTORY.objects:
+                raise exceptions.CreateError('Object exists: {0}'.format(dn))
+            STATS['add'] += 1
+        else:
+            STATS['modify'] += 1
+            if dn != self.dn:
+                DIRECTORY.drop(self.dn)
+        self.dn = dn
+        DIRECTORY.put(dn, self._udm_module.name, values)
+        return self
+
+    def delete(self, remove_childs=False):
+        with DIRECTORY.lock:
+            if self.dn not in DIRECTORY.objects:
+                raise exceptions.NoObject(self.dn)
+            suffix = ',' + self.dn.lower()
+            children = [dn for dn in DIRECTORY.objects if dn.lower().endswith(suffix)]
+            if children and not remove_childs:
+                raise exceptions.UdmError('Operation not allowed on non-leaf: {0}'.format(self.dn))
+            for dn in sorted(children, key=len, reverse=True) + [self.dn]:
+                STATS['remove'] += 1
+                DIRECTORY.drop(dn)
+
+
+class Meta(object):
+
+    def __init__(self, name):
+        self.identifying_property = next(iter(MODULES[name]))
+
+
+class Handler(object):
+    '''The UDM handler behind a module with the descriptions of its properties'''
+
+    def __init__(self, name):
+        self.property_descriptions = dict(
+            (prop, udm_property(SYNTAXES.get(prop, syntax.string), prop in MULTIVALUE)) for prop in MODULES[name])
+
+
+class UdmModule(object):
+
+    def __init__(self, connection, name):
+        self.connection = connection
+        self.name = name
+        self.meta = Meta(name)
+        self._orig_udm_module = Handler(name)
+
+    def new(self, superordinate=None):
+        return UdmObject(self, superordinate=superordinate)
+
+    def get(self, dn):
+        STATS['get'] += 1
+        if dn not in DIRECTORY.objects or DIRECTORY.objects[dn][0] != self.name:
+            raise exceptions.NoObject(dn)
+        return UdmObject(self, dn, DIRECTORY.objects[dn][1])
+
+    def get_by_id(self, id):
+        attribute = MODULES[self.name][self.meta.identifying_property]
+        objects = list(self.search('({0}={1})'.format(attribute, id)))
+        if not objects:
+            raise exceptions.NoObject(id)
+        if len(objects) > 1:
+            raise exceptions.MultipleObjects(id)
+        return objects[0]
+
+    def search(self, filter_s='', base='', scope='sub'):
+        STATS['search'] += 1
+        node = parse_filter(filter_s) if filter_s else None
+        candidates = _candidates(node) if node else None
+        dns = list(DIRECTORY.objects) if candidates is None else sorted(candidates)
+        base = base.lower()
+        for dn in dns:
+            module, props = DIRECTORY.objects[dn]
+            if module != self.name or (base and not dn.lower().endswith(base)):
+                continue
+            if scope == 'base' and dn.lower() != base or scope == 'one' and dn.lower().split(',', 1)[1] != base:
+                continue
+            if node is None or _matches(node, module, props):
+                yield UdmObject(self, dn, props)
+
+
+def _depth(dn):
+    return len(re.split(r'(?<!\\),', dn))
+
+
+class Access(object):
+    '''The LDAP connection behind UDM, univention.admin.uldap.access'''
+
+    def searchDn(self, filter='(objectClass=*)', base='', scope='sub', unique=False, required=False, timeout=-1,
+                 sizelimit=0, serverctrls=None, response=None):
+        STATS['search'] += 1
+        base = base.lower()
+        with DIRECTORY.lock:
+            dns = [dn for dn in DIRECTORY.objects
+                   if not base or dn.lower() == base or dn.lower().endswith(',' + base)]
+        if base and base != BASE.lower() and base not in (dn.lower() for dn in dns):
+            raise uexceptions.noObject(base)
+        if scope == 'base':
+            dns = [dn for dn in dns if dn.lower() == base]
+        elif scope == 'one':
+            dns = [dn for dn in dns if _depth(dn) == _depth(base) + 1]
+        pages = [ctrl for ctrl in serverctrls or [] if ctrl.controlType == SimplePagedResultsControl.controlType]
+        if not pages:
+            return dns
+        offset = int(pages[0].cookie or 0)
+        if response is not None:
+            cookie = str(offset + pages[0].size) if offset + pages[0].size < len(dns) else ''
+            response['ctrls'] = [SimplePagedResultsControl(True, size=pages[0].size, cookie=cookie)]
+        return dns[offset:offset + pages[0].size]
+
+    def delete(self, dn):
+        with DIRECTORY.lock:
+            if dn not in DIRECTORY.objects:
+                raise exceptions.NoObject(dn)
+            STATS['remove'] += 1
+            DIRECTORY.drop(dn)
+
+
+class UDM(object):
+
+    def __init__(self):
+        self.api_version = None
+        self.connection = Access()
+
+    @classmethod
+    def admin(cls):
+        return cls()
+
+    @classmethod
+    def machine(cls):
+        return cls()
+
+    def version(self, api_version):
+        self.api_version = api_version
+        return self
+
+    def get(self, name):
+        if name not in MODULES:
+            raise exceptions.UnknownModuleType(name)
+        return UdmModule(self, name)
+
+    def obj_by_dn(self, dn):
+        if dn not in DIRECTORY.objects:
+            raise exceptions.NoObject(dn)
+        return self.get(DIRECTORY.objects[dn][0]).get(dn)
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2023, Univention GmbH
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""The exceptions of univention.udm raised by the stand-in."""
+
+
+class UdmError(Exception):
+    pass
+
+
+class ConnectionError(UdmError):
+    pass
+
+
+class UnknownModuleType(UdmError):
+    pass
+
+
+class NoObject(UdmError):
+    pass
+
+
+class MultipleObjects(UdmError):
+    pass
+
+
+class UnknownProperty(UdmError):
+    pass
+
+
+class CreateError(UdmError):
+    pass
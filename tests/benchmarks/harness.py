@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2023, Univention GmbH
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""Run module code in-process against the fakes and measure it.
+
+Modules are run with their arguments set like ansible's unit tests do,
+exit_json() and fail_json() raise ModuleExit instead of exiting. Every
+subprocess started and every fork is counted, the fakes count their LDAP
+operations and CLI calls themselves.
+"""
+
+import collections
+import copy
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(os.path.dirname(HERE))
+FAKES = os.path.join(HERE, 'fakes')
+COLLECTION = 'ansible_collections.univention.ucs_modules'
+
+COUNTS = collections.Counter()
+# commands with an absolute path the modules run, mapped to the stubs
+REDIRECTS = {
+    '/usr/sbin/univention-config-registry': os.path.join(FAKES, 'bin', 'univention-config-registry'),
+}
+
+
+class ModuleExit(Exception):
+
+    def __init__(self, result, failed=False):
+        super(ModuleExit, self).__init__(result.get('msg') or result.get('message'))
+        self.result = result
+        self.failed = failed
+
+
+def setup_paths(fakes=True):
+    '''Make the collection importable and put the fakes in front of the real UCS libraries,
+    return the directories added to sys.path'''
+    parts = ROOT.split(os.sep)
+    if len(parts) > 3 and parts[-3] == 'ansible_collections':
+        collections_path = os.sep.join(parts[:-3])
+    else:
+        collections_path = tempfile.mkdtemp(prefix='ucs-bench-collections-')
+        os.makedirs(os.path.join(collections_path, 'ansible_collections', 'univention'))
+        os.symlink(ROOT, os.path.join(collections_path, 'ansible_collections', 'univention', 'ucs_modules'))
+    paths = [FAKES, collections_path] if fakes else [collections_path]
+    sys.path[:0] = paths
+    if fakes:
+        os.environ['PATH'] = os.pathsep.join([os.path.join(FAKES, 'bin'), os.environ.get('PATH', '')])
+    return paths
+
+
+def install_counters():
+    '''Count every subprocess and fork of the code under test'''
+    from ansible.module_utils import basic
+
+    popen = subprocess.Popen
+
+    class CountingPopen(popen):
+        def __init__(self, args, *posargs, **kwargs):
+            COUNTS['subprocess'] += 1
+            if isinstance(args, (list, tuple)) and args and args[0] in REDIRECTS:
+                args = [REDIRECTS[args[0]]] + list(args[1:])
+            super(CountingPopen, self).__init__(args, *posargs, **kwargs)
+
+    subprocess.Popen = CountingPopen
+    fork = os.fork
+
+    def counting_fork():
+        COUNTS['fork'] += 1
+        return fork()
+
+    os.fork = counting_fork
+
+    def exit_json(self, **kwargs):
+        raise ModuleExit(kwargs)
+
+    def fail_json(self, **kwargs):
+        raise ModuleExit(kwargs, failed=True)
+
+    basic.AnsibleModule.exit_json = exit_json
+    basic.AnsibleModule.fail_json = fail_json
+
+
+def set_module_args(args):
+    from ansible.module_utils import basic
+    from ansible.module_utils.common.text.converters import to_bytes
+    basic._ANSIBLE_ARGS = to_bytes(json.dumps({'ANSIBLE_MODULE_ARGS': args}))
+    if hasattr(basic, '_ANSIBLE_PROFILE'):
+        # ansible-core 2.19 and later need the serialization profile as well
+        basic._ANSIBLE_PROFILE = 'legacy'
+
+
+def make_module(argument_spec, args, check_mode=False):
+    '''Return an AnsibleModule with the given arguments, to call module functions directly'''
+    from ansible.module_utils.basic import AnsibleModule
+    set_module_args(dict(args, _ansible_check_mode=check_mode))
+    return AnsibleModule(argument_spec=argument_spec, supports_check_mode=True)
+
+
+def run_module(main, args, check_mode=False):
+    '''Run the entry point of a module and return its result'''
+    set_module_args(dict(args, _ansible_check_mode=check_mode))
+    try:
+        main()
+    except ModuleExit as e:
+        if e.failed:
+            raise
+        return e.result
+    raise RuntimeError('The module did not exit')
+
+
+def cli_calls():
+    '''Return the number of calls of the CLI stubs so far'''
+    try:
+        with open(os.environ['UCS_BENCH_CALLS']) as calls:
+            return sum(1 for line in calls)
+    except (IOError, OSError):
+        return 0
+
+
+def import_collection(name):
+    return __import__('{0}.{1}'.format(COLLECTION, name), fromlist=['*'])
+
+
+class ModuleState(object):
+    '''The module-level state of Python modules, restored before every run
+
+    In production every task runs in a fresh process, so caches kept in
+    globals must not carry over from one benchmark run to the next. Classes
+    can be given as well, for their class attributes.
+    '''
+
+    def __init__(self, *modules):
+        self.snapshots = []
+        for module in modules:
+            # copied as a whole, so values referring to each other keep doing so
+            state = copy.deepcopy(dict(
+                (name, value) for name, value in vars(module).items()
+                if not name.startswith('__') and isinstance(value, (list, dict, set, bool, type(None)))))
+            self.snapshots.append((module, state))
+
+    def restore(self):
+        for module, state in self.snapshots:
+            for name, value in copy.deepcopy(state).items():
+                setattr(module, name, value)
+        profile = import_collection('plugins.module_utils.profile')
+        profile.timer.__init__()
+
+
+class Scenario(object):
+    '''An operation measured repeatedly
+
+    setup(i) runs untimed before every operation op(i), counters() returns
+    the counters of the fakes to include in the report.
+    '''
+
+    def __init__(self, name, target, op, setup=None, counters=None):
+        self.name = name
+        self.target = target
+        self.op = op
+        self.setup = setup
+        self.counters = counters or (lambda: {})
+
+
+def _counters(scenario):
+    counters = dict(COUNTS)
+    counters.update(scenario.counters())
+    return counters
+
+
+def measure(scenario, iterations):
+    '''Return ops/sec, peak memory and the counters per operation of a scenario'''
+    before = _counters(scenario)
+    elapsed = 0.0
+    for index in range(iterations):
+        if scenario.setup:
+            scenario.setup(index)
+        started = time.perf_counter()
+        scenario.op(index)
+        elapsed += time.perf_counter() - started
+    after = _counters(scenario)
+    per_op = dict(
+        (name, round(float(after.get(name, 0) - before.get(name, 0)) / iterations, 2))
+        for name in sorted(set(after) | set(before)))
+
+    # memory is traced in a run of its own, tracing slows everything down
+    if scenario.setup:
+        scenario.setup(iterations)
+    tracemalloc.start()
+    try:
+        scenario.op(iterations)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return collections.OrderedDict([
+        ('scenario', scenario.name),
+        ('target', scenario.target),
+        ('iterations', iterations),
+        ('ops_per_sec', round(iterations / elapsed, 2) if elapsed else None),
+        ('ms_per_op', round(elapsed * 1000 / iterations, 3)),
+        ('peak_kib', round(peak / 1024.0, 1)),
+        ('per_op', per_op),
+    ])
+
+
+def format_table(results, baseline=None):
+    '''Return the results as text table, compared to the baseline results if given'''
+    baseline = dict((result['scenario'], result) for result in baseline or [])
+    counter_names = sorted(set(name for result in results for name in result['per_op']))
+    header = ['scenario', 'ops/s', 'ms/op', 'peak KiB'] + counter_names
+    rows = []
+    for result in results:
+        old = baseline.get(result['scenario'])
+        ops = '{0:.1f}'.format(result['ops_per_sec'] or 0)
+        if old and old.get('ops_per_sec'):
+            ops += ' ({0:+.0%})'.format(result['ops_per_sec'] / old['ops_per_sec'] - 1)
+        row = [result['scenario'], ops, '{0:.3f}'.format(result['ms_per_op']), '{0:.1f}'.format(result['peak_kib'])]
+        for name in counter_names:
+            value = result['per_op'].get(name, 0)
+            cell = '{0:g}'.format(value)
+            if old and old['per_op'].get(name, 0) != value:
+                cell += ' (was {0:g})'.format(old['per_op'].get(name, 0))
+            row.append(cell)
+        rows.append(row)
+    widths = [max(len(str(row[column])) for row in [header] + rows) for column in range(len(header))]
+    lines = ['  '.join(str(cell).ljust(width) for cell, width in zip(row, widths)) for row in [header] + rows]
+    lines.insert(1, '  '.join('-' * width for width in widths))
+    return '\n'.join(lines)
@@ -0,0 +1,85 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2023, Univention GmbH
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""Measure the start-up cost of the modules, paid by every task.
+
+Imports every module in fresh interpreters and reports the median import
+time, the number of modules loaded and which heavy libraries were pulled in
+by the import alone. Uses the fakes of UCS by default, run it with --real
+on a UCS system to measure the real libraries.
+
+    python3 tests/benchmarks/import_time.py --repeat 20
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+import harness
+
+MODULES = (
+    'univention_config_registry',
+    'univention_directory_manager',
+    'univention_app',
+    'univention_app_info',
+)
+# libraries only some code paths of the modules need
+HEAVY = ('univention.', 'multiprocessing', 'distutils', 'yaml')
+
+CODE = '''
+import json, sys, time
+started = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - started
+heavy = sorted(name for name in sys.modules if name.startswith({heavy!r}) and sys.modules[name] is not None)
+print(json.dumps(dict(seconds=seconds, modules=len(sys.modules), heavy=heavy)))
+'''
+
+
+def measure(module, repeat, env):
+    samples = []
+    for _ in range(repeat):
+        out = subprocess.check_output(
+            [sys.executable, '-c', CODE.format(module=module, heavy=HEAVY)], env=env, universal_newlines=True)
+        samples.append(json.loads(out))
+    return dict(
+        module=module.rsplit('.', 1)[-1],
+        ms=round(statistics.median(sample['seconds'] for sample in samples) * 1000, 2),
+        modules=samples[-1]['modules'],
+        heavy=sorted(set(name.split('.')[0] if not name.startswith('univention.') else '.'.join(name.split('.')[:2])
+                         for name in samples[-1]['heavy'])),
+    )
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--repeat', type=int, default=10, help='imports per module (default: %(default)s)')
+    parser.add_argument('--real', action='store_true', help='import the real UCS libraries instead of the fakes')
+    parser.add_argument('--json', metavar='FILE', help='write the results as JSON to FILE')
+    options = parser.parse_args(argv)
+
+    paths = harness.setup_paths(fakes=not options.real)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(paths + [os.environ.get('PYTHONPATH', '')]))
+    results = [measure('ansible.module_utils.basic', options.repeat, env)]
+    results += [measure('{0}.plugins.modules.{1}'.format(harness.COLLECTION, module), options.repeat, env)
+                for module in MODULES]
+
+    width = max(len(result['module']) for result in results)
+    print('{0}  {1:>8}  {2:>7}  {3}'.format('module'.ljust(width), 'ms', 'modules', 'heavy imports'))
+    for result in results:
+        print('{0}  {1:>8.2f}  {2:>7}  {3}'.format(
+            result['module'].ljust(width), result['ms'], result['modules'], ', '.join(result['heavy']) or '-'))
+    if options.json:
+        with open(options.json, 'w') as json_file:
+            json.dump(results, json_file, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2023, Univention GmbH
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""Benchmark the modules offline against in-memory stand-ins of UCS.
+
+Runs UDMAnsibleModule.run against a synthetic directory, _set_keys,
+_unset_keys and _commit_files against a registry with thousands of keys and
+univention_app.main against a stub of univention-app. Reports operations per
+second, peak memory and the subprocesses, forks, LDAP operations and CLI
+calls per operation. Needs ansible-core, but no UCS system.
+
+    python3 tests/benchmarks/run.py --objects 100000 --json results.json
+    python3 tests/benchmarks/run.py --baseline results.json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import harness
+
+SUITES = ('udm', 'ucr', 'app')
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--objects', type=int, default=10000,
+                        help='number of users in the synthetic directory (default: %(default)s)')
+    parser.add_argument('--keys', type=int, default=5000,
+                        help='number of keys in the registry, at least 100 (default: %(default)s)')
+    parser.add_argument('--iterations', type=int, default=50,
+                        help='operations measured per scenario (default: %(default)s)')
+    parser.add_argument('--suite', action='append', choices=SUITES,
+                        help='only run the given suites, can be repeated')
+    parser.add_argument('--scenario', action='append', default=[],
+                        help='only run scenarios whose name starts with this, can be repeated')
+    parser.add_argument('--json', metavar='FILE', help='write the results as JSON to FILE')
+    parser.add_argument('--baseline', metavar='FILE', help='compare with the JSON results in FILE')
+    options = parser.parse_args(argv)
+    if options.keys < 100:
+        parser.error('--keys must be at least 100')
+    return options
+
+
+def main(argv):
+    options = parse_args(argv)
+    harness.setup_paths()
+    harness.install_counters()
+
+    bench_dir = tempfile.mkdtemp(prefix='ucs-bench-')
+    os.environ.update(
+        UCS_BENCH_DIR=bench_dir,
+        UCS_BENCH_UCR=os.path.join(bench_dir, 'ucr.json'),
+        UCS_BENCH_APPS=os.path.join(bench_dir, 'apps.json'),
+        UCS_BENCH_CALLS=os.path.join(bench_dir, 'calls.log'),
+    )
+    try:
+        import univention.udm
+        from univention.config_registry import backend
+        univention.udm.populate(users=options.objects)
+        backend.populate(keys=options.keys)
+
+        results = []
+        for suite in options.suite or SUITES:
+            module = __import__('bench_{0}'.format(suite))
+            for scenario in module.scenarios(options):
+                if options.scenario and not scenario.name.startswith(tuple(options.scenario)):
+                    continue
+                results.append(harness.measure(scenario, options.iterations))
+                sys.stderr.write('{0}: {1} ops/s\n'.format(scenario.name, results[-1]['ops_per_sec']))
+    finally:
+        shutil.rmtree(bench_dir, ignore_errors=True)
+
+    baseline = None
+    if options.baseline:
+        with open(options.baseline) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+    print(harness.format_table(results, baseline))
+
+    if options.json:
+        with open(options.json, 'w') as json_file:
+            json.dump(dict(objects=options.objects, keys=options.keys, results=results), json_file, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2023, Univention GmbH
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""A stand-in for the computers/computer search of the UDM REST API.
+
+Serves a synthetic domain with the number of computers given as first
+argument on the port given as second argument. Requests need basic auth
+as Administrator:univention. /stats returns the number of searches.
+"""
+
+import base64
+import json
+import sys
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from urllib.parse import parse_qs, urlencode, urlparse
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from urllib import urlencode
+    from urlparse import parse_qs, urlparse
+
+BASE = 'dc=example,dc=org'
+ROLES = ('domaincontroller_master', 'domaincontroller_backup', 'domaincontroller_slave', 'memberserver', 'windows')
+AUTH = 'Basic ' + base64.b64encode(b'Administrator:univention').decode('ascii')
+STATS = dict(searches=0, pages=0)
+
+
+def computers(count):
+    for index in range(count):
+        role = ROLES[index % len(ROLES)] if index else ROLES[0]
+        ou = 'school{0}'.format(index % 3)
+        name = 'host{0}'.format(index)
+        dn = 'cn={0},cn=computers,ou={1},{2}'.format(name, ou, BASE)
+        yield dict(
+            dn=dn,
+            objectType='computers/{0}'.format(role),
+            position='cn=computers,ou={0},{1}'.format(ou, BASE),
+            properties=dict(
+                name=name,
+                domain='example.org',
+                ip=['10.0.{0}.{1}'.format(index // 250, index % 250 + 1)],
+                mac=[],
+                description='synthetic computer {0}'.format(index),
+                operatingSystem='Univention Corporate Server',
+                operatingSystemVersion='5.0-4',
+                service=[],
+                groups=['cn=Computers {0},cn=groups,{1}'.format(ou, BASE)],
+            ),
+        )
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/stats':
+            return self._send(200, STATS)
+        if self.headers.get('Authorization') != AUTH:
+            return self._send(401, dict(error='authentication required'))
+        if url.path.rstrip('/') != '/univention/udm/computers/computer':
+            return self._send(404, dict(error='not found'))
+        query = parse_qs(url.query)
+        limit = int(query.get('limit', ['100'])[0])
+        page = int(query.get('page', ['1'])[0])
+        if page == 1:
+            STATS['searches'] += 1
+        STATS['pages'] += 1
+        objects = self.server.computers[(page - 1) * limit:page * limit]
+        links = {}
+        if page * limit < len(self.server.computers):
+            query['page'] = [str(page + 1)]
+            links['next'] = [dict(href='?' + urlencode(sorted(query.items()), doseq=True))]
+        self._send(200, {'_embedded': {'udm:object': objects}, '_links': links})
+
+    def log_message(self, *args):
+        pass
+
+
+if __name__ == '__main__':
+    server = HTTPServer(('127.0.0.1', int(sys.argv[2]) if len(sys.argv) > 2 else 8765), Handler)
+    server.computers = list(computers(int(sys.argv[1]) if len(sys.argv) > 1 else 1000))
+    server.serve_forever()
@@ -0,0 +1,96 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# Copyright: (c) 2023, Univention GmbH
+
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""A stand-in for the UMC ucr/get command and the UDM REST API user search.
+
+Serves a few UCR variables and the users alice and bob on the port given as
+first argument. UMC logins and UDM requests need Administrator:univention.
+/stats returns the number of logins, ucr/get commands and user searches.
+"""
+
+import base64
+import json
+import re
+import sys
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from urllib.parse import parse_qs, urlparse
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from urlparse import parse_qs, urlparse
+
+BASE = 'dc=example,dc=org'
+SESSION = 'standin-session'
+AUTH = 'Basic ' + base64.b64encode(b'Administrator:univention').decode('ascii')
+UCR = {'ldap/base': BASE, 'domainname': 'example.org', 'server/role': 'domaincontroller_master'}
+USERS = dict(
+    (name, dict(
+        dn='uid={0},cn=users,{1}'.format(name, BASE),
+        objectType='users/user',
+        position='cn=users,{0}'.format(BASE),
+        properties=dict(username=name, mailPrimaryAddress='{0}@example.org'.format(name), lastname=name.title()),
+    )) for name in ('alice', 'bob'))
+STATS = dict(logins=0, ucr_get=0, searches=0)
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    def _send(self, status, body, headers=()):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/stats':
+            return self._send(200, STATS)
+        if self.headers.get('Authorization') != AUTH:
+            return self._send(401, dict(error='authentication required'))
+        if url.path.rstrip('/') != '/univention/udm/users/user':
+            return self._send(404, dict(error='not found'))
+        STATS['searches'] += 1
+        query = parse_qs(url.query)
+        names = re.findall(r'\(uid=([^)]*)\)', query.get('filter', [''])[0])
+        properties = query.get('properties')
+        objects = []
+        for name in names:
+            if name in USERS:
+                obj = dict(USERS[name])
+                if properties:
+                    obj['properties'] = dict(
+                        (key, value) for key, value in obj['properties'].items() if key in properties)
+                objects.append(obj)
+        self._send(200, {'_embedded': {'udm:object': objects}, '_links': {}})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        options = body.get('options')
+        if self.path == '/univention/auth':
+            if options != dict(username='Administrator', password='univention'):
+                return self._send(401, dict(message='login failed'))
+            STATS['logins'] += 1
+            return self._send(200, dict(status=200), [('Set-Cookie', 'UMCSessionId={0}; Path=/'.format(SESSION))])
+        if SESSION not in (self.headers.get('Cookie') or '') or self.headers.get('X-Xsrf-Protection') != SESSION:
+            return self._send(401, dict(message='not logged in'))
+        if self.path != '/univention/command/ucr/get':
+            return self._send(404, dict(message='not found'))
+        STATS['ucr_get'] += 1
+        result = [dict(key=key, value=UCR[key]) for key in options if key in UCR]
+        self._send(200, dict(status=200, result=result))
+
+    def log_message(self, *args):
+        pass
+
+
+if __name__ == '__main__':
+    server = HTTPServer(('127.0.0.1', int(sys.argv[1]) if len(sys.argv) > 1 else 8766), Handler)
+    server.serve_forever()